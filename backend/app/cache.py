@@ -0,0 +1,187 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+import asyncio
+import logging
+import pickle
+
+from .metrics import registry, Counter
+
+# Frames, fills and stats computed from the logs of a (watch, cycle). Entries are keyed by the
+# cycle version from LogRecordManager.get_cycle_version, so a write made by any worker makes the
+# old entries unreachable; the local invalidation on writes only frees them early.
+
+logger = logging.getLogger(__name__)
+
+cache_requests = registry.register(Counter(
+    'frame_cache_requests_total', 'Frame cache lookups by result.', ('result',)
+))
+
+
+class WeightedLRU:
+
+    def __init__(self, max_weight: int):
+        self.max_weight = max_weight
+        self.weight = 0
+        self._entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: str, value: Any, weight: int):
+        self.pop(key)
+        if weight > self.max_weight:
+            return
+        self._entries[key] = (value, weight)
+        self.weight += weight
+        while self.weight > self.max_weight:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.weight -= evicted
+
+    def pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[1]
+
+    def pop_prefix(self, prefix: str) -> int:
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+
+class CacheBackend(ABC):
+
+    @abstractmethod
+    async def get(self, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, weight: int):
+        ...
+
+    @abstractmethod
+    async def invalidate(self, prefix: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class LocalCacheBackend(CacheBackend):
+
+    def __init__(self, max_weight: int):
+        self.lru = WeightedLRU(max_weight)
+
+    async def get(self, key: str) -> Any | None:
+        return self.lru.get(key)
+
+    async def set(self, key: str, value: Any, weight: int):
+        self.lru.set(key, value, weight)
+
+    async def invalidate(self, prefix: str):
+        self.lru.pop_prefix(prefix)
+
+
+class RemoteCacheBackend(CacheBackend):
+    # Client of scripts/cache_server.py, shared by all workers. Values are pickled, so the
+    # server must only be reachable by the backend. Errors are logged and count as misses.
+
+    def __init__(self, host: str, port: int, timeout: float = 1):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def _request(self, line: str, payload: bytes = b'') -> bytes:
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout
+                    )
+                self._writer.write(line.encode() + b'\n' + payload)
+                await self._writer.drain()
+                size = int(await asyncio.wait_for(self._reader.readline(), self.timeout))
+                if size < 0:
+                    return b''
+                return await asyncio.wait_for(self._reader.readexactly(size), self.timeout)
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                await self._disconnect()
+                raise
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def get(self, key: str) -> Any | None:
+        try:
+            data = await self._request(f'GET {key}')
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.warning('Cache server get failed: %r', e)
+            return None
+        return pickle.loads(data) if data else None
+
+    async def set(self, key: str, value: Any, weight: int):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            await self._request(f'SET {key} {len(data)}', data)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.warning('Cache server set failed: %r', e)
+
+    async def invalidate(self, prefix: str):
+        try:
+            await self._request(f'DEL {prefix}')
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            logger.warning('Cache server invalidate failed: %r', e)
+
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+
+
+class FrameCache:
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    @staticmethod
+    def _prefix(watch_id: int, cycle: int) -> str:
+        return f'{watch_id}:{cycle}:'
+
+    @classmethod
+    def key(cls, watch_id: int, cycle: int, version: tuple, kind: str) -> str:
+        return cls._prefix(watch_id, cycle) + ','.join(map(str, version)) + ':' + kind
+
+    async def get(self, watch_id: int, cycle: int, version: tuple, kind: str) -> Any | None:
+        value = await self.backend.get(self.key(watch_id, cycle, version, kind))
+        cache_requests.labels('miss' if value is None else 'hit').inc()
+        return value
+
+    async def set(self, watch_id: int, cycle: int, version: tuple, kind: str, value: Any, weight: int):
+        await self.backend.set(self.key(watch_id, cycle, version, kind), value, weight)
+
+    async def invalidate(self, watch_id: int, cycle: int):
+        await self.backend.invalidate(self._prefix(watch_id, cycle))
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_frame_cache(url: str, max_rows: int) -> FrameCache:
+    # url is empty for a cache in this process or host:port of scripts/cache_server.py
+    if not url:
+        return FrameCache(LocalCacheBackend(max_rows))
+    host, _, port = url.rpartition(':')
+    return FrameCache(RemoteCacheBackend(host, int(port)))
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import Self, Optional
 from abc import ABC, abstractmethod
+from bisect import bisect_right
 
 
 class InterpolationAbstract(ABC):
@@ -14,8 +15,13 @@ class InterpolationAbstract(ABC):
     def __call__(self, x: float) -> float:
         ...
 
+    def evaluate(self, xs: list[float]) -> list[float]:
+        return [self(x) for x in xs]
+
 
 class QubicSplineInterpolation(InterpolationAbstract):
+    # Natural cubic spline, the second derivatives z come from the tridiagonal system solved
+    # with the Thomas algorithm. Outside of the data the first and last pieces are extended.
 
     def __init__(self):
         self.t: list[float] = []
@@ -23,6 +29,7 @@ class QubicSplineInterpolation(InterpolationAbstract):
         self.z: list[float] = []
         self.h: list[float] = []
         self.n: int = 0
+        self.coefficients: list[tuple[float, float, float]] = []
 
     @classmethod
     def calculate(cls, data: list[tuple[float, float]]) -> Self:
@@ -32,37 +39,57 @@ class QubicSplineInterpolation(InterpolationAbstract):
 
         out.t = [i for i, _ in data]
         out.y = [j for _, j in data]
-        out.z = [0] * size
-        out.h = [0] * size
-
-        b = [0] * size
-        u = [0] * size
-        v = [0] * size
-
-        for i in range(0, out.n):
-            out.h[i] = out.t[i + 1] - out.t[i]
-            b[i] = 6 * (out.y[i + 1] - out.y[i]) / out.h[i]
-        u[1] = 2 * (out.h[0] + out.h[1])
-        v[1] = b[1] - b[0]
-        for i in range(2, out.n):
-            u[i] = 2 * (out.h[i - 1] + out.h[i]) - pow(out.h[i - 1], 2) / u[i - 1]
-            v[i] = b[i] - b[i - 1] - out.h[i - 1] * v[i - 1] / u[i - 1]
-        out.z[out.n] = 0
-        for i in range(out.n - 1, 0, -1):
-            out.z[i] = (v[i] - out.h[i] * out.z[i + 1]) / u[i]
-        out.z[0] = 0
+        out.z = [0.0] * size
+        out.h = [out.t[i + 1] - out.t[i] for i in range(out.n)]
+
+        if out.n >= 2:
+            slopes = [(out.y[i + 1] - out.y[i]) / out.h[i] for i in range(out.n)]
+            # forward sweep over the interior points 1..n-1
+            diagonal = [0.0] * size
+            rhs = [0.0] * size
+            diagonal[1] = 2 * (out.h[0] + out.h[1])
+            rhs[1] = 6 * (slopes[1] - slopes[0])
+            for i in range(2, out.n):
+                factor = out.h[i - 1] / diagonal[i - 1]
+                diagonal[i] = 2 * (out.h[i - 1] + out.h[i]) - factor * out.h[i - 1]
+                rhs[i] = 6 * (slopes[i] - slopes[i - 1]) - factor * rhs[i - 1]
+            for i in range(out.n - 1, 0, -1):
+                out.z[i] = (rhs[i] - out.h[i] * out.z[i + 1]) / diagonal[i]
+
+        # y(x) = y[i] + dx * (c + dx * (b + dx * a)) with dx = x - t[i]
+        out.coefficients = [(
+            (out.z[i + 1] - out.z[i]) / (6 * out.h[i]),
+            out.z[i] / 2,
+            (out.y[i + 1] - out.y[i]) / out.h[i] - out.h[i] * (out.z[i + 1] + 2 * out.z[i]) / 6
+        ) for i in range(out.n)]
 
         return out
 
-    def __call__(self, x: float) -> float:
-        i = self.n
-        while i >= 1 and x - self.t[i] < 0:
-            i -= 1
+    def _piece(self, x: float, lo: int = 0) -> int:
+        return min(max(bisect_right(self.t, x, lo) - 1, 0), self.n - 1)
+
+    def _value(self, i: int, x: float) -> float:
+        a, b, c = self.coefficients[i]
+        dx = x - self.t[i]
+        return self.y[i] + dx * (c + dx * (b + dx * a))
 
-        ai = (1 / (6 * self.h[i])) * (self.z[i + 1] - self.z[i])
-        bi = self.z[i] / 2
-        ci = (-self.h[i] / 6) * (self.z[i + 1] + 2 * self.z[i]) + (1 / self.h[i]) * (self.y[i + 1] - self.y[i])
-        return self.y[i] + (x - self.t[i]) * (ci + (x - self.t[i]) * (bi + (x - self.t[i]) * ai))
+    def __call__(self, x: float) -> float:
+        if self.n == 0:
+            return self.y[0]
+        return self._value(self._piece(x), x)
+
+    def evaluate(self, xs: list[float]) -> list[float]:
+        if self.n == 0:
+            return [self.y[0]] * len(xs)
+        # ascending xs (the usual fill) continue the search from the previous piece
+        out = []
+        i = 0
+        previous = float('-inf')
+        for x in xs:
+            i = self._piece(x, i if x >= previous else 0)
+            previous = x
+            out.append(self._value(i, x))
+        return out
 
 
 class LinearInterpolation(InterpolationAbstract):
@@ -93,9 +120,22 @@ class LinearInterpolation(InterpolationAbstract):
         return out
 
     def __call__(self, x: float) -> float:
-        i = self.n
-        while i >= 0 and x < self.x[i]:
-            i -= 1
-
-        a, b = self.lines[i + 1]
+        a, b = self.lines[bisect_right(self.x, x)]
         return a * x + b
+
+    def evaluate(self, xs: list[float]) -> list[float]:
+        out = []
+        i = 0
+        previous = float('-inf')
+        for x in xs:
+            i = bisect_right(self.x, x, i if x >= previous else 0)
+            previous = x
+            a, b = self.lines[i]
+            out.append(a * x + b)
+        return out
+
+
+interpolation_methods: dict[str, type[InterpolationAbstract]] = {
+    'linear': LinearInterpolation,
+    'spline': QubicSplineInterpolation,
+}
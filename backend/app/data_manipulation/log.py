@@ -2,43 +2,123 @@ from __future__ import annotations
 from typing import Any
 
 import datetime as dt
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import pairwise
 from math import sqrt
+from statistics import median
 
 from .interpolation import InterpolationAbstract
 
+seconds_in_hour = 60 * 60
+seconds_in_day = 24 * seconds_in_hour
+seconds_in_week = 7 * seconds_in_day
 
-class Record(dict):
+
+@lru_cache(maxsize=64)
+def _join_keys(keys: tuple[str, ...], more: tuple[str, ...]) -> tuple[str, ...]:
+    # the names of the extra fields are shared between records built the same way
+    return keys + tuple(key for key in more if key not in keys)
+
+
+@lru_cache(maxsize=64)
+def _row_layout(headers: tuple[str, ...]) -> tuple[int, int, tuple[str, ...], tuple[int, ...]]:
+    if 'datetime' not in headers or 'measure' not in headers:
+        raise ValueError("Headers must contain 'datetime' and 'measure'.")
+    indexes = tuple(i for i, header in enumerate(headers) if header not in ('datetime', 'measure'))
+    return headers.index('datetime'), headers.index('measure'), tuple(headers[i] for i in indexes), indexes
+
+
+class Record:
+    # Immutable, the timestamp is kept both as a datetime and as seconds since s_date. Fields
+    # besides datetime and measure are stored as a shared tuple of names and a tuple of values.
+    __slots__ = 'datetime', 'measure', 'time_as_float', '_keys', '_values'
     s_date = dt.datetime(dt.MINYEAR, 1, 1, tzinfo=dt.timezone.utc)
 
     def __init__(self, datetime: dt.datetime | float, measure: float, **other):
         if isinstance(datetime, (float, int)):
+            time = float(datetime)
             datetime = self.s_date + dt.timedelta(seconds=datetime)
-        super().__init__({'datetime': datetime, 'measure': measure, **other})
+        else:
+            time = (datetime - self.s_date).total_seconds()
+        self._set(datetime, measure, time, _join_keys((), tuple(other)), tuple(other.values()))
+
+    def _set(self, datetime: dt.datetime, measure: float, time: float, keys: tuple[str, ...], values: tuple):
+        setter = object.__setattr__
+        setter(self, 'datetime', datetime)
+        setter(self, 'measure', measure)
+        setter(self, 'time_as_float', time)
+        setter(self, '_keys', keys)
+        setter(self, '_values', values)
 
     @classmethod
     def from_row(cls, headers: tuple[str, ...], row: tuple[Any, ...]) -> Record:
-        if 'datetime' not in headers or 'measure' not in headers:
-            raise ValueError("Headers must contain 'datetime' and 'measure'.")
-        return cls(**{header: value for header, value in zip(headers, row)})
+        datetime_index, measure_index, keys, indexes = _row_layout(headers)
+        datetime = row[datetime_index]
+        out = object.__new__(cls)
+        out._set(datetime, row[measure_index], (datetime - cls.s_date).total_seconds(), keys,
+                 tuple(row[i] for i in indexes))
+        return out
 
-    @property
-    def datetime(self) -> dt.datetime:
-        return self['datetime']
+    def with_other(self, **other) -> Record:
+        # a copy with more fields, the timestamp is not recomputed
+        keys = _join_keys(self._keys, tuple(other))
+        if len(keys) == len(self._keys) + len(other):
+            values = self._values + tuple(other.values())
+        else:
+            values = tuple(other[key] if key in other else value for key, value in zip(self._keys, self._values))
+            values += tuple(other[key] for key in keys[len(self._keys):])
+        out = object.__new__(self.__class__)
+        out._set(self.datetime, self.measure, self.time_as_float, keys, values)
+        return out
 
-    @property
-    def measure(self) -> float:
-        return self['measure']
+    def with_measure(self, measure: float) -> Record:
+        out = object.__new__(self.__class__)
+        out._set(self.datetime, measure, self.time_as_float, self._keys, self._values)
+        return out
 
     @property
     def other(self) -> dict[str, Any]:
-        return {k: v for k, v in self.items() if k not in ('datetime', 'measure')}
+        return dict(zip(self._keys, self._values))
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'datetime':
+            return self.datetime
+        if key == 'measure':
+            return self.measure
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setattr__(self, key: str, value: Any):
+        raise AttributeError(f"{self.__class__.__name__} is immutable.")
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Record):
+            return NotImplemented
+        return (self.datetime, self.measure, self.other) == (other.datetime, other.measure, other.other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return _restore_record, (self.__class__, self.datetime, self.measure, self.time_as_float, self.other)
 
     def __repr__(self):
         return f"{self.__class__.__name__}(time={repr(self.datetime)}, measure={self.measure}, **{self.other})"
 
-    @property
-    def time_as_float(self) -> float:
-        return (self.datetime - self.s_date).total_seconds()
+
+def _restore_record(cls: type[Record], datetime: dt.datetime, measure: float, time: float,
+                    other: dict[str, Any]) -> Record:
+    out = object.__new__(cls)
+    out._set(datetime, measure, time, _join_keys((), tuple(other)), tuple(other.values()))
+    return out
 
 
 class WatchLogFrame:
@@ -46,7 +126,7 @@ class WatchLogFrame:
     __slots__ = 'data'
 
     def __init__(self, data: list[Record]):
-        assert list(sorted(data, key=lambda x: x.datetime)) == data
+        assert all(a.time_as_float <= b.time_as_float for a, b in pairwise(data))
         self.data: list[Record] = data.copy()
 
     @classmethod
@@ -62,15 +142,26 @@ class WatchLogFrame:
         previous = self.data[index - 1]
         return round(current.measure - previous.measure, 1)
 
-    def get_log_with_dif(self) -> WatchLogFrame:
+    def get_log_with_dif(self, per_day: bool = False) -> WatchLogFrame:
+        # per_day scales the differences to a change over one day, for records not a day apart
+        if not per_day:
+            return self.__class__([entry.with_other(difference=self.difference(i)) for i, entry in enumerate(self.data)])
         table = []
-        for i, entry in enumerate(self.data):
-            table.append(Record(**entry, difference=self.difference(i)))
+        previous = None
+        for entry in self.data:
+            difference = None
+            if previous is not None and entry.time_as_float > previous.time_as_float:
+                elapsed = entry.time_as_float - previous.time_as_float
+                difference = round((entry.measure - previous.measure) * seconds_in_day / elapsed, 1)
+            table.append(entry.with_other(difference=difference))
+            previous = entry
         return self.__class__(table)
 
-    def fill(self, interpolation_method: type[InterpolationAbstract]) -> WatchLogFrame:
-        seconds_in_day = 24 * 60 * 60
-
+    def fill(self,
+             interpolation_method: type[InterpolationAbstract],
+             step: int = seconds_in_day,
+             digits: int | None = 1) -> WatchLogFrame:
+        # digits None keeps the interpolated measures unrounded, for differences computed before rounding
         data = [(record.time_as_float, record.measure) for record in self.data]
         if len(self.data) == 0:
             return self.__class__([])
@@ -79,12 +170,65 @@ class WatchLogFrame:
         start = int(self.data[0].time_as_float)
         end = int(self.data[-1].time_as_float)
 
-        table = []
-        for time in range(start, end + 1, seconds_in_day):
-            table.append(Record(datetime=time, measure=round(f(time), 1)))
+        times = range(start, end + 1, step)
+        measures = f.evaluate(times)
+        if digits is not None:
+            measures = (round(measure, digits) for measure in measures)
+        table = [Record(datetime=time, measure=measure) for time, measure in zip(times, measures)]
 
         return self.__class__(table)
 
+    def rounded(self, digits: int = 1) -> WatchLogFrame:
+        return self.__class__([entry.with_measure(round(entry.measure, digits)) for entry in self.data])
+
+    def downsample_lttb(self, max_points: int) -> WatchLogFrame:
+        # Largest-Triangle-Three-Buckets: keeps the first and last record and from every bucket
+        # the one spanning the largest triangle with the previous pick and the next bucket's mean
+        size = len(self.data)
+        if max_points < 3 or size <= max_points:
+            return self.__class__(self.data)
+
+        points = [(record.time_as_float, record.measure) for record in self.data]
+        buckets = max_points - 2
+        bound = lambda bucket: 1 + bucket * (size - 2) // buckets
+        picked = [0]
+        a = 0
+        for bucket in range(buckets):
+            start, end = bound(bucket), bound(bucket + 1)
+            next_start, next_end = end, min(bound(bucket + 2), size)
+            count = next_end - next_start
+            mean_x = sum(x for x, _ in points[next_start:next_end]) / count
+            mean_y = sum(y for _, y in points[next_start:next_end]) / count
+
+            ax, ay = points[a]
+            best, best_area = start, -1.0
+            for i in range(start, end):
+                x, y = points[i]
+                area = abs((ax - mean_x) * (y - ay) - (ax - x) * (mean_y - ay))
+                if area > best_area:
+                    best, best_area = i, area
+            picked.append(best)
+            a = best
+        picked.append(size - 1)
+        return self.__class__([self.data[i] for i in picked])
+
+    def downsample_minmax(self, max_points: int) -> WatchLogFrame:
+        # keeps the first and last record and the lowest and highest measure of every bucket
+        size = len(self.data)
+        if max_points < 4 or size <= max_points:
+            return self.__class__(self.data)
+
+        buckets = (max_points - 2) // 2
+        bound = lambda bucket: 1 + bucket * (size - 2) // buckets
+        picked = [0]
+        for bucket in range(buckets):
+            indexes = range(bound(bucket), bound(bucket + 1))
+            low = min(indexes, key=lambda i: self.data[i].measure)
+            high = max(indexes, key=lambda i: self.data[i].measure)
+            picked.extend(sorted({low, high}))
+        picked.append(size - 1)
+        return self.__class__([self.data[i] for i in picked])
+
     @property
     def average(self) -> float:
         data = [self.difference(i) for i in range(1, len(self.data))]
@@ -100,3 +244,98 @@ class WatchLogFrame:
     def delta(self) -> float:
         data = [self.difference(i) for i in range(1, len(self.data))]
         return round(max(data) - min(data), 2)
+
+    def flag_outliers(self, window: int = 5, threshold: float = 3.5, min_deviation: float = 1.0) -> WatchLogFrame:
+        # Hampel filter over the offset of every log from the line through its neighbours (the two
+        # next or previous ones at the ends). A wrong sign or a minute typo makes its log the largest
+        # offset around, its neighbours get about half of it and are not flagged.
+        size = len(self.data)
+        if size < 3:
+            return self.__class__([entry.with_other(suspect=False) for entry in self.data])
+        times = [record.time_as_float for record in self.data]
+        measures = [record.measure for record in self.data]
+
+        offsets = []
+        for k in range(size):
+            a, b = (1, 2) if k == 0 else (size - 3, size - 2) if k == size - 1 else (k - 1, k + 1)
+            if times[a] == times[b]:
+                predicted = (measures[a] + measures[b]) / 2
+            else:
+                predicted = measures[a] + (measures[b] - measures[a]) * (times[k] - times[a]) / (times[b] - times[a])
+            offsets.append(measures[k] - predicted)
+
+        table = []
+        for k, entry in enumerate(self.data):
+            around = offsets[max(k - window, 0):k + window + 1]
+            center = median(around)
+            scale = max(1.4826 * median(abs(x - center) for x in around), min_deviation)
+            largest = all(abs(offsets[k]) >= abs(offsets[j]) for j in (k - 1, k + 1) if 0 <= j < size)
+            table.append(entry.with_other(suspect=largest and abs(offsets[k] - center) / scale > threshold))
+        return self.__class__(table)
+
+    def exclude_outliers(self, **kwargs) -> WatchLogFrame:
+        return self.__class__([record for record in self.flag_outliers(**kwargs).data if not record['suspect']])
+
+    def _difference_sums(self) -> tuple[list[float], list[float], list[float]]:
+        # differences and their running sums and sums of squares, sums[i] covers differences 1..i
+        data = [0.0] + [self.difference(i) for i in range(1, len(self.data))]
+        sums = [0.0] * len(data)
+        squares = [0.0] * len(data)
+        for i in range(1, len(data)):
+            sums[i] = sums[i - 1] + data[i]
+            squares[i] = squares[i - 1] + data[i] * data[i]
+        return data, sums, squares
+
+    @staticmethod
+    def _mean_deviation(count: int, total: float, square_total: float) -> tuple[float, float]:
+        mean = total / count
+        return round(mean, 2), round(sqrt(max(square_total / count - mean * mean, 0.0)), 2)
+
+    def rolling(self, window: int) -> WatchLogFrame:
+        # mean and deviation of the last `window` differences, from the first record with a full window
+        _, sums, squares = self._difference_sums()
+        table = []
+        for i in range(window, len(self.data)):
+            average, deviation = self._mean_deviation(
+                window, sums[i] - sums[i - window], squares[i] - squares[i - window]
+            )
+            table.append(Record(datetime=self.data[i].datetime, measure=average, deviation=deviation))
+        return self.__class__(table)
+
+    def segment_stats(self,
+                      ranges: list[tuple[dt.datetime, dt.datetime]]
+    ) -> list[tuple[int, float | None, float | None, float | None]]:
+        # (differences, average, deviation, delta) of the records inside every [start, end] range
+        data, sums, squares = self._difference_sums()
+        times = [record.datetime for record in self.data]
+        out = []
+        for start, end in ranges:
+            first = bisect_left(times, start)
+            last = bisect_right(times, end) - 1
+            count = last - first
+            if count < 1:
+                out.append((0, None, None, None))
+                continue
+            average, deviation = self._mean_deviation(
+                count, sums[last] - sums[first], squares[last] - squares[first]
+            )
+            segment = data[first + 1:last + 1]
+            out.append((count, average, deviation, round(max(segment) - min(segment), 2)))
+        return out
+
+    def stats(self) -> tuple[float | None, float | None, float | None]:
+        # average, standard_deviation and delta computing the differences once
+        data = [self.difference(i) for i in range(1, len(self.data))]
+        if not data:
+            return None, None, None
+        avg = round(sum(data) / len(data), 2)
+        return (
+            avg,
+            round(sqrt(sum((x - avg)**2 for x in data) / len(data)), 2),
+            round(max(data) - min(data), 2)
+        )
+
+
+fill_steps = {'hourly': seconds_in_hour, 'daily': seconds_in_day, 'weekly': seconds_in_week}
+
+downsampling_methods = {'lttb': WatchLogFrame.downsample_lttb, 'minmax': WatchLogFrame.downsample_minmax}
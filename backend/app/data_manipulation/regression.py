@@ -0,0 +1,127 @@
+from __future__ import annotations
+from math import sqrt
+from statistics import median
+import random
+
+from .log import seconds_in_day
+
+# two-sided 95% quantiles of Student's t for 1..30 degrees of freedom
+_t_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)
+_z_975 = 1.959964
+
+
+def t_critical_95(degrees_of_freedom: int) -> float:
+    if degrees_of_freedom <= len(_t_95):
+        return _t_95[degrees_of_freedom - 1]
+    # Cornish-Fisher expansion around the normal quantile
+    z, v = _z_975, degrees_of_freedom
+    return (z + (z ** 3 + z) / (4 * v) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * v ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * v ** 3))
+
+
+class LinearFit:
+    # measure = intercept + slope * (time - origin), times in seconds; rates in seconds per day
+    __slots__ = 'count', 'origin', 'slope', 'intercept', 'slope_error', 'residual_deviation', 'residual_max', \
+        'r_squared'
+
+    def __init__(self, count: int, origin: float, slope: float, intercept: float, slope_error: float | None,
+                 residual_deviation: float, residual_max: float, r_squared: float | None):
+        self.count = count
+        self.origin = origin
+        self.slope = slope
+        self.intercept = intercept
+        self.slope_error = slope_error
+        self.residual_deviation = residual_deviation
+        self.residual_max = residual_max
+        self.r_squared = r_squared
+
+    @property
+    def rate(self) -> float:
+        return self.slope * seconds_in_day
+
+    @property
+    def rate_interval(self) -> tuple[float, float] | None:
+        if self.slope_error is None:
+            return None
+        margin = t_critical_95(self.count - 2) * self.slope_error * seconds_in_day
+        return self.rate - margin, self.rate + margin
+
+
+def _residuals(points: list[tuple[float, float]], origin: float, slope: float, intercept: float) -> tuple[float, float]:
+    square_sum = 0.0
+    largest = 0.0
+    for x, y in points:
+        residual = y - intercept - slope * (x - origin)
+        square_sum += residual * residual
+        largest = max(largest, abs(residual))
+    return square_sum, largest
+
+
+def least_squares(points: list[tuple[float, float]]) -> LinearFit | None:
+    # Welford style running means and co-moments, times are large (seconds since year 1) so
+    # summing raw squares would lose all precision
+    count = len(points)
+    if count < 2:
+        return None
+    origin = points[0][0]
+    mean_x = mean_y = sxx = sxy = syy = 0.0
+    for n, (x, y) in enumerate(points, start=1):
+        x -= origin
+        dx = x - mean_x
+        dy = y - mean_y
+        mean_x += dx / n
+        mean_y += dy / n
+        sxx += dx * (x - mean_x)
+        sxy += dx * (y - mean_y)
+        syy += dy * (y - mean_y)
+    if sxx == 0:
+        return None
+
+    slope = sxy / sxx
+    intercept = mean_y - slope * mean_x
+    square_sum, largest = _residuals(points, origin, slope, intercept)
+    slope_error = sqrt(square_sum / (count - 2) / sxx) if count > 2 else None
+    return LinearFit(
+        count=count,
+        origin=origin,
+        slope=slope,
+        intercept=intercept,
+        slope_error=slope_error,
+        residual_deviation=sqrt(square_sum / count),
+        residual_max=largest,
+        r_squared=1 - square_sum / syy if syy > 0 else None
+    )
+
+
+def theil_sen(points: list[tuple[float, float]], max_pairs: int = 200_000, seed: int = 0) -> LinearFit | None:
+    # median of the pairwise slopes, large cycles use a fixed random sample of the pairs
+    count = len(points)
+    if count < 2:
+        return None
+    origin = points[0][0]
+    if count * (count - 1) // 2 <= max_pairs:
+        pairs = ((points[i], points[j]) for i in range(count) for j in range(i + 1, count))
+    else:
+        rng = random.Random(seed)
+        pairs = ((points[i], points[j]) for i, j in (sorted(rng.sample(range(count), 2)) for _ in range(max_pairs)))
+    slopes = [(y2 - y1) / (x2 - x1) for (x1, y1), (x2, y2) in pairs if x2 != x1]
+    if not slopes:
+        return None
+
+    slope = median(slopes)
+    intercept = median(y - slope * (x - origin) for x, y in points)
+    square_sum, largest = _residuals(points, origin, slope, intercept)
+    return LinearFit(
+        count=count,
+        origin=origin,
+        slope=slope,
+        intercept=intercept,
+        slope_error=None,
+        residual_deviation=sqrt(square_sum / count),
+        residual_max=largest,
+        r_squared=None
+    )
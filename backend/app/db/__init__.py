@@ -1,19 +1,29 @@
 from pathlib import Path
 
-from .access import DBAccess, DBContext, DBWrapper, db_initiate
+from .access import DBAccess, DBContext, DBWrapper, db_initiate, db_migrate, get_schema_version
 from .exceptions import ORMError, OperationError, ConstraintError
+from .idempotency import IdempotencyRecord, DeleteIdempotencyKeysDaemonCreator
+from .instrumentation import InstrumentedCursor, QueryStats, QueryStatsMiddleware, capture_request_stats
+from .revocations import RevocationRecord, NewRevocation
 from .users import UserRecord, TokenRecord, NewUser, ExistingUser, NewToken, ExistingToken, DeleteTokenDaemonCreator
-from .watches import WatchRecord, WatchRecordManager, LogRecordManager, LogRecord, NewWatch, ExistingWatch, NewLog, ExistingLog
+from .watches import (WatchRecord, WatchRecordManager, LogRecordManager, LogRecord, NewWatch, ExistingWatch, NewLog,
+                      ExistingLog, ArchiveLogsDaemonCreator, LogWriteListener)
 
 
 schema_root = (Path(__file__).parent / 'schema').resolve()
-schema_files = schema_root / 'user.sql', schema_root / 'watch.sql'
+# migrations in the order they are applied, changes to the schema go into a new file at the end
+schema_files = (schema_root / 'user.sql', schema_root / 'watch.sql', schema_root / 'idempotency.sql',
+                schema_root / 'revocation.sql', schema_root / 'session_token_expiration.sql',
+                schema_root / 'log_revision.sql')
 
 __all__ = (
-    'schema_root', 'schema_files', 'db_initiate',
+    'schema_root', 'schema_files', 'db_initiate', 'db_migrate', 'get_schema_version',
     'DBAccess', 'DBContext', 'DBWrapper',
     'ORMError', 'ConstraintError', 'OperationError',
+    'InstrumentedCursor', 'QueryStats', 'QueryStatsMiddleware', 'capture_request_stats',
     'UserRecord', 'TokenRecord', 'NewUser', 'ExistingUser', 'NewToken', 'ExistingToken', 'DeleteTokenDaemonCreator',
     'WatchRecordManager', 'LogRecordManager',
-    'WatchRecord', 'LogRecord', 'NewWatch', 'ExistingWatch', 'NewLog', 'ExistingLog'
+    'WatchRecord', 'LogRecord', 'NewWatch', 'ExistingWatch', 'NewLog', 'ExistingLog', 'ArchiveLogsDaemonCreator',
+    'LogWriteListener', 'IdempotencyRecord', 'DeleteIdempotencyKeysDaemonCreator',
+    'RevocationRecord', 'NewRevocation'
 )
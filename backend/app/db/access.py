@@ -1,47 +1,119 @@
+from contextlib import suppress
 from pathlib import Path
+import asyncio
+import time
 
 from mysql.connector.aio import connect, MySQLConnection
 from mysql.connector.aio.cursor import MySQLCursor
+from mysql.connector import Error, errorcode
+
+from .exceptions import OperationError
+from .instrumentation import InstrumentedCursor, count_round_trip
+from ..metrics import db_connections_open, db_connections_in_use, db_connections_opened
 
 
 class DBWrapper:
 
-    def __init__(self, db: MySQLConnection, cursor: MySQLCursor):
+    def __init__(self, db: MySQLConnection, cursor: MySQLCursor, slow_query_seconds: float | None = None):
         self.db: MySQLConnection = db
-        self._cursor: MySQLCursor = cursor
+        self._cursor = InstrumentedCursor(cursor, slow_query_seconds)
 
     @property
     def cursor(self) -> MySQLCursor:
         return self._cursor
 
     async def commit(self):
+        count_round_trip()
         await self.db.commit()
 
     async def rollback(self):
+        count_round_trip()
         await self.db.rollback()
 
 
 class DBContext:
 
-    def __init__(self, db_credentials: dict):
-        self.db_credentials = db_credentials
+    def __init__(self, db_access: 'DBAccess'):
+        self.db_access = db_access
 
     async def __aenter__(self) -> DBWrapper:
-        self.conn = await connect(**self.db_credentials)
+        self.conn = await self.db_access.acquire()
         self.cursor = await self.conn.cursor()
-        return DBWrapper(self.conn, self.cursor)
+        return DBWrapper(self.conn, self.cursor, self.db_access.slow_query_seconds)
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         await self.cursor.close()
-        await self.conn.close()
+        await self.db_access.release(self.conn)
         if exc_type:
             raise exc_value.with_traceback(traceback)
 
 
 class DBAccess:
+    # Connections idle for longer than this are pinged before being handed out again.
+    idle_check_seconds = 30
 
-    def __init__(self, db_credentials: dict):
+    def __init__(self, db_credentials: dict, pool_size: int = 0, slow_query_seconds: float | None = None):
         self.credentials = db_credentials
+        self.pool_size = pool_size
+        self.slow_query_seconds = slow_query_seconds
+        self._idle: list[tuple[MySQLConnection, float]] = []
+        self._slots: asyncio.Semaphore | None = None
+
+    async def _connect(self) -> MySQLConnection:
+        conn = await connect(**self.credentials)
+        db_connections_opened.inc()
+        db_connections_open.inc()
+        return conn
+
+    @staticmethod
+    async def _close(conn: MySQLConnection):
+        db_connections_open.dec()
+        await conn.close()
+
+    async def acquire(self) -> MySQLConnection:
+        if self.pool_size <= 0:
+            conn = await self._connect()
+            db_connections_in_use.inc()
+            return conn
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        await self._slots.acquire()
+        try:
+            conn = None
+            while self._idle and conn is None:
+                candidate, released = self._idle.pop()
+                if time.monotonic() - released < self.idle_check_seconds or await candidate.is_connected():
+                    conn = candidate
+                else:
+                    db_connections_open.dec()
+            if conn is None:
+                conn = await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        db_connections_in_use.inc()
+        return conn
+
+    async def release(self, conn: MySQLConnection):
+        db_connections_in_use.dec()
+        if self.pool_size <= 0:
+            await self._close(conn)
+            return
+        try:
+            # uncommitted work must not leak into the next user of the connection
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.append((conn, time.monotonic()))
+        except Exception:
+            with suppress(Exception):
+                await self._close(conn)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        while self._idle:
+            conn, _ = self._idle.pop()
+            await self._close(conn)
 
     async def run_sql(self, sql_script: str):
         async with self.access() as wp:
@@ -56,9 +128,61 @@ class DBAccess:
         await self.run_sql(sql_script)
 
     def access(self) -> DBContext:
-        return DBContext(self.credentials)
+        return DBContext(self)
 
 
 async def db_initiate(db_access: DBAccess, *schema_files: Path):
     for file in schema_files:
         await db_access.run_sql_file(file)
+
+
+schema_lock_name = 'watch_schema_migration'
+
+
+async def get_schema_version(cursor: MySQLCursor) -> int:
+    try:
+        await cursor.execute("SELECT MAX(version) FROM schema_version")
+    except Error as e:
+        if e.errno == errorcode.ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    (version,) = await cursor.fetchone()
+    return version or 0
+
+
+async def db_migrate(db_access: DBAccess, *schema_files: Path, lock_timeout: int = 60) -> int:
+    # schema_files are migrations in order, the version is the number of files applied
+    async with db_access.access() as wp:
+        version = await get_schema_version(wp.cursor)
+        if version >= len(schema_files):
+            await wp.rollback()
+            return version
+
+        await wp.cursor.execute("SELECT GET_LOCK(%s, %s)", (schema_lock_name, lock_timeout))
+        (locked,) = await wp.cursor.fetchone()
+        if locked != 1:
+            raise OperationError(f"Could not acquire the '{schema_lock_name}' lock.")
+        try:
+            # another worker might have migrated while this one waited for the lock, the rollback
+            # ends the snapshot of the first read so that the read below sees its migrations
+            await wp.rollback()
+            version = await get_schema_version(wp.cursor)
+            await wp.cursor.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INT PRIMARY KEY, applied DATETIME NOT NULL)"
+            )
+            for number, file in enumerate(schema_files[version:], start=version + 1):
+                with open(file) as f:
+                    sql_script = f.read()
+                for statement in sql_script.split(';'):
+                    if statement.strip():
+                        await wp.cursor.execute(statement)
+                await wp.cursor.execute(
+                    "INSERT INTO schema_version (version, applied) VALUES (%s, UTC_TIMESTAMP())",
+                    (number,)
+                )
+                await wp.commit()
+                version = number
+        finally:
+            await wp.cursor.execute("SELECT RELEASE_LOCK(%s)", (schema_lock_name,))
+            await wp.cursor.fetchone()
+    return version
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, NoReturn
+import asyncio
+import hashlib
+import json
+import logging
+
+from mysql.connector.aio.cursor import MySQLCursor
+from mysql.connector import IntegrityError
+
+from .access import DBAccess
+from .exceptions import OperationError, ConstraintError
+from .users import UserRecord
+from ..metrics import timed, db_query_latency
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode()).digest()[:16]
+
+
+class IdempotencyRecord:
+    # The key is reserved in the transaction of the write it guards, before the write is done. A
+    # duplicate sent meanwhile waits on the row lock and finds the stored response once the first
+    # request commits; when the first request fails its rollback frees the key for a retry.
+
+    def __init__(self, user: UserRecord, key: str | None, request: str, ttl: timedelta = timedelta(days=1)):
+        self.user_id = user.data.user_id
+        self.key = None if key is None else _digest(key)
+        # the same key sent with another request is an error, not a duplicate
+        self.request = _digest(request)
+        self.ttl = ttl
+
+    @timed(db_query_latency)
+    async def reserve(self, cursor: MySQLCursor) -> dict[str, Any] | None:
+        # returns the stored response of an earlier request with the key, None when the write has to be done
+        if self.key is None:
+            return None
+        now = datetime.now(timezone.utc)
+        try:
+            await cursor.execute(
+                "INSERT INTO idempotency_key (user_id, key_hash, request_hash, expiration) VALUES (%s, %s, %s, %s)",
+                (self.user_id, self.key, self.request, now + self.ttl)
+            )
+            return None
+        except IntegrityError:
+            pass
+
+        await cursor.execute(
+            "SELECT request_hash, response, expiration FROM idempotency_key "
+            "WHERE user_id = %s AND key_hash = %s FOR UPDATE",
+            (self.user_id, self.key)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            raise OperationError()
+        request, response, expiration = row
+        if expiration.replace(tzinfo=timezone.utc) < now:
+            # an expired key is taken over by the new request
+            await cursor.execute(
+                "UPDATE idempotency_key SET request_hash = %s, response = NULL, expiration = %s "
+                "WHERE user_id = %s AND key_hash = %s",
+                (self.request, now + self.ttl, self.user_id, self.key)
+            )
+            return None
+        if bytes(request) != self.request:
+            raise ConstraintError()
+        if response is None:
+            raise OperationError()
+        return json.loads(response)
+
+    @timed(db_query_latency)
+    async def save(self, cursor: MySQLCursor, response: dict[str, Any]):
+        if self.key is None:
+            return
+        await cursor.execute(
+            "UPDATE idempotency_key SET response = %s WHERE user_id = %s AND key_hash = %s",
+            (json.dumps(response, separators=(',', ':')), self.user_id, self.key)
+        )
+
+
+class DeleteIdempotencyKeysDaemonCreator:
+    # expired keys are taken over by reserve anyway, this only keeps the table small
+    lock_name = 'watch_delete_idempotency_daemon'
+
+    def __init__(self, db_access: DBAccess, interval_minutes: int, batch_size: int = 1000):
+        self.access = db_access
+        self.interval = interval_minutes * 60
+        self.batch_size = batch_size
+
+    async def delete_expired(self) -> int | None:
+        async with self.access.access() as wp:
+            await wp.cursor.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name,))
+            (locked,) = await wp.cursor.fetchone()
+            if locked != 1:
+                return None
+            try:
+                now = datetime.now(timezone.utc)
+                deleted = 0
+                while True:
+                    await wp.cursor.execute(
+                        'DELETE FROM idempotency_key WHERE expiration < %s ORDER BY expiration LIMIT %s',
+                        (now, self.batch_size)
+                    )
+                    batch = wp.cursor.rowcount
+                    await wp.commit()
+                    deleted += batch
+                    if batch < self.batch_size:
+                        break
+                    await asyncio.sleep(0)
+            finally:
+                await wp.cursor.execute("SELECT RELEASE_LOCK(%s)", (self.lock_name,))
+                await wp.cursor.fetchone()
+        logger.info('Deleted %d expired idempotency keys.', deleted)
+        return deleted
+
+    async def daemon(self) -> NoReturn:
+        while True:
+            try:
+                await self.delete_expired()
+            except Exception:
+                # expired keys are never replayed, leaving some until the next pass does no harm
+                logger.exception('Deleting expired idempotency keys failed.')
+            await asyncio.sleep(self.interval)
+
+    async def __call__(self) -> NoReturn:
+        await self.daemon()
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Callable, Iterator
+import logging
+import re
+
+from mysql.connector.aio.cursor import MySQLCursor
+
+from ..metrics import registry, Histogram
+
+slow_query_logger = logging.getLogger('app.db.slow')
+
+statement_latency = registry.register(Histogram(
+    'db_statement_duration_seconds', 'Time spent executing a SQL statement, by fingerprint.', ('statement',)
+))
+request_round_trips = registry.register(Histogram(
+    'db_round_trips_per_request', 'Database round-trips made while handling one request.',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+))
+
+
+class QueryRecord:
+    __slots__ = 'fingerprint', 'duration', 'rows'
+
+    def __init__(self, fingerprint: str, duration: float, rows: int):
+        self.fingerprint = fingerprint
+        self.duration = duration
+        self.rows = rows
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.fingerprint!r}, duration={self.duration:.6f}, rows={self.rows})"
+
+
+class QueryStats:
+
+    def __init__(self):
+        self.queries: list[QueryRecord] = []
+        self.round_trips: int = 0
+
+    @property
+    def duration(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+    @property
+    def rows(self) -> int:
+        return sum(query.rows for query in self.queries)
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar('current_query_stats', default=None)
+_listeners: list[Callable[[str, QueryStats], None]] = []
+
+_literals = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_whitespace = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=512)
+def fingerprint(statement: str) -> str:
+    statement = _literals.sub('?', statement.replace('%s', '?'))
+    statement = _in_lists.sub('(?+)', statement)
+    return _whitespace.sub(' ', statement).strip()
+
+
+def count_round_trip():
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.round_trips += 1
+
+
+class InstrumentedCursor:
+    # Wraps the cursor handed out by DBWrapper, the record managers use it like a MySQLCursor.
+
+    def __init__(self, cursor: MySQLCursor, slow_query_seconds: float | None = None):
+        self._cursor = cursor
+        self.slow_query_seconds = slow_query_seconds
+        self._last: QueryRecord | None = None
+
+    def _record(self, operation: str, duration: float):
+        statement = fingerprint(operation)
+        rows = max(self._cursor.rowcount, 0)
+        self._last = QueryRecord(statement, duration, rows)
+        statement_latency.labels(statement).observe(duration)
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.queries.append(self._last)
+            stats.round_trips += 1
+        if self.slow_query_seconds is not None and duration >= self.slow_query_seconds:
+            slow_query_logger.warning('%.3fs rows=%d %s', duration, rows, statement)
+
+    async def execute(self, operation: str, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return await self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            self._record(operation, perf_counter() - start)
+
+    async def executemany(self, operation: str, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return await self._cursor.executemany(operation, *args, **kwargs)
+        finally:
+            self._record(operation, perf_counter() - start)
+
+    async def fetchone(self) -> tuple | None:
+        row = await self._cursor.fetchone()
+        if self._last is not None and row is not None:
+            self._last.rows = max(self._last.rows, 1)
+        return row
+
+    async def fetchall(self) -> list[tuple]:
+        rows = await self._cursor.fetchall()
+        if self._last is not None:
+            self._last.rows = len(rows)
+        return rows
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> int | None:
+        return self._cursor.lastrowid
+
+    async def close(self) -> bool:
+        return await self._cursor.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+@contextmanager
+def capture_request_stats() -> Iterator[list[tuple[str, QueryStats]]]:
+    # collects (route, stats) of every request finished while active, meant for tests
+    captured: list[tuple[str, QueryStats]] = []
+    listener = lambda route, stats: captured.append((route, stats))
+    _listeners.append(listener)
+    try:
+        yield captured
+    finally:
+        _listeners.remove(listener)
+
+
+class QueryStatsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_stats.reset(token)
+            request_round_trips.observe(stats.round_trips)
+            route = scope.get('route')
+            path = route.path if route is not None else scope['path']
+            for listener in _listeners:
+                listener(path, stats)
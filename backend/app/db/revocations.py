@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from typing import Self
+
+from pydantic import BaseModel
+from mysql.connector.aio.cursor import MySQLCursor
+from mysql.connector import Error
+
+from .exceptions import OperationError, ConstraintError
+from ..metrics import timed, db_query_latency
+
+
+class NewRevocation(BaseModel):
+    user_id: int
+    # None revokes every session of the user started before revoked_at
+    session: bytes | None
+    revoked_at: datetime
+    expiration: datetime
+
+
+class RevocationRecord:
+    # Revoked signed tokens. There is no foreign key to users, the revocation of a deleted user
+    # has to outlive the user.
+
+    def __init__(self, row: NewRevocation):
+        self.data = row
+
+    @classmethod
+    @timed(db_query_latency)
+    async def new_revocation(cls, cursor: MySQLCursor, revocation: NewRevocation) -> Self:
+        try:
+            await cursor.execute(
+                "INSERT INTO token_revocation (user_id, session, revoked_at, expiration) VALUES (%s, %s, %s, %s)",
+                (revocation.user_id, revocation.session, revocation.revoked_at, revocation.expiration)
+            )
+        except Error as e:
+            raise ConstraintError() from e
+        if cursor.rowcount != 1:
+            raise OperationError()
+        return cls(revocation)
+
+    @classmethod
+    @timed(db_query_latency)
+    async def get_revocations(cls, cursor: MySQLCursor, now: datetime, since: datetime | None = None) -> list[Self]:
+        # revocations in force at now, only the ones made since 'since' when given
+        if since is None:
+            await cursor.execute(
+                "SELECT user_id, session, revoked_at, expiration FROM token_revocation WHERE expiration > %s",
+                (now,)
+            )
+        else:
+            await cursor.execute(
+                "SELECT user_id, session, revoked_at, expiration FROM token_revocation "
+                "WHERE revoked_at >= %s AND expiration > %s",
+                (since, now)
+            )
+        return [
+            cls(NewRevocation(
+                user_id=user_id,
+                session=None if session is None else bytes(session),
+                revoked_at=revoked_at.replace(tzinfo=timezone.utc),
+                expiration=expiration.replace(tzinfo=timezone.utc)
+            )) for user_id, session, revoked_at, expiration in await cursor.fetchall()
+        ]
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS idempotency_key
+(
+    user_id      INT        NOT NULL,
+    key_hash     BINARY(16) NOT NULL,
+    request_hash BINARY(16) NOT NULL,
+    response     BLOB,
+    expiration   DATETIME   NOT NULL,
+    PRIMARY KEY (user_id, key_hash),
+    INDEX (expiration),
+    FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+);
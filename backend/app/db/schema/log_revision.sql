@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS log_revision
+(
+    watch_id INT NOT NULL,
+    cycle    INT NOT NULL,
+    revision INT NOT NULL,
+    PRIMARY KEY (watch_id, cycle),
+    FOREIGN KEY (watch_id) REFERENCES watch (watch_id) ON DELETE CASCADE
+);
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS token_revocation
+(
+    revocation_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id       INT        NOT NULL,
+    session       BINARY(16),
+    revoked_at    DATETIME   NOT NULL,
+    expiration    DATETIME   NOT NULL,
+    INDEX (revoked_at),
+    INDEX (expiration)
+);
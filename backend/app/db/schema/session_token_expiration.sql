@@ -0,0 +1 @@
+ALTER TABLE session_token ADD INDEX session_token_expiration (expiration);
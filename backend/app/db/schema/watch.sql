@@ -17,3 +17,17 @@ CREATE TABLE IF NOT EXISTS log
     measure  FLOAT    NOT NULL,
     FOREIGN KEY (watch_id) REFERENCES watch (watch_id) ON DELETE CASCADE
 );
+
+CREATE TABLE IF NOT EXISTS log_archive
+(
+    watch_id  INT        NOT NULL,
+    cycle     INT        NOT NULL,
+    log_count INT        NOT NULL,
+    first_log DATETIME   NOT NULL,
+    last_log  DATETIME   NOT NULL,
+    log_ids   MEDIUMBLOB NOT NULL,
+    timedates MEDIUMBLOB NOT NULL,
+    measures  MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (watch_id, cycle),
+    FOREIGN KEY (watch_id) REFERENCES watch (watch_id) ON DELETE CASCADE
+);
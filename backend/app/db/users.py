@@ -1,6 +1,7 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Self, NoReturn
 import asyncio
+import logging
 
 from pydantic import BaseModel
 from mysql.connector.aio.cursor import MySQLCursor
@@ -8,6 +9,9 @@ from mysql.connector import Error
 
 from .access import DBAccess
 from .exceptions import OperationError, ConstraintError
+from ..metrics import timed, db_query_latency
+
+logger = logging.getLogger(__name__)
 
 
 class NewUser(BaseModel):
@@ -29,6 +33,7 @@ class UserRecord:
     def check_integrity(self) -> bool:
         return self.data.user_id == self._initial_user_id
 
+    @timed(db_query_latency)
     async def update(self, cursor: MySQLCursor) -> int:
         if not self.check_integrity():
             raise RuntimeError
@@ -41,6 +46,7 @@ class UserRecord:
             raise ConstraintError from e
         return cursor.rowcount
 
+    @timed(db_query_latency)
     async def delete(self, cursor: MySQLCursor):
         if not self.check_integrity():
             raise RuntimeError
@@ -55,6 +61,7 @@ class UserRecord:
             raise OperationError()
 
     @classmethod
+    @timed(db_query_latency)
     async def get_user_by_id(cls, cursor: MySQLCursor, user_id: int) -> Self:
         await cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
         row = await cursor.fetchone()
@@ -69,6 +76,7 @@ class UserRecord:
         return cls(user)
 
     @classmethod
+    @timed(db_query_latency)
     async def get_user_by_name(cls, cursor: MySQLCursor, user_name: str) -> Self:
         await cursor.execute("SELECT * FROM users WHERE user_name = %s", (user_name,))
         row = await cursor.fetchone()
@@ -83,6 +91,7 @@ class UserRecord:
         return cls(user)
 
     @classmethod
+    @timed(db_query_latency)
     async def new_user(cls, cursor: MySQLCursor, user: NewUser) -> Self:
         try:
             await cursor.execute(
@@ -115,6 +124,7 @@ class TokenRecord:
     def check_integrity(self) -> bool:
         return self._initial_ids == (self.data.user_id, self.data.token_id)
 
+    @timed(db_query_latency)
     async def update(self, cursor: MySQLCursor) -> int:
         if not self.check_integrity():
             raise RuntimeError
@@ -127,6 +137,7 @@ class TokenRecord:
             raise ConstraintError() from e
         return cursor.rowcount
 
+    @timed(db_query_latency)
     async def delete(self, cursor: MySQLCursor):
         if not self.check_integrity():
             raise RuntimeError
@@ -141,6 +152,7 @@ class TokenRecord:
             raise OperationError()
 
     @classmethod
+    @timed(db_query_latency)
     async def get_token_by_id(cls, cursor: MySQLCursor, token_id: int) -> Self:
         await cursor.execute("SELECT * FROM session_token WHERE token_id = %s", (token_id,))
         row = await cursor.fetchone()
@@ -155,6 +167,7 @@ class TokenRecord:
         return cls(token)
 
     @classmethod
+    @timed(db_query_latency)
     async def get_token_by_value(cls, cursor: MySQLCursor, token: str) -> Self:
         await cursor.execute("SELECT * FROM session_token WHERE token = %s", (token,))
         row = await cursor.fetchone()
@@ -169,6 +182,7 @@ class TokenRecord:
         return cls(token)
 
     @classmethod
+    @timed(db_query_latency)
     async def new_token(cls, cursor: MySQLCursor, token: NewToken) -> Self:
         try:
             await cursor.execute(
@@ -183,22 +197,64 @@ class TokenRecord:
 
 
 class DeleteTokenDaemonCreator:
+    # Every worker runs the daemon, only the one holding the advisory lock does the work.
+    # Batches keep each DELETE short so it does not hold locks on session_token for long.
+    lock_name = 'watch_delete_token_daemon'
 
-    def __init__(self, db_access: DBAccess, interval_minutes: int):
+    def __init__(self, db_access: DBAccess, interval_minutes: int, batch_size: int = 1000):
         self.access = db_access
         self.interval = interval_minutes * 60
+        self.batch_size = batch_size
+
+        self.last_run: datetime | None = None
+        self.last_deleted: int = 0
+        self.total_deleted: int = 0
+        self.lag: timedelta = timedelta(0)
 
-    async def delete_old_tokens(self):
+    async def delete_old_tokens(self) -> int | None:
         async with self.access.access() as wp:
-            await wp.cursor.execute(
-                'DELETE FROM session_token WHERE expiration < %s',
-                (datetime.now(timezone.utc),)
-            )
-            await wp.commit()
+            await wp.cursor.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name,))
+            (locked,) = await wp.cursor.fetchone()
+            if locked != 1:
+                return None
+            try:
+                now = datetime.now(timezone.utc)
+                await wp.cursor.execute("SELECT MIN(expiration) FROM session_token")
+                (oldest,) = await wp.cursor.fetchone()
+                oldest = oldest.replace(tzinfo=timezone.utc) if oldest is not None else now
+                deleted = 0
+                while True:
+                    await wp.cursor.execute(
+                        'DELETE FROM session_token WHERE expiration < %s ORDER BY expiration LIMIT %s',
+                        (now, self.batch_size)
+                    )
+                    batch = wp.cursor.rowcount
+                    await wp.commit()
+                    deleted += batch
+                    if batch < self.batch_size:
+                        break
+                    await asyncio.sleep(0)
+                # revocations of signed tokens are only needed until the tokens would have expired
+                await wp.cursor.execute('DELETE FROM token_revocation WHERE expiration < %s', (now,))
+                await wp.commit()
+            finally:
+                await wp.cursor.execute("SELECT RELEASE_LOCK(%s)", (self.lock_name,))
+                await wp.cursor.fetchone()
+
+        self.lag = max(now - oldest, timedelta(0))
+        self.last_run = now
+        self.last_deleted = deleted
+        self.total_deleted += deleted
+        logger.info('Deleted %d expired tokens, oldest was expired for %s.', deleted, self.lag)
+        return deleted
 
     async def daemon(self) -> NoReturn:
         while True:
-            await self.delete_old_tokens()
+            try:
+                await self.delete_old_tokens()
+            except Exception:
+                # the batches deleted so far are committed, the next pass deletes the rest
+                logger.exception('Deleting expired tokens failed.')
             await asyncio.sleep(self.interval)
 
     async def __call__(self) -> NoReturn:
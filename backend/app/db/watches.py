@@ -1,11 +1,27 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, NoReturn, Sequence
+import asyncio
+import logging
+import struct
 
 from pydantic import BaseModel
 from mysql.connector.aio.cursor import MySQLCursor
 from mysql.connector import Error
 
+from .access import DBAccess
 from .exceptions import OperationError, ConstraintError
 from .users import UserRecord
+from ..metrics import timed, db_query_latency
+
+logger = logging.getLogger(__name__)
+
+# awaited with (watch_id, cycle) whenever logs of a cycle are written or deleted
+LogWriteListener = Callable[[int, int], Awaitable[None]]
+
+
+async def _notify_log_write(listeners: Sequence[LogWriteListener], watch_id: int, cycle: int):
+    for listener in listeners:
+        await listener(watch_id, cycle)
 
 
 class NewWatch(BaseModel):
@@ -27,6 +43,7 @@ class WatchRecord:
     def check_integrity(self) -> bool:
         return self._initial_ids == (self.data.user_id, self.data.watch_id)
 
+    @timed(db_query_latency)
     async def update(self, cursor: MySQLCursor) -> int:
         if not self.check_integrity():
             raise RuntimeError
@@ -39,6 +56,7 @@ class WatchRecord:
             raise ConstraintError() from e
         return cursor.rowcount
 
+    @timed(db_query_latency)
     async def delete(self, cursor: MySQLCursor):
         if not self.check_integrity():
             raise RuntimeError
@@ -58,6 +76,7 @@ class WatchRecordManager:
     def __init__(self, user: UserRecord):
         self.user = user
 
+    @timed(db_query_latency)
     async def get_all_watches(self, cursor: MySQLCursor) -> tuple[WatchRecord, ...]:
         await cursor.execute("SELECT * FROM watch WHERE user_id = %s ORDER BY date_of_creation ASC",
                              (self.user.data.user_id,))
@@ -73,6 +92,7 @@ class WatchRecordManager:
             out.append(WatchRecord(current))
         return tuple(out)
 
+    @timed(db_query_latency)
     async def get_watch_by_name(self, cursor: MySQLCursor, name: str) -> WatchRecord:
         await cursor.execute(
             "SELECT * FROM watch WHERE user_id = %s AND name = %s",
@@ -89,6 +109,40 @@ class WatchRecordManager:
         )
         return WatchRecord(watch)
 
+    @timed(db_query_latency)
+    async def get_logs_by_cycle(self,
+                                cursor: MySQLCursor,
+                                watches: Sequence[WatchRecord],
+                                cycles: Sequence[int] | None = None
+    ) -> dict[tuple[int, int], list[tuple[int, datetime, float]]]:
+        # (log_id, timedate, measure) of many cycles grouped by (watch_id, cycle), all cycles without `cycles`
+        out: dict[tuple[int, int], list[tuple[int, datetime, float]]] = {}
+        if not watches or cycles is not None and not cycles:
+            return out
+        watch_ids = [watch.data.watch_id for watch in watches]
+        condition = f"watch_id IN ({', '.join(['%s'] * len(watch_ids))})"
+        params = list(watch_ids)
+        if cycles is not None:
+            condition += f" AND cycle IN ({', '.join(['%s'] * len(cycles))})"
+            params += list(cycles)
+
+        await cursor.execute(
+            f"SELECT watch_id, cycle, log_id, timedate, measure FROM log WHERE {condition} "
+            "ORDER BY watch_id, cycle, timedate, log_id",
+            params
+        )
+        for watch_id, cycle, log_id, timedate, measure in await cursor.fetchall():
+            out.setdefault((watch_id, cycle), []).append((log_id, timedate.replace(tzinfo=timezone.utc), measure))
+
+        await cursor.execute(
+            f"SELECT watch_id, cycle, log_count, log_ids, timedates, measures FROM log_archive WHERE {condition}",
+            params
+        )
+        for watch_id, cycle, *packed in await cursor.fetchall():
+            out[(watch_id, cycle)] = _unpack_logs(*packed)
+        return dict(sorted(out.items()))
+
+    @timed(db_query_latency)
     async def new_watch(self, cursor: MySQLCursor, watch: NewWatch) -> WatchRecord:
         if self.user.data.user_id != watch.user_id:
             raise ValueError("User in 'watch' is different than the one in self.user")
@@ -117,13 +171,15 @@ class ExistingLog(NewLog):
 
 class LogRecord:
 
-    def __init__(self, row: ExistingLog):
+    def __init__(self, row: ExistingLog, listeners: Sequence[LogWriteListener] = ()):
         self._initial_ids = (row.watch_id, row.log_id)
         self.data = row
+        self.listeners = listeners
 
     def check_integrity(self) -> bool:
         return self._initial_ids == (self.data.watch_id, self.data.log_id)
 
+    @timed(db_query_latency)
     async def update(self, cursor: MySQLCursor) -> int:
         if not self.check_integrity():
             raise RuntimeError
@@ -134,8 +190,17 @@ class LogRecord:
             )
         except Error as e:
             raise ConstraintError from e
-        return cursor.rowcount
+        updated = cursor.rowcount
+        # an edit in place leaves the count and the last log id as they were, see get_cycle_version
+        await cursor.execute(
+            "INSERT INTO log_revision (watch_id, cycle, revision) VALUES (%s, %s, 1) "
+            "ON DUPLICATE KEY UPDATE revision = revision + 1",
+            (self.data.watch_id, self.data.cycle)
+        )
+        await _notify_log_write(self.listeners, self.data.watch_id, self.data.cycle)
+        return updated
 
+    @timed(db_query_latency)
     async def delete(self, cursor: MySQLCursor):
         if not self.check_integrity():
             raise RuntimeError
@@ -145,19 +210,54 @@ class LogRecord:
         )
         if cursor.rowcount != 1:
             raise OperationError()
+        await _notify_log_write(self.listeners, self.data.watch_id, self.data.cycle)
+
+
+def _pack_logs(logs: list[tuple[int, datetime, float]]) -> tuple[bytes, bytes, bytes]:
+    size = len(logs)
+    return (
+        struct.pack(f'<{size}q', *(log_id for log_id, _, _ in logs)),
+        struct.pack(f'<{size}q', *(int(timedate.replace(tzinfo=timezone.utc).timestamp()) for _, timedate, _ in logs)),
+        struct.pack(f'<{size}f', *(measure for _, _, measure in logs))
+    )
+
+
+def _unpack_logs(size: int, log_ids: bytes, timedates: bytes, measures: bytes) -> list[tuple[int, datetime, float]]:
+    return [
+        (log_id, datetime.fromtimestamp(timestamp, timezone.utc), round(measure, 2))
+        for log_id, timestamp, measure in zip(
+            struct.unpack(f'<{size}q', log_ids),
+            struct.unpack(f'<{size}q', timedates),
+            struct.unpack(f'<{size}f', measures)
+        )
+    ]
 
 
 class LogRecordManager:
+    """Logs of a single watch.
+
+    Closed cycles are moved from `log` into `log_archive` (one packed row per cycle) by
+    `ArchiveLogsDaemonCreator`. Reads fall through to the archive, writes to an archived
+    cycle restore it into `log` first.
+    """
 
-    def __init__(self, watch: WatchRecord):
+    def __init__(self, watch: WatchRecord, listeners: Sequence[LogWriteListener] = ()):
         self.watch = watch
+        self.listeners = listeners
 
+    @timed(db_query_latency)
     async def get_log_by_id(self, cursor: MySQLCursor, cycle: int, log_id: int) -> LogRecord:
         await cursor.execute(
             "SELECT * FROM log WHERE log_id = %s AND watch_id = %s AND cycle = %s",
             (log_id, self.watch.data.watch_id, cycle)
         )
         row = await cursor.fetchone()
+        if row is None and await self.restore_cycle(cursor, cycle):
+            await cursor.execute(
+                "SELECT * FROM log WHERE log_id = %s AND watch_id = %s AND cycle = %s",
+                (log_id, self.watch.data.watch_id, cycle)
+            )
+            row = await cursor.fetchone()
         if row is None:
             raise OperationError()
         log = ExistingLog(
@@ -167,11 +267,13 @@ class LogRecordManager:
             timedate=row[3].replace(tzinfo=timezone.utc),
             measure=row[4]
         )
-        return LogRecord(log)
+        return LogRecord(log, self.listeners)
 
+    @timed(db_query_latency)
     async def new_log(self, cursor: MySQLCursor, cycle: int, log: NewLog) -> LogRecord:
         if self.watch.data.watch_id != log.watch_id or cycle != log.cycle:
             raise ValueError("self.watch or cycle are different in log: NewLog")
+        await self.restore_cycle(cursor, cycle)
         try:
             await cursor.execute(
                 "INSERT INTO log (watch_id, cycle, timedate, measure) VALUES (%s, %s, %s, %s)",
@@ -183,22 +285,68 @@ class LogRecordManager:
             raise OperationError()
         log_id = cursor.lastrowid
         assert log_id is not None
+        await _notify_log_write(self.listeners, log.watch_id, cycle)
         return await self.get_log_by_id(cursor, cycle, log_id)
 
+    @timed(db_query_latency)
     async def get_cycles(self, cursor: MySQLCursor) ->  list[int]:
         await cursor.execute(
-            "SELECT DISTINCT cycle FROM log WHERE watch_id = %s ORDER BY cycle ASC",
-            (self.watch.data.watch_id,)
+            "SELECT cycle FROM log WHERE watch_id = %s "
+            "UNION SELECT cycle FROM log_archive WHERE watch_id = %s ORDER BY cycle ASC",
+            (self.watch.data.watch_id, self.watch.data.watch_id)
         )
         return [i for (i,) in await cursor.fetchall()]
 
+    async def _get_archived_logs(self, cursor: MySQLCursor, cycle: int, lock: bool = False) -> list[tuple] | None:
+        await cursor.execute(
+            "SELECT log_count, log_ids, timedates, measures FROM log_archive WHERE watch_id = %s AND cycle = %s"
+            + (" FOR UPDATE" if lock else ""),
+            (self.watch.data.watch_id, cycle)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return None
+        return [
+            (log_id, self.watch.data.watch_id, cycle, timedate, measure)
+            for log_id, timedate, measure in _unpack_logs(*row)
+        ]
+
+    @timed(db_query_latency)
+    async def restore_cycle(self, cursor: MySQLCursor, cycle: int) -> bool:
+        rows = await self._get_archived_logs(cursor, cycle, lock=True)
+        if rows is None:
+            return False
+        await cursor.executemany(
+            "INSERT INTO log (log_id, watch_id, cycle, timedate, measure) VALUES (%s, %s, %s, %s, %s)",
+            rows
+        )
+        await cursor.execute(
+            "DELETE FROM log_archive WHERE watch_id = %s AND cycle = %s",
+            (self.watch.data.watch_id, cycle)
+        )
+        return True
+
+    @timed(db_query_latency)
+    async def get_cycle_version(self, cursor: MySQLCursor, cycle: int) -> tuple[int, ...]:
+        # changes with every log added, updated or deleted through the API and when the cycle is
+        # archived; updates are counted in log_revision, which is never reset for a cycle
+        await cursor.execute(
+            "SELECT COUNT(*), COALESCE(MAX(log_id), 0) FROM log WHERE watch_id = %s AND cycle = %s "
+            "UNION ALL SELECT log_count, -1 FROM log_archive WHERE watch_id = %s AND cycle = %s "
+            "UNION ALL SELECT revision, -2 FROM log_revision WHERE watch_id = %s AND cycle = %s",
+            (self.watch.data.watch_id, cycle) * 3
+        )
+        return tuple(value for row in await cursor.fetchall() for value in row)
 
+    @timed(db_query_latency)
     async def get_logs(self, cursor: MySQLCursor, cycle: int) -> tuple[LogRecord, ...]:
         await cursor.execute(
-            "SELECT * FROM log WHERE watch_id = %s AND cycle = %s",
+            "SELECT * FROM log WHERE watch_id = %s AND cycle = %s ORDER BY timedate ASC, log_id ASC",
             (self.watch.data.watch_id, cycle)
         )
         rows = await cursor.fetchall()
+        if not rows:
+            rows = await self._get_archived_logs(cursor, cycle) or []
         out = []
         for row in rows:
             current = ExistingLog(
@@ -208,13 +356,86 @@ class LogRecordManager:
                 timedate=row[3].replace(tzinfo=timezone.utc),
                 measure=row[4]
             )
-            out.append(LogRecord(current))
+            out.append(LogRecord(current, self.listeners))
         return tuple(out)
 
+    @timed(db_query_latency)
     async def delete_logs(self, cursor: MySQLCursor, cycle: int):
+        await cursor.execute(
+            "DELETE FROM log_archive WHERE watch_id = %s AND cycle = %s",
+            (self.watch.data.watch_id, cycle)
+        )
         await cursor.execute(
             "DELETE FROM log WHERE watch_id = %s AND cycle = %s",
             (self.watch.data.watch_id, cycle)
         )
         if cursor.rowcount == -1:
             raise OperationError()
+        await _notify_log_write(self.listeners, self.watch.data.watch_id, cycle)
+
+
+class ArchiveLogsDaemonCreator:
+    # Every worker runs the daemon, only the one holding the advisory lock archives.
+    lock_name = 'watch_archive_logs_daemon'
+
+    def __init__(self, db_access: DBAccess, interval_minutes: int, closed_after_days: int):
+        self.access = db_access
+        self.interval = interval_minutes * 60
+        self.closed_after = timedelta(days=closed_after_days)
+
+    @timed(db_query_latency)
+    async def archive_cycle(self, cursor: MySQLCursor, watch_id: int, cycle: int, cutoff: datetime) -> bool:
+        await cursor.execute(
+            "SELECT log_id, timedate, measure FROM log WHERE watch_id = %s AND cycle = %s "
+            "ORDER BY timedate ASC, log_id ASC FOR UPDATE",
+            (watch_id, cycle)
+        )
+        logs = await cursor.fetchall()
+        # the cycle could have been written to since it was selected
+        if not logs or logs[-1][1].replace(tzinfo=timezone.utc) >= cutoff:
+            return False
+        await cursor.execute(
+            "INSERT INTO log_archive (watch_id, cycle, log_count, first_log, last_log, log_ids, timedates, measures) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (watch_id, cycle, len(logs), logs[0][1], logs[-1][1], *_pack_logs(logs))
+        )
+        await cursor.execute(
+            "DELETE FROM log WHERE watch_id = %s AND cycle = %s",
+            (watch_id, cycle)
+        )
+        return True
+
+    async def archive_closed_cycles(self) -> int | None:
+        cutoff = datetime.now(timezone.utc) - self.closed_after
+        archived = 0
+        async with self.access.access() as wp:
+            await wp.cursor.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name,))
+            (locked,) = await wp.cursor.fetchone()
+            if locked != 1:
+                return None
+            try:
+                await wp.cursor.execute(
+                    "SELECT watch_id, cycle FROM log GROUP BY watch_id, cycle HAVING MAX(timedate) < %s",
+                    (cutoff,)
+                )
+                for watch_id, cycle in await wp.cursor.fetchall():
+                    if await self.archive_cycle(wp.cursor, watch_id, cycle, cutoff):
+                        archived += 1
+                    await wp.commit()
+            finally:
+                await wp.cursor.execute("SELECT RELEASE_LOCK(%s)", (self.lock_name,))
+                await wp.cursor.fetchone()
+        logger.info('Archived %d closed cycles.', archived)
+        return archived
+
+    async def daemon(self) -> NoReturn:
+        while True:
+            try:
+                await self.archive_closed_cycles()
+            except Exception:
+                # a failed cycle is rolled back and picked up again by the next pass
+                logger.exception('Archiving closed cycles failed.')
+            await asyncio.sleep(self.interval)
+
+    async def __call__(self) -> NoReturn:
+        await self.daemon()
@@ -0,0 +1,90 @@
+from typing import NamedTuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from communication import responses, columnar
+from .data_manipulation.log import WatchLogFrame
+
+# Log lists are encoded straight from the frame records. Building a LogResponse model per row and
+# letting FastAPI validate and serialize the list again costs several times more than the encoding.
+# The JSON is the same as for responses.LogListResponse, clients decode it with the usual models.
+# Clients that accept communication.columnar.media_type get the binary columnar layout instead.
+
+_options = orjson.OPT_UTC_Z
+assert tuple(responses.LogResponse.model_fields) == ('log_id', 'time', 'measure', 'difference', 'suspect')
+
+
+class EncodedLogs(NamedTuple):
+    rows: int
+    media_type: str
+    content: bytes
+
+
+def media_ranges(accept: str) -> dict[str, float]:
+    # 'type/subtype;q=0.5, ...' to the quality of each range, a q that does not parse counts as 0
+    out = {}
+    for item in accept.split(','):
+        media_range, *params = (part.strip() for part in item.split(';'))
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = 0.0
+        out[media_range.lower()] = quality
+    return out
+
+
+def media_quality(ranges: dict[str, float], media_type: str) -> float:
+    # the most specific range matching wins, an Accept header without any range accepts everything
+    if not ranges:
+        return 1.0
+    main_type = media_type.partition('/')[0]
+    for media_range in (media_type, f'{main_type}/*', '*/*'):
+        if media_range in ranges:
+            return ranges[media_range]
+    return 0.0
+
+
+def accepts_columnar(http_request: Request) -> bool:
+    # only clients naming the columnar type get it, and not when they rank JSON higher
+    ranges = media_ranges(http_request.headers.get('accept', ''))
+    quality = ranges.get(columnar.media_type, 0.0)
+    return quality > 0 and quality >= media_quality(ranges, 'application/json')
+
+
+def encode_logs(frame: WatchLogFrame, binary: bool = False) -> EncodedLogs:
+    # filled frames have no log ids and nothing is flagged in them
+    if binary:
+        content = columnar.encode_logs(
+            [record.get('log_id') for record in frame.data],
+            [record.datetime for record in frame.data],
+            [record.measure for record in frame.data],
+            [record.get('difference') for record in frame.data],
+            [record.get('suspect', False) for record in frame.data]
+        )
+        return EncodedLogs(len(frame.data), columnar.media_type, content)
+    logs = [
+        {
+            'log_id': record.get('log_id'),
+            'time': record.datetime,
+            'measure': record.measure,
+            'difference': record.get('difference'),
+            'suspect': record.get('suspect', False)
+        } for record in frame.data
+    ]
+    return EncodedLogs(len(logs), 'application/json', orjson.dumps(logs, option=_options))
+
+
+def log_list_response(auth: responses.AuthResponse, logs: EncodedLogs) -> Response:
+    if logs.media_type == columnar.media_type:
+        content = columnar.encode_log_list(auth, logs.content)
+    else:
+        content = b'{"auth":' + auth.model_dump_json().encode() + b',"logs":' + logs.content + b'}'
+    return Response(content=content, media_type=logs.media_type, headers={'Vary': 'Accept'})
@@ -1,43 +1,249 @@
 import asyncio
+import hashlib
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Callable, TypeVar
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi import status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, Response
 
 from communication import messages, responses
-from . import settings, security, db, utils
-from .data_manipulation.interpolation import LinearInterpolation
-from .data_manipulation.log import WatchLogFrame
+from . import settings, security, db, utils, metrics, cache, encoding, tokens, ratelimit
+from .data_manipulation.interpolation import interpolation_methods
+from .data_manipulation.log import WatchLogFrame, fill_steps, downsampling_methods
+from .data_manipulation import regression
 
-db_access = db.DBAccess(settings.DATABASE_CONFIG)
-sec_functions = security.SecurityCreator(db_access)
-token_daemon = db.DeleteTokenDaemonCreator(db_access, 5)
+T = TypeVar('T')
+
+# points filled per point returned when downsampling
+oversampling = 8
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    max_retries = 10
-    retry_delay = 2  # seconds
+    # Everything stateful is created per worker process, nothing is shared between workers.
+    db_access = db.DBAccess(settings.DATABASE_CONFIG, settings.DB_POOL_SIZE, settings.SLOW_QUERY_SECONDS)
+
+    max_retries = 12
+    retry_delay = 0.1  # seconds, doubled after every failed attempt
+    max_retry_delay = 8
 
     for attempt in range(max_retries):
         try:
-            await db.db_initiate(db_access, *db.schema_files)
+            app.state.schema_version = await db.db_migrate(db_access, *db.schema_files)
             break
         except Exception as e:
             if attempt < max_retries - 1:
                 await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, max_retry_delay)
             else:
                 raise e
 
-    asyncio.create_task(token_daemon())
+    app.state.db_access = db_access
+    signer = tokens.TokenSigner.from_setting(settings.TOKEN_SIGNING_KEYS, settings.SIGNED_TOKEN_MAX_MINUTES)
+    revocations = None
+    signed_tokens = None
+    if signer is not None:
+        revocations = tokens.RevocationList(db_access, signer.max_minutes, settings.TOKEN_REVOCATION_SYNC_SECONDS)
+        await revocations.sync()
+        signed_tokens = security.SignedTokens(signer, revocations)
+        metrics.revoked_tokens.set_function(lambda: len(revocations))
+    if settings.BCRYPT_ROUNDS:
+        security.set_password_rounds(settings.BCRYPT_ROUNDS)
+    else:
+        rounds = await run_in_threadpool(security.calibrate_rounds, settings.BCRYPT_TARGET_MS / 1000,
+                                         settings.BCRYPT_MIN_ROUNDS, settings.BCRYPT_MAX_ROUNDS)
+        # workers calibrating one round apart leave each other's hashes alone
+        security.set_password_rounds(rounds, spread=1)
+    metrics.password_hash_rounds.set(security.pwd_context.handler().default_rounds)
+    limiter = ratelimit.LoginLimiter(
+        settings.LOGIN_ATTEMPTS_PER_MINUTE, settings.LOGIN_CLIENT_ATTEMPTS_PER_MINUTE, settings.MAX_CONCURRENT_HASHES
+    )
+    app.state.sec_functions = security.SecurityCreator(db_access, signed_tokens, limiter)
+    app.state.token_daemon = db.DeleteTokenDaemonCreator(db_access, 5)
+    app.state.archive_daemon = db.ArchiveLogsDaemonCreator(db_access, 60, settings.ARCHIVE_AFTER_DAYS)
+    app.state.idempotency_daemon = db.DeleteIdempotencyKeysDaemonCreator(db_access, 60)
+    app.state.frame_cache = cache.create_frame_cache(settings.FRAME_CACHE_URL, settings.FRAME_CACHE_ROWS)
+    # passed to the LogRecordManager of the endpoints writing logs
+    app.state.log_write_listeners = [app.state.frame_cache.invalidate]
+    metrics.token_reaper_deleted.set_function(lambda: app.state.token_daemon.total_deleted)
+    metrics.token_reaper_lag.set_function(lambda: app.state.token_daemon.lag.total_seconds())
+
+    daemons = [
+        asyncio.create_task(app.state.token_daemon()),
+        asyncio.create_task(app.state.archive_daemon()),
+        asyncio.create_task(app.state.idempotency_daemon())
+    ]
+    if revocations is not None:
+        daemons.append(asyncio.create_task(revocations()))
     yield
+    for daemon in daemons:
+        daemon.cancel()
+    await asyncio.gather(*daemons, return_exceptions=True)
+    app.state.log_write_listeners.clear()
+    await app.state.frame_cache.close()
+    await db_access.close()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(db.QueryStatsMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE, compresslevel=settings.GZIP_LEVEL)
+
+
+def get_db_access(http_request: Request) -> db.DBAccess:
+    return http_request.app.state.db_access
+
+
+def get_sec_functions(http_request: Request) -> security.SecurityCreator:
+    return http_request.app.state.sec_functions
+
+
+def get_frame_cache(http_request: Request) -> cache.FrameCache:
+    return http_request.app.state.frame_cache
+
+
+def get_log_write_listeners(http_request: Request) -> list[db.LogWriteListener]:
+    return http_request.app.state.log_write_listeners
+
+
+async def get_user(request: messages.LoggedInUserMessage, http_request: Request) -> security.AuthBundle:
+    return await http_request.app.state.sec_functions.get_user(request)
+
+
+async def get_user_from_header(
+        http_request: Request,
+        authorization: str = Header(...),
+        token_expiration_minutes: int | None = Header(None, gt=5)
+) -> security.AuthBundle:
+    # GET reads only extend the token when asked to, so repeated reads give the same response
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Bearer token required.",
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    return await http_request.app.state.sec_functions.get_user.get_user_by_token(token, token_expiration_minutes)
+
+
+async def load_versioned(frame_cache: cache.FrameCache,
+                         cursor,
+                         watch: db.WatchRecord,
+                         cycle: int,
+                         kind: str,
+                         compute: Callable[[WatchLogFrame], T],
+                         weight: Callable[[T], int]) -> tuple[tuple, T]:
+    # the logs are only fetched when nothing is cached for the current version of the cycle
+    manager = db.LogRecordManager(watch)
+    version = await manager.get_cycle_version(cursor, cycle)
+    out = await frame_cache.get(watch.data.watch_id, cycle, version, kind)
+    if out is None:
+        logs = await manager.get_logs(cursor, cycle)
+        with metrics.frame_latency.labels(kind.partition(':')[0]).time():
+            table = [(log.data.log_id, log.data.timedate, log.data.measure) for log in logs]
+            out = compute(WatchLogFrame.from_table(('log_id', 'datetime', 'measure'), table))
+        await frame_cache.set(watch.data.watch_id, cycle, version, kind, out, weight(out))
+    return version, out
+
+
+async def load_cached(frame_cache: cache.FrameCache,
+                      cursor,
+                      watch: db.WatchRecord,
+                      cycle: int,
+                      kind: str,
+                      compute: Callable[[WatchLogFrame], T],
+                      weight: Callable[[T], int]) -> T:
+    _, out = await load_versioned(frame_cache, cursor, watch, cycle, kind, compute, weight)
+    return out
+
+
+def cacheable(http_request: Request, validator: str, response: Response) -> Response:
+    # GET reads may be kept by the client or a proxy in front of the workers for READ_CACHE_SECONDS,
+    # after that they are revalidated; the ETag changes with every write to the cycle.
+    # It is weak because the gzipped and the plain response share it.
+    etag = f'W/"{hashlib.blake2b(validator.encode(), digest_size=16).hexdigest()}"'
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'max-age={settings.READ_CACHE_SECONDS}, must-revalidate',
+        'Vary': 'Authorization, Accept'
+    }
+    if etag in http_request.headers.get('if-none-match', ''):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+def idempotency_record(auth_bundle: security.AuthBundle,
+                       path: str,
+                       request: messages.BaseMessage) -> db.IdempotencyRecord:
+    # the request is identified by everything except the token it was sent with
+    return db.IdempotencyRecord(
+        auth_bundle.user,
+        request.idempotency_key,
+        path + request.model_dump_json(exclude={'auth', 'idempotency_key'}),
+        timedelta(hours=settings.IDEMPOTENCY_KEY_HOURS)
+    )
+
+
+async def replay(record: db.IdempotencyRecord,
+                 cursor,
+                 auth_bundle: security.AuthBundle,
+                 response_type: type[T]) -> T | None:
+    # the response to an earlier request with the same key, with the current auth
+    try:
+        stored = await record.reserve(cursor)
+    except db.exceptions.ConstraintError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency key was already used for a different request."
+        )
+    except db.exceptions.OperationError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this idempotency key is still being processed."
+        )
+    if stored is None:
+        return None
+    return response_type(auth=utils.parse_auth_bundle(auth_bundle), **stored)
+
+
+async def remember(record: db.IdempotencyRecord, cursor, response: responses.LoggedInResponse):
+    await record.save(cursor, response.model_dump(mode='json', exclude={'auth'}))
+
+
+@app.get('/ready')
+async def ready(db_access: db.DBAccess = Depends(get_db_access)) -> dict:
+    try:
+        async with db_access.access() as wp:
+            version = await db.get_schema_version(wp.cursor)
+            await wp.rollback()
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable.")
+    if version < len(db.schema_files):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Schema not migrated.")
+    return {'status': 'ready', 'schema_version': version}
+
+
+@app.get('/metrics', include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.registry.render(), media_type='text/plain; version=0.0.4')
+
+
+def client_address(http_request: Request) -> str | None:
+    # behind a reverse proxy this is the proxy unless uvicorn runs with --proxy-headers
+    return http_request.client.host if http_request.client is not None else None
+
 
 @app.post('/register')
-async def register_user(request: messages.UserRegisterMessage):
-    user = await sec_functions.register_user(request)
+async def register_user(
+        request: messages.UserRegisterMessage,
+        http_request: Request,
+        sec_functions: security.SecurityCreator = Depends(get_sec_functions)
+):
+    user = await sec_functions.register_user(request, client_address(http_request))
     return responses.UserCreationResponse(
         user_name=user.data.user_name,
         creation_date=user.data.date_of_creation
@@ -45,8 +251,12 @@ async def register_user(request: messages.UserRegisterMessage):
 
 
 @app.post('/login')
-async def login_user(request: messages.UserLoginMessage) -> responses.TokenResponse:
-    _, token = await sec_functions.login_user(request)
+async def login_user(
+        request: messages.UserLoginMessage,
+        http_request: Request,
+        sec_functions: security.SecurityCreator = Depends(get_sec_functions)
+) -> responses.TokenResponse:
+    _, token = await sec_functions.login_user(request, client_address(http_request))
     return responses.TokenResponse(
         token=token.data.token,
         expiration_date=token.data.expiration
@@ -56,7 +266,8 @@ async def login_user(request: messages.UserLoginMessage) -> responses.TokenRespo
 @app.post('/logout')
 async def logout_user(
         request: messages.LoggedInUserMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access)
 ) -> responses.LogOutResponse:
     async with db_access.access() as wp:
         await auth_bundle.token.delete(wp.cursor)
@@ -70,7 +281,7 @@ async def logout_user(
 @app.post('/refresh')
 async def refresh_user(
         request: messages.LoggedInUserMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user)
 ) -> responses.LoggedInResponse:
     return responses.LoggedInResponse(auth=utils.parse_auth_bundle(auth_bundle))
 
@@ -78,9 +289,12 @@ async def refresh_user(
 @app.post('/terminate')
 async def terminate_user(
         request: messages.LoggedInUserMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        sec_functions: security.SecurityCreator = Depends(get_sec_functions)
 ) -> responses.LogOutResponse:
     async with db_access.access() as wp:
+        await sec_functions.revoke_user(wp.cursor, auth_bundle.user)
         await auth_bundle.user.delete(wp.cursor)
         await wp.commit()
     return responses.LogOutResponse(
@@ -92,7 +306,8 @@ async def terminate_user(
 @app.post('/watch/list')
 async def watchlist(
         request: messages.LoggedInUserMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access)
 ) -> responses.WatchListResponse:
     async with db_access.access() as wp:
         watches = await db.WatchRecordManager(auth_bundle.user).get_all_watches(wp.cursor)
@@ -113,9 +328,13 @@ async def watchlist(
 @app.post('/watch/add')
 async def add_watch(
         request: messages.EditWatchMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access)
 ) -> responses.WatchEditResponse:
+    record = idempotency_record(auth_bundle, '/watch/add', request)
     async with db_access.access() as wp:
+        if (out := await replay(record, wp.cursor, auth_bundle, responses.WatchEditResponse)) is not None:
+            return out
         new_watch = db.NewWatch(
             user_id=auth_bundle.user.data.user_id,
             name=request.name,
@@ -127,38 +346,214 @@ async def add_watch(
             await wp.rollback()
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail=f"Watch '{request.name}' already exists.")
+        out = responses.WatchEditResponse(
+            auth=utils.parse_auth_bundle(auth_bundle),
+            name=watch.data.name,
+            date_of_creation=watch.data.date_of_creation
+        )
+        await remember(record, wp.cursor, out)
         await wp.commit()
-    return responses.WatchEditResponse(
-        auth=utils.parse_auth_bundle(auth_bundle),
-        name=watch.data.name,
-        date_of_creation=watch.data.date_of_creation
-    )
+    return out
 
 
 @app.post('/watch/delete')
 async def delete_watch(
         request: messages.EditWatchMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access)
 ) -> responses.WatchEditResponse:
+    record = idempotency_record(auth_bundle, '/watch/delete', request)
     async with db_access.access() as wp:
+        if (out := await replay(record, wp.cursor, auth_bundle, responses.WatchEditResponse)) is not None:
+            return out
         try:
             watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.name)
         except db.exceptions.OperationError:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Watch {request.name} does not exits.")
         await watch.delete(wp.cursor)
+        out = responses.WatchEditResponse(
+            auth=utils.parse_auth_bundle(auth_bundle),
+            name=watch.data.name,
+            date_of_creation=watch.data.date_of_creation
+        )
+        await remember(record, wp.cursor, out)
         await wp.commit()
-    return responses.WatchEditResponse(
+    return out
+
+
+def compute_fill(frame: WatchLogFrame, request: messages.FillQuery) -> WatchLogFrame:
+    step = fill_steps[request.resolution.value]
+    if request.max_points is not None and len(frame.data) > 1:
+        # a fill denser than needed for the downsampling is not computed at all
+        span = frame.data[-1].time_as_float - frame.data[0].time_as_float
+        step = max(step, int(span // (request.max_points * oversampling)))
+    frame = frame.fill(interpolation_methods[request.interpolation.value], step, digits=None)
+    if request.max_points is not None:
+        frame = downsampling_methods[request.downsampling.value](frame, request.max_points)
+    # filled points are an hour to weeks apart, the differences stay the daily rate the client shows;
+    # they are scaled from the unrounded measures, rounding first would scale the rounding error too
+    return frame.get_log_with_dif(per_day=True).rounded()
+
+
+def compute_stats(frame: WatchLogFrame,
+                  request: messages.StatsQuery) -> tuple[float | None, float | None, float | None]:
+    if request.exclude_outliers:
+        frame = frame.exclude_outliers()
+    return frame.fill(interpolation_methods[request.interpolation.value]).stats()
+
+
+def compute_regression(frame: WatchLogFrame,
+                       robust: bool) -> tuple[int, regression.LinearFit | None, regression.LinearFit | None]:
+    # fitted on the logs themselves, no fill is needed
+    points = [(record.time_as_float, record.measure) for record in frame.data]
+    return (
+        len(points),
+        regression.least_squares(points),
+        regression.theil_sen(points) if robust else None
+    )
+
+
+async def read_logs(request: messages.WatchDataQuery,
+                    http_request: Request,
+                    auth_bundle: security.AuthBundle,
+                    db_access: db.DBAccess,
+                    frame_cache: cache.FrameCache,
+                    kind: str,
+                    compute: Callable[[WatchLogFrame], WatchLogFrame]) -> tuple[str, Response]:
+    # shared by the POST and GET log lists, returns the response and what its ETag is made from
+    binary = encoding.accepts_columnar(http_request)
+    if binary:
+        kind += ':columnar'
+    async with db_access.access() as wp:
+        try:
+            watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
+        except db.exceptions.OperationError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Watch {request.watch_name} not found."
+            )
+        version, logs = await load_versioned(
+            frame_cache, wp.cursor, watch, request.cycle, kind,
+            lambda f: encoding.encode_logs(compute(f), binary), lambda logs: logs.rows
+        )
+    auth = utils.parse_auth_bundle(auth_bundle)
+    validator = f'{watch.data.watch_id}:{request.cycle}:{version}:{kind}:{auth.model_dump_json()}'
+    return validator, encoding.log_list_response(auth, logs)
+
+
+def fill_kind(request: messages.FillQuery) -> str:
+    return (f'fill:{request.interpolation.value}:{request.resolution.value}:'
+            f'{request.max_points}:{request.downsampling.value}')
+
+
+async def read_stats(request: messages.StatsQuery,
+                     auth_bundle: security.AuthBundle,
+                     db_access: db.DBAccess,
+                     frame_cache: cache.FrameCache) -> tuple[str, responses.StatsResponse]:
+    kind = f'stats:{request.interpolation.value}:{request.exclude_outliers}'
+    async with db_access.access() as wp:
+        try:
+            watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
+        except db.exceptions.OperationError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Watch {request.watch_name} not found."
+            )
+        version, (average, deviation, delta) = await load_versioned(
+            frame_cache, wp.cursor, watch, request.cycle, kind,
+            lambda f: compute_stats(f, request), lambda _: 1
+        )
+    out = responses.StatsResponse(
         auth=utils.parse_auth_bundle(auth_bundle),
-        name=watch.data.name,
-        date_of_creation=watch.data.date_of_creation
+        average=average,
+        deviation=deviation,
+        delta=delta
     )
+    return f'{watch.data.watch_id}:{request.cycle}:{version}:{kind}:{out.auth.model_dump_json()}', out
 
 
-@app.post('/logs/list')
+@app.post('/logs/list', response_model=responses.LogListResponse)
 async def log_list(
         request: messages.SpecifyWatchDataMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
-) -> responses.LogListResponse:
+        http_request: Request,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> Response:
+    _, out = await read_logs(request, http_request, auth_bundle, db_access, frame_cache, 'list',
+                             lambda f: f.flag_outliers().get_log_with_dif())
+    return out
+
+
+@app.get('/logs/list', response_model=responses.LogListResponse)
+async def get_log_list(
+        request: Annotated[messages.WatchDataQuery, Query()],
+        http_request: Request,
+        auth_bundle: security.AuthBundle = Depends(get_user_from_header),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> Response:
+    validator, out = await read_logs(request, http_request, auth_bundle, db_access, frame_cache, 'list',
+                                     lambda f: f.flag_outliers().get_log_with_dif())
+    return cacheable(http_request, validator, out)
+
+
+@app.post('/logs/fill', response_model=responses.LogListResponse)
+async def log_fill(
+        request: messages.FillMessage,
+        http_request: Request,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> Response:
+    _, out = await read_logs(request, http_request, auth_bundle, db_access, frame_cache, fill_kind(request),
+                             lambda f: compute_fill(f, request))
+    return out
+
+
+@app.get('/logs/fill', response_model=responses.LogListResponse)
+async def get_log_fill(
+        request: Annotated[messages.FillQuery, Query()],
+        http_request: Request,
+        auth_bundle: security.AuthBundle = Depends(get_user_from_header),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> Response:
+    validator, out = await read_logs(request, http_request, auth_bundle, db_access, frame_cache, fill_kind(request),
+                                     lambda f: compute_fill(f, request))
+    return cacheable(http_request, validator, out)
+
+
+@app.post('/logs/stats')
+async def stats(
+        request: messages.StatsMessage,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> responses.StatsResponse:
+    _, out = await read_stats(request, auth_bundle, db_access, frame_cache)
+    return out
+
+
+@app.get('/logs/stats', response_model=responses.StatsResponse)
+async def get_stats(
+        request: Annotated[messages.StatsQuery, Query()],
+        http_request: Request,
+        auth_bundle: security.AuthBundle = Depends(get_user_from_header),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> Response:
+    validator, out = await read_stats(request, auth_bundle, db_access, frame_cache)
+    return cacheable(http_request, validator, Response(out.model_dump_json(), media_type='application/json'))
+
+
+@app.post('/logs/regression')
+async def log_regression(
+        request: messages.RegressionMessage,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> responses.RegressionResponse:
     async with db_access.access() as wp:
         try:
             watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
@@ -167,27 +562,31 @@ async def log_list(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Watch {request.watch_name} not found."
             )
-        logs = await db.LogRecordManager(watch).get_logs(wp.cursor, request.cycle)
-    table = [(log.data.log_id, log.data.timedate, log.data.measure) for log in logs]
-    frame = WatchLogFrame.from_table(('log_id', 'datetime', 'measure'), table).get_log_with_dif()
-    tmp = [
-        responses.LogResponse(
-            log_id=f.other['log_id'],
-            time=f.datetime,
-            measure=f.measure,
-            difference=f.other['difference']
-        ) for f in frame.data]
-    return responses.LogListResponse(
+        count, fit, robust_fit = await load_cached(
+            frame_cache, wp.cursor, watch, request.cycle, f'regression:{request.robust}',
+            lambda f: compute_regression(f, request.robust), lambda _: 1
+        )
+    interval = fit.rate_interval if fit is not None else None
+    return responses.RegressionResponse(
         auth=utils.parse_auth_bundle(auth_bundle),
-        logs=tmp
+        count=count,
+        rate=round(fit.rate, 3) if fit is not None else None,
+        rate_low=round(interval[0], 3) if interval is not None else None,
+        rate_high=round(interval[1], 3) if interval is not None else None,
+        r_squared=round(fit.r_squared, 4) if fit is not None and fit.r_squared is not None else None,
+        residual_deviation=round(fit.residual_deviation, 3) if fit is not None else None,
+        residual_max=round(fit.residual_max, 3) if fit is not None else None,
+        robust_rate=round(robust_fit.rate, 3) if robust_fit is not None else None
     )
 
 
-@app.post('/logs/fill')
-async def log_fill(
-        request: messages.SpecifyWatchDataMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
-) -> responses.LogListResponse:
+@app.post('/logs/rolling')
+async def log_rolling(
+        request: messages.RollingMessage,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> responses.RollingResponse:
     async with db_access.access() as wp:
         try:
             watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
@@ -196,30 +595,28 @@ async def log_fill(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Watch {request.watch_name} not found."
             )
-        logs = await db.LogRecordManager(watch).get_logs(wp.cursor, request.cycle)
-    table = [(log.data.log_id, log.data.timedate, log.data.measure) for log in logs]
-    frame = (WatchLogFrame
-             .from_table(('log_id', 'datetime', 'measure'), table)
-             .fill(LinearInterpolation)
-             .get_log_with_dif())
-    tmp = [
-        responses.LogResponse(
-            log_id=None,
-            time=f.datetime,
-            measure=f.measure,
-            difference=f.other['difference']
-        ) for f in frame.data]
-    return responses.LogListResponse(
+        frame = await load_cached(
+            frame_cache, wp.cursor, watch, request.cycle, f'rolling:{request.interpolation.value}:{request.window_days}',
+            lambda f: f.fill(interpolation_methods[request.interpolation.value]).rolling(request.window_days),
+            lambda f: len(f.data)
+        )
+    return responses.RollingResponse(
         auth=utils.parse_auth_bundle(auth_bundle),
-        logs=tmp
+        window_days=request.window_days,
+        stats=[
+            responses.RollingStatsResponse(time=f.datetime, average=f.measure, deviation=f['deviation'])
+            for f in frame.data
+        ]
     )
 
 
-@app.post('/logs/stats')
-async def stats(
-        request: messages.SpecifyWatchDataMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
-) -> responses.StatsResponse:
+@app.post('/logs/segments')
+async def log_segments(
+        request: messages.SegmentsMessage,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        frame_cache: cache.FrameCache = Depends(get_frame_cache)
+) -> responses.SegmentsResponse:
     async with db_access.access() as wp:
         try:
             watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
@@ -228,32 +625,83 @@ async def stats(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Watch {request.watch_name} not found."
             )
-        logs = await db.LogRecordManager(watch).get_logs(wp.cursor, request.cycle)
-    table = [(log.data.log_id, log.data.timedate, log.data.measure) for log in logs]
-    frame = WatchLogFrame.from_table(('log_id', 'datetime', 'measure'), table).fill(LinearInterpolation)
-    try:
-        out = responses.StatsResponse(
-            auth=utils.parse_auth_bundle(auth_bundle),
-            average=frame.average,
-            deviation=frame.standard_deviation,
-            delta=frame.delta
+        # the daily fill is cached, the segments are cheap to compute from it
+        frame = await load_cached(
+            frame_cache, wp.cursor, watch, request.cycle, f'daily:{request.interpolation.value}',
+            lambda f: f.fill(interpolation_methods[request.interpolation.value]), lambda f: len(f.data)
         )
-    except ZeroDivisionError:
-        out = responses.StatsResponse(
-            auth=utils.parse_auth_bundle(auth_bundle),
-            average=None,
-            deviation=None,
-            delta=None
-        )
-    return out
+    ranges = [(utils.as_utc(segment.start), utils.as_utc(segment.end)) for segment in request.segments]
+    with metrics.frame_latency.labels('segments').time():
+        stats = frame.segment_stats(ranges)
+    return responses.SegmentsResponse(
+        auth=utils.parse_auth_bundle(auth_bundle),
+        segments=[
+            responses.SegmentStatsResponse(
+                name=segment.name,
+                start=start,
+                end=end,
+                days=days,
+                average=average,
+                deviation=deviation,
+                delta=delta
+            ) for segment, (start, end), (days, average, deviation, delta) in zip(request.segments, ranges, stats)
+        ]
+    )
+
+
+@app.post('/logs/compare')
+async def log_compare(
+        request: messages.CompareMessage,
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access)
+) -> responses.CompareResponse:
+    async with db_access.access() as wp:
+        manager = db.WatchRecordManager(auth_bundle.user)
+        watches = {watch.data.name: watch for watch in await manager.get_all_watches(wp.cursor)}
+        missing = [name for name in request.watch_names if name not in watches]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Watch {missing[0]} not found."
+            )
+        selected = [watches[name] for name in dict.fromkeys(request.watch_names)]
+        groups = await manager.get_logs_by_cycle(wp.cursor, selected, request.cycles)
+    names = {watch.data.watch_id: watch.data.name for watch in selected}
+    interpolation = interpolation_methods[request.interpolation.value]
+    rows = []
+    with metrics.frame_latency.labels('compare').time():
+        for (watch_id, cycle), table in groups.items():
+            frame = WatchLogFrame.from_table(('log_id', 'datetime', 'measure'), table)
+            average, deviation, delta = frame.fill(interpolation).stats()
+            fit = regression.least_squares([(record.time_as_float, record.measure) for record in frame.data])
+            rows.append(responses.CycleStatsResponse(
+                watch_name=names[watch_id],
+                cycle=cycle,
+                count=len(frame.data),
+                start=frame.data[0].datetime,
+                end=frame.data[-1].datetime,
+                average=average,
+                deviation=deviation,
+                delta=delta,
+                rate=round(fit.rate, 3) if fit is not None else None
+            ))
+    return responses.CompareResponse(
+        auth=utils.parse_auth_bundle(auth_bundle),
+        cycles=rows
+    )
 
 
 @app.post('/logs/delete')
 async def delete_measurement(
         request: messages.SpecifyLogDataMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        listeners: list[db.LogWriteListener] = Depends(get_log_write_listeners)
 ) -> responses.LoggedInResponse:
+    record = idempotency_record(auth_bundle, '/logs/delete', request)
     async with db_access.access() as wp:
+        if (out := await replay(record, wp.cursor, auth_bundle, responses.LoggedInResponse)) is not None:
+            return out
         try:
             watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
         except db.exceptions.OperationError:
@@ -262,21 +710,25 @@ async def delete_measurement(
                 detail=f"Watch {request.watch_name} not found."
             )
         try:
-            log = await db.LogRecordManager(watch).get_log_by_id(wp.cursor, request.cycle, request.log_id)
+            log = await db.LogRecordManager(watch, listeners).get_log_by_id(wp.cursor, request.cycle, request.log_id)
         except db.exceptions.OperationError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Log with id {request.log_id} does not exist in this cycle."
             )
         await log.delete(wp.cursor)
+        out = responses.LoggedInResponse(auth=utils.parse_auth_bundle(auth_bundle))
+        await remember(record, wp.cursor, out)
         await wp.commit()
-    return responses.LoggedInResponse(auth=utils.parse_auth_bundle(auth_bundle))
+    return out
 
 
 @app.post('/logs/del_cycle')
 async def delete_cycle(
         request: messages.SpecifyWatchDataMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        listeners: list[db.LogWriteListener] = Depends(get_log_write_listeners)
 ) -> responses.LoggedInResponse:
     async with db_access.access() as wp:
         try:
@@ -288,7 +740,7 @@ async def delete_cycle(
             )
 
         try:
-            await db.LogRecordManager(watch).delete_logs(wp.cursor, request.cycle)
+            await db.LogRecordManager(watch, listeners).delete_logs(wp.cursor, request.cycle)
         except db.exceptions.OperationError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -301,9 +753,14 @@ async def delete_cycle(
 @app.post('/logs/add')
 async def add_measurement(
         request: messages.CreateMeasurementMessage,
-        auth_bundle: security.AuthBundle = Depends(sec_functions.get_user)
+        auth_bundle: security.AuthBundle = Depends(get_user),
+        db_access: db.DBAccess = Depends(get_db_access),
+        listeners: list[db.LogWriteListener] = Depends(get_log_write_listeners)
 ) -> responses.LogAddedResponse:
+    record = idempotency_record(auth_bundle, '/logs/add', request)
     async with db_access.access() as wp:
+        if (out := await replay(record, wp.cursor, auth_bundle, responses.LogAddedResponse)) is not None:
+            return out
         try:
             watch = await db.WatchRecordManager(auth_bundle.user).get_watch_by_name(wp.cursor, request.watch_name)
         except db.exceptions.OperationError:
@@ -319,11 +776,13 @@ async def add_measurement(
                 else request.datetime.replace(tzinfo=timezone.utc),
             measure=round(request.measure, 2)
         )
-        log = await db.LogRecordManager(watch).new_log(wp.cursor, request.cycle, new_log)
+        log = await db.LogRecordManager(watch, listeners).new_log(wp.cursor, request.cycle, new_log)
+        out = responses.LogAddedResponse(
+            auth=utils.parse_auth_bundle(auth_bundle),
+            log_id=log.data.log_id,
+            time=log.data.timedate,
+            measure=log.data.measure
+        )
+        await remember(record, wp.cursor, out)
         await wp.commit()
-    return responses.LogAddedResponse(
-        auth=utils.parse_auth_bundle(auth_bundle),
-        log_id=log.data.log_id,
-        time=log.data.timedate,
-        measure=log.data.measure
-    )
+    return out
@@ -0,0 +1,247 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Iterator, TypeVar
+import functools
+
+# Metrics are kept per worker process and exposed in the Prometheus text format on /metrics.
+
+M = TypeVar('M', bound='Metric')
+F = TypeVar('F', bound=Callable)
+
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Metric(ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, description: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], Metric] = {}
+
+    def _new_child(self) -> Metric:
+        return self.__class__(self.name, self.description)
+
+    def labels(self, *values: str) -> Metric:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}.')
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        ...
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        children = self._children.items() if self.labelnames else [((), self)]
+        for values, child in children:
+            for suffix, extra, value in child._samples():
+                lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, description, labelnames)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        yield '', '', self.value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, description, labelnames)
+        self.value = 0.0
+        self.function: Callable[[], float] | None = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        # evaluated on every scrape instead of the stored value
+        self.function = function
+
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        yield '', '', self.function() if self.function is not None else self.value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self,
+                 name: str,
+                 description: str,
+                 labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+
+    def _new_child(self) -> Histogram:
+        return Histogram(self.name, self.description, buckets=self.buckets[:-1])
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield '_bucket', f'le="{_format_value(bound)}"', cumulative
+        yield '_sum', '', self.sum
+        yield '_count', '', cumulative
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} already registered.')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.', ('method', 'route', 'status')
+))
+db_query_latency = registry.register(Histogram(
+    'db_query_duration_seconds', 'Time spent in a record manager method.', ('method',)
+))
+db_connections_open = registry.register(Gauge(
+    'db_connections_open', 'Database connections currently open by this process.'
+))
+db_connections_in_use = registry.register(Gauge(
+    'db_connections_in_use', 'Database connections currently handed out to requests.'
+))
+db_connections_opened = registry.register(Counter(
+    'db_connections_opened_total', 'Database connections opened by this process.'
+))
+password_hash_latency = registry.register(Histogram(
+    'password_hash_duration_seconds', 'Time spent hashing or verifying passwords.', ('operation',),
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5)
+))
+password_hashes_in_progress = registry.register(Gauge(
+    'password_hashes_in_progress', 'Passwords being hashed or verified by this process.'
+))
+password_rehashed = registry.register(Counter(
+    'password_rehashed_total', 'Password hashes updated to the configured rounds at login.'
+))
+password_hash_rounds = registry.register(Gauge(
+    'password_hash_rounds', 'bcrypt rounds new password hashes are made with.'
+))
+login_rejected = registry.register(Counter(
+    'login_rejected_total', 'Login and registration attempts refused with 429 before hashing.', ('reason',)
+))
+frame_latency = registry.register(Histogram(
+    'frame_processing_duration_seconds', 'Time spent building and processing log frames.', ('operation',)
+))
+token_reaper_deleted = registry.register(Gauge(
+    'token_reaper_deleted_tokens', 'Expired tokens deleted by this process since it started.'
+))
+token_reaper_lag = registry.register(Gauge(
+    'token_reaper_lag_seconds', 'How long the oldest token had been expired at the last reaper run.'
+))
+revoked_tokens = registry.register(Gauge(
+    'revoked_tokens', 'Revoked signed token sessions and users known to this process.'
+))
+
+
+def timed(histogram: Histogram) -> Callable[[F], F]:
+    # times a coroutine function, labelled with its qualified name
+    def decorator(func: F) -> F:
+        child = histogram.labels(func.__qualname__)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            request_latency.labels(
+                scope['method'],
+                route.path if route is not None else 'unmatched',
+                str(status_code)
+            ).observe(perf_counter() - start)
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterator
+import math
+
+from fastapi import HTTPException, status
+
+from .metrics import login_rejected, password_hashes_in_progress
+
+# Everything here is kept per worker process, a client spreading its attempts over the workers gets
+# as many times the limits. Bcrypt is what a password sprayer makes us spend, so attempts are
+# rejected before it is done.
+
+
+class TokenBucketLimiter:
+    # One bucket of `burst` tokens per key, refilled at `rate_per_minute`. Past max_keys the least
+    # recently used bucket is dropped, mostly one that would have been full again by now anyway.
+
+    def __init__(self, rate_per_minute: float, burst: int | None = None, max_keys: int = 10_000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst if burst is not None else max(1, math.ceil(rate_per_minute))
+        self.max_keys = max_keys
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def acquire(self, key: str, now: float | None = None) -> float:
+        # takes a token, returns 0 when there was one and the seconds until there is one otherwise
+        now = monotonic() if now is None else now
+        if key in self.buckets:
+            tokens, last = self.buckets[key]
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            self.buckets.move_to_end(key)
+        else:
+            tokens = self.burst
+            if len(self.buckets) >= self.max_keys:
+                self.buckets.popitem(last=False)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+        self.buckets[key] = (tokens - 1, now)
+        return 0.0
+
+
+class HashAdmission:
+    # A cap on the password hashes running at once in this process. Hashes over it are refused
+    # rather than queued, a queue would only make every login slow while the CPU is saturated.
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_progress = 0
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        if self.in_progress >= self.limit:
+            login_rejected.labels('hashing').inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Server busy, try again later.",
+                headers={'Retry-After': '1'}
+            )
+        self.in_progress += 1
+        password_hashes_in_progress.inc()
+        try:
+            yield
+        finally:
+            self.in_progress -= 1
+            password_hashes_in_progress.dec()
+
+
+class LoginLimiter:
+
+    def __init__(self, user_rate_per_minute: float, client_rate_per_minute: float, max_hashes: int):
+        self.users = TokenBucketLimiter(user_rate_per_minute)
+        self.clients = TokenBucketLimiter(client_rate_per_minute)
+        self.hashes = HashAdmission(max_hashes)
+
+    @staticmethod
+    def _reject(reason: str, retry_after: float):
+        login_rejected.labels(reason).inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later.",
+            headers={'Retry-After': str(math.ceil(retry_after))}
+        )
+
+    def check(self, user_name: str | None, client: str | None):
+        # the client first, a sprayer trying many user names does not use up their buckets
+        if client is not None and (retry_after := self.clients.acquire(client)):
+            self._reject('client', retry_after)
+        if user_name is not None and (retry_after := self.users.acquire(user_name)):
+            self._reject('user', retry_after)
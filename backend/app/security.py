@@ -1,22 +1,72 @@
+import math
 import secrets
+from contextlib import nullcontext
+from time import perf_counter
 from datetime import datetime, timedelta, timezone
 
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from mysql.connector.aio.cursor import MySQLCursor
 from pydantic import BaseModel
 
-from .db import UserRecord, TokenRecord, NewToken, DBAccess, OperationError, NewUser, ConstraintError
+from .db import UserRecord, TokenRecord, NewToken, DBAccess, OperationError, NewUser, ConstraintError, ExistingUser
 from communication import messages
+from .metrics import password_hash_latency, password_rehashed
+from .tokens import TokenSigner, RevocationList, SignedToken, is_signed
+from .ratelimit import LoginLimiter
+
+def password_context(rounds: int | None = None, spread: int = 0) -> CryptContext:
+    # Hashes with fewer than rounds or more than rounds + spread rounds need an update, they are
+    # rehashed with rounds at the next successful login.
+    if rounds is None:
+        return CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds,
+                        bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds + spread)
+
+
+pwd_context = password_context()
+
+
+def set_password_rounds(rounds: int, spread: int = 0):
+    global pwd_context
+    pwd_context = password_context(rounds, spread)
+
+
+def calibrate_rounds(target_seconds: float, min_rounds: int, max_rounds: int, probe_rounds: int = 8) -> int:
+    # Every round doubles the cost, so the rounds fitting the target are extrapolated from a cheap hash.
+    # Blocks for a few cheap hashes, the best of them counts.
+    context = password_context(probe_rounds)
+    context.hash('calibration')
+    seconds = min(_timed_hash(context) for _ in range(3))
+    rounds = probe_rounds + math.floor(math.log2(target_seconds / seconds))
+    return max(min_rounds, min(max_rounds, rounds))
+
+
+def _timed_hash(context: CryptContext) -> float:
+    start = perf_counter()
+    context.hash('calibration')
+    return perf_counter() - start
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    with password_hash_latency.labels('hash').time():
+        return pwd_context.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with password_hash_latency.labels('verify').time():
+        return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    # the new hash when the password is right but hashed with other rounds than configured
+    with password_hash_latency.labels('verify').time():
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _hashing(limiter: LoginLimiter | None):
+    return limiter.hashes.admit() if limiter is not None else nullcontext()
 
 
 async def create_token(cursor: MySQLCursor, user_id: int, expiration_minutes: int) -> TokenRecord:
@@ -37,15 +87,78 @@ async def update_token(cursor: MySQLCursor, token: TokenRecord, expiration_minut
     return token
 
 
+class SignedTokenRecord:
+    # Stands in for TokenRecord when tokens are signed, nothing is stored for it.
+    # Deleting it revokes its session.
+
+    def __init__(self, token: SignedToken, value: str, revocations: RevocationList):
+        self.token = token
+        self.data = NewToken(user_id=token.user_id, token=value, expiration=token.expiration)
+        self.revocations = revocations
+
+    async def delete(self, cursor: MySQLCursor):
+        await self.revocations.revoke(cursor, self.token.user_id, self.token.session)
+
+
+class AuthBundle(BaseModel):
+    user: UserRecord
+    token: TokenRecord | SignedTokenRecord
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class SignedTokens:
+
+    def __init__(self, signer: TokenSigner, revocations: RevocationList):
+        self.signer = signer
+        self.revocations = revocations
+
+    def create(self, user: UserRecord, expiration_minutes: int) -> SignedTokenRecord:
+        token = SignedToken(
+            user_id=user.data.user_id,
+            user_name=user.data.user_name,
+            session=secrets.token_bytes(16),
+            started=datetime.now(timezone.utc).replace(microsecond=0),
+            expiration=self.signer.expiration(expiration_minutes)
+        )
+        return SignedTokenRecord(token, self.signer.sign(token), self.revocations)
+
+    def check(self, token_value: str, expiration_minutes: int | None) -> AuthBundle:
+        try:
+            token = self.signer.verify(token_value)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalid or expired.")
+        if token.expiration < datetime.now(timezone.utc):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Expired token.")
+        if self.revocations.is_revoked(token):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalid or expired.")
+        if expiration_minutes is not None:
+            # sliding expiration, the client takes the reissued token from the AuthResponse
+            expiration = self.signer.expiration(expiration_minutes)
+            if expiration > token.expiration:
+                token = token._replace(expiration=expiration)
+                token_value = self.signer.sign(token)
+        # only the id and the name of the user are known without reading users
+        user = UserRecord(ExistingUser.model_construct(user_id=token.user_id, user_name=token.user_name))
+        return AuthBundle(user=user, token=SignedTokenRecord(token, token_value, self.revocations))
+
+
 class CreateUserCreator:
 
-    def __init__(self, db_access: DBAccess):
+    def __init__(self, db_access: DBAccess, limiter: LoginLimiter | None = None):
         self.access = db_access
-
-    async def create_user(self, request: messages.UserRegisterMessage) -> UserRecord:
+        self.limiter = limiter
+
+    async def create_user(self, request: messages.UserRegisterMessage, client: str | None = None) -> UserRecord:
+        if self.limiter is not None:
+            self.limiter.check(None, client)
+        # bcrypt runs in the threadpool, the event loop keeps serving other requests meanwhile
+        with _hashing(self.limiter):
+            password_hash = await run_in_threadpool(hash_password, request.password)
         new_user = NewUser(
             user_name=request.user_name,
-            password_hash=hash_password(request.password),
+            password_hash=password_hash,
             date_of_creation=datetime.now(timezone.utc)
         )
         async with self.access.access() as wp:
@@ -57,56 +170,85 @@ class CreateUserCreator:
             await wp.commit()
         return user
 
-    async def __call__(self, request: messages.UserRegisterMessage) -> UserRecord:
-        return await self.create_user(request)
+    async def __call__(self, request: messages.UserRegisterMessage, client: str | None = None) -> UserRecord:
+        return await self.create_user(request, client)
 
 
 
 class LoginUserCreator:
 
-    def __init__(self, db_access: DBAccess):
+    def __init__(self,
+                 db_access: DBAccess,
+                 signed_tokens: SignedTokens | None = None,
+                 limiter: LoginLimiter | None = None):
         self.access = db_access
-
-    async def login_user(self, request: messages.UserLoginMessage) -> tuple[UserRecord, TokenRecord]:
+        self.signed_tokens = signed_tokens
+        self.limiter = limiter
+
+    async def login_user(self,
+                         request: messages.UserLoginMessage,
+                         client: str | None = None) -> tuple[UserRecord, TokenRecord | SignedTokenRecord]:
+        # attempts over the limits get a 429 before the user is looked up or anything is hashed
+        if self.limiter is not None:
+            self.limiter.check(request.user_name, client)
         async with self.access.access() as wp:
             try:
                 user = await UserRecord.get_user_by_name(wp.cursor, request.user_name)
             except OperationError:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                     detail=f"No user with name '{request.user_name}'.")
-            if not verify_password(request.password, user.data.password_hash):
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                    detail=f"Wrong password for user {request.user_name}.")
+            await wp.rollback()
+        # no connection is held while hashing, a slow hash must not keep one from other requests
+        with _hashing(self.limiter):
+            verified, new_hash = await run_in_threadpool(
+                verify_and_update_password, request.password, user.data.password_hash
+            )
+        if not verified:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail=f"Wrong password for user {request.user_name}.")
+        if new_hash is None and self.signed_tokens is not None:
+            return user, self.signed_tokens.create(user, request.expiration_minutes)
+        async with self.access.access() as wp:
+            if new_hash is not None:
+                user.data.password_hash = new_hash
+                await user.update(wp.cursor)
+                password_rehashed.inc()
+            if self.signed_tokens is not None:
+                await wp.commit()
+                return user, self.signed_tokens.create(user, request.expiration_minutes)
             token = await create_token(wp.cursor, user.data.user_id, request.expiration_minutes)
             await wp.commit()
         return user, token
 
-    async def __call__(self, request: messages.UserLoginMessage) -> tuple[UserRecord, TokenRecord]:
-        return await self.login_user(request)
-
-
-class AuthBundle(BaseModel):
-    user: UserRecord
-    token: TokenRecord
-
-    class Config:
-        arbitrary_types_allowed = True
+    async def __call__(self,
+                       request: messages.UserLoginMessage,
+                       client: str | None = None) -> tuple[UserRecord, TokenRecord | SignedTokenRecord]:
+        return await self.login_user(request, client)
 
 
 class GetUserCreator:
 
-    def __init__(self, db_access: DBAccess):
+    def __init__(self, db_access: DBAccess, signed_tokens: SignedTokens | None = None):
         self.access = db_access
+        self.signed_tokens = signed_tokens
 
     async def get_user(self, request: messages.LoggedInUserMessage) -> AuthBundle:
+        return await self.get_user_by_token(request.auth.token, request.auth.expiration_minutes)
+
+    async def get_user_by_token(self, token_value: str, expiration_minutes: int | None) -> AuthBundle:
+        # without expiration_minutes the token is only checked, not extended
+        if self.signed_tokens is not None and is_signed(token_value):
+            return self.signed_tokens.check(token_value, expiration_minutes)
+        # tokens from session_token are still accepted after signing is turned on
         async with self.access.access() as wp:
             try:
-                token = await TokenRecord.get_token_by_value(wp.cursor, request.auth.token)
+                token = await TokenRecord.get_token_by_value(wp.cursor, token_value)
             except OperationError:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token invalid or expired.")
             if token.data.expiration < datetime.now(timezone.utc):
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Expired token.")
-            await update_token(wp.cursor, token, request.auth.expiration_minutes)
+            if expiration_minutes is not None:
+                await update_token(wp.cursor, token, expiration_minutes)
             user = await UserRecord.get_user_by_id(wp.cursor, token.data.user_id)
             await wp.commit()
         return AuthBundle(user=user, token=token)
@@ -117,7 +259,16 @@ class GetUserCreator:
 
 class SecurityCreator:
 
-    def __init__(self, db_access: DBAccess):
-        self.get_user = GetUserCreator(db_access)
-        self.login_user = LoginUserCreator(db_access)
-        self.register_user = CreateUserCreator(db_access)
+    def __init__(self,
+                 db_access: DBAccess,
+                 signed_tokens: SignedTokens | None = None,
+                 limiter: LoginLimiter | None = None):
+        self.signed_tokens = signed_tokens
+        self.get_user = GetUserCreator(db_access, signed_tokens)
+        self.login_user = LoginUserCreator(db_access, signed_tokens, limiter)
+        self.register_user = CreateUserCreator(db_access, limiter)
+
+    async def revoke_user(self, cursor: MySQLCursor, user: UserRecord):
+        # session tokens go with the user, signed ones have to be revoked
+        if self.signed_tokens is not None:
+            await self.signed_tokens.revocations.revoke(cursor, user.data.user_id, None)
@@ -18,3 +18,54 @@ DATABASE_CONFIG = {
     'host': _get_env_raise('DB_HOST'),
     'database': _get_env_raise('MYSQL_DATABASE'),
 }
+
+# connections kept open by each worker process, 0 opens a new connection per request
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+
+# statements running longer than this are logged to the 'app.db.slow' logger
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.5'))
+
+# cycles without a new log for this many days are moved to the archive table
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+
+# frames cached by each worker, counted in rows of the cached frames
+FRAME_CACHE_ROWS = int(os.getenv('FRAME_CACHE_ROWS', '200000'))
+
+# host:port of scripts/cache_server.py to share the frame cache between workers, empty keeps it per worker
+FRAME_CACHE_URL = os.getenv('FRAME_CACHE_URL', '')
+
+# responses at least this long are gzipped for clients that accept it, below about one packet it does not pay off
+GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', '1400'))
+
+# 1-9, level 1 already gets most of the size reduction on log lists for a fraction of the CPU time
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '1'))
+
+# how long the response to a write request with an idempotency key is kept for retries of it
+IDEMPOTENCY_KEY_HOURS = int(os.getenv('IDEMPOTENCY_KEY_HOURS', '24'))
+
+# GET reads may be served from a client or proxy cache for this long before they are revalidated
+READ_CACHE_SECONDS = int(os.getenv('READ_CACHE_SECONDS', '0'))
+
+# 'id:key,id:key' to give out signed tokens checked without the database, the first key signs and the
+# others are still accepted, empty keeps tokens in session_token; keys are at least 32 characters
+TOKEN_SIGNING_KEYS = os.getenv('TOKEN_SIGNING_KEYS', '')
+
+# signed tokens are not extended past this, revocations of them are kept as long
+SIGNED_TOKEN_MAX_MINUTES = int(os.getenv('SIGNED_TOKEN_MAX_MINUTES', '43200'))
+
+# how often every worker reads new revocations of signed tokens
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv('TOKEN_REVOCATION_SYNC_SECONDS', '10'))
+
+# login attempts per user name and per client address, beyond them logins get 429 until the bucket refills
+LOGIN_ATTEMPTS_PER_MINUTE = float(os.getenv('LOGIN_ATTEMPTS_PER_MINUTE', '10'))
+LOGIN_CLIENT_ATTEMPTS_PER_MINUTE = float(os.getenv('LOGIN_CLIENT_ATTEMPTS_PER_MINUTE', '60'))
+
+# passwords hashed or verified at once by each worker, logins and registrations over it get 429
+MAX_CONCURRENT_HASHES = int(os.getenv('MAX_CONCURRENT_HASHES', str(os.cpu_count() or 1)))
+
+# bcrypt rounds of password hashes, 0 picks them at startup so that a hash takes about BCRYPT_TARGET_MS
+# on this machine, within BCRYPT_MIN_ROUNDS and BCRYPT_MAX_ROUNDS; every round doubles the cost
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '0'))
+BCRYPT_TARGET_MS = float(os.getenv('BCRYPT_TARGET_MS', '250'))
+BCRYPT_MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', '10'))
+BCRYPT_MAX_ROUNDS = int(os.getenv('BCRYPT_MAX_ROUNDS', '15'))
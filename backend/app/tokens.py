@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, NoReturn
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import re
+
+from mysql.connector.aio.cursor import MySQLCursor
+
+from .db import DBAccess, RevocationRecord, NewRevocation
+
+logger = logging.getLogger(__name__)
+
+# Signed tokens carry the user and their expiration, checking one needs neither session_token nor
+# users. A token is 'w1.<key id>.<payload>.<signature>', the payload being
+# '<user id>:<session>:<started>:<expiration>:<user name>' with the times in unix seconds, and the
+# signature an HMAC-SHA256 of everything before it, both base64url encoded.
+# The first key signs and all keys are accepted. To rotate, a new key is put first and the old one
+# is removed once the tokens signed with it have expired; reissued tokens are signed with the new key.
+
+prefix = 'w1'
+min_key_length = 32
+_key_id = re.compile(r'^[A-Za-z0-9_-]{1,16}$')
+
+
+class SignedToken(NamedTuple):
+    user_id: int
+    user_name: str
+    # random, kept when the token is reissued so that revoking it revokes every reissue
+    session: bytes
+    started: datetime
+    expiration: datetime
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _timestamp(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+def _datetime(value: str) -> datetime:
+    return datetime.fromtimestamp(int(value), timezone.utc)
+
+
+def is_signed(value: str) -> bool:
+    return value.startswith(prefix + '.')
+
+
+class TokenSigner:
+
+    def __init__(self, keys: dict[str, bytes], max_minutes: int):
+        if not keys:
+            raise ValueError('At least one signing key is needed.')
+        for key_id, key in keys.items():
+            if not _key_id.match(key_id):
+                raise ValueError(f"Invalid signing key id '{key_id}'.")
+            if len(key) < min_key_length:
+                raise ValueError(f"Signing key '{key_id}' is shorter than {min_key_length} bytes.")
+        self.keys = keys
+        self.key_id = next(iter(keys))
+        self.max_minutes = max_minutes
+
+    @classmethod
+    def from_setting(cls, value: str, max_minutes: int) -> 'TokenSigner | None':
+        # 'id:key,id:key', the first key signs, None when no key is set
+        keys = {}
+        for item in filter(None, (item.strip() for item in value.split(','))):
+            key_id, sep, key = item.partition(':')
+            if not sep:
+                raise ValueError(f"Signing key '{key_id}' has no id.")
+            keys[key_id] = key.encode()
+        return cls(keys, max_minutes) if keys else None
+
+    def expiration(self, minutes: int) -> datetime:
+        # lifetimes are capped so that revocations can be dropped after max_minutes
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        return now + timedelta(minutes=min(minutes, self.max_minutes))
+
+    def _signature(self, key_id: str, message: str) -> str:
+        return _b64encode(hmac.new(self.keys[key_id], message.encode(), hashlib.sha256).digest())
+
+    def sign(self, token: SignedToken) -> str:
+        payload = ':'.join((str(token.user_id), token.session.hex(), str(_timestamp(token.started)),
+                            str(_timestamp(token.expiration)), token.user_name))
+        message = f'{prefix}.{self.key_id}.{_b64encode(payload.encode())}'
+        return f'{message}.{self._signature(self.key_id, message)}'
+
+    def verify(self, value: str) -> SignedToken:
+        # raises ValueError for anything not signed with one of the keys, expiration is left to the caller
+        parts = value.split('.')
+        if len(parts) != 4 or parts[0] != prefix or parts[1] not in self.keys:
+            raise ValueError('Unknown token format or key.')
+        version, key_id, payload, signature = parts
+        if not hmac.compare_digest(signature, self._signature(key_id, f'{version}.{key_id}.{payload}')):
+            raise ValueError('Wrong token signature.')
+        user_id, session, started, expiration, user_name = _b64decode(payload).decode().split(':', 4)
+        return SignedToken(int(user_id), user_name, bytes.fromhex(session), _datetime(started), _datetime(expiration))
+
+
+class RevocationList:
+    # Every worker keeps the revocations in memory and brings them up to date from token_revocation
+    # every interval, a token revoked through another worker is accepted here until then.
+    # Each sync reads back a margin before the previous one for revocations committed late.
+    margin = timedelta(minutes=1)
+
+    def __init__(self, db_access: DBAccess, keep_minutes: int, interval_seconds: float):
+        self.access = db_access
+        # tokens revoked now may have been reissued until then by workers that did not know yet
+        self.keep = timedelta(minutes=keep_minutes) + self.margin + timedelta(seconds=interval_seconds)
+        self.interval = interval_seconds
+        self.sessions: dict[bytes, datetime] = {}
+        # user id -> (revoked_at, expiration), sessions of the user started until revoked_at are revoked
+        self.users: dict[int, tuple[datetime, datetime]] = {}
+        self.last_sync: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self.sessions) + len(self.users)
+
+    def is_revoked(self, token: SignedToken) -> bool:
+        if token.session in self.sessions:
+            return True
+        revoked = self.users.get(token.user_id)
+        return revoked is not None and token.started <= revoked[0]
+
+    def add(self, revocation: NewRevocation):
+        if revocation.session is not None:
+            self.sessions[revocation.session] = revocation.expiration
+        else:
+            known = self.users.get(revocation.user_id)
+            if known is None or known[0] < revocation.revoked_at:
+                self.users[revocation.user_id] = (revocation.revoked_at, revocation.expiration)
+
+    async def revoke(self, cursor: MySQLCursor, user_id: int, session: bytes | None):
+        # session None revokes every session of the user started until now
+        now = datetime.now(timezone.utc)
+        revocation = NewRevocation(user_id=user_id, session=session, revoked_at=now, expiration=now + self.keep)
+        await RevocationRecord.new_revocation(cursor, revocation)
+        self.add(revocation)
+
+    def prune(self, now: datetime):
+        self.sessions = {session: expiration for session, expiration in self.sessions.items() if expiration > now}
+        self.users = {user_id: revoked for user_id, revoked in self.users.items() if revoked[1] > now}
+
+    async def sync(self) -> int:
+        now = datetime.now(timezone.utc)
+        since = None if self.last_sync is None else self.last_sync - self.margin
+        async with self.access.access() as wp:
+            records = await RevocationRecord.get_revocations(wp.cursor, now, since)
+            await wp.commit()
+        for record in records:
+            self.add(record.data)
+        self.prune(now)
+        self.last_sync = now
+        return len(records)
+
+    async def daemon(self) -> NoReturn:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:
+                # the list stays as it was, the next sync reads back from the last successful one
+                logger.exception('Revocation list sync failed.')
+
+    async def __call__(self) -> NoReturn:
+        await self.daemon()
@@ -1,9 +1,19 @@
+from datetime import datetime, timezone
+
 from communication.responses import AuthResponse
-from .security import AuthBundle
+from .security import AuthBundle, SignedTokenRecord
 
 
 def parse_auth_bundle(auth_bundle: AuthBundle) -> AuthResponse:
+    # signed tokens are reissued when they are extended, the client has to use the new one
+    signed = isinstance(auth_bundle.token, SignedTokenRecord)
     return AuthResponse(
         user=auth_bundle.user.data.user_name,
-        expiration_date=auth_bundle.token.data.expiration
+        expiration_date=auth_bundle.token.data.expiration,
+        token=auth_bundle.token.data.token if signed else None
     )
+
+
+def as_utc(value: datetime) -> datetime:
+    # naive datetimes are taken to be in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
@@ -0,0 +1,73 @@
+"""Bytes against CPU time of compressing log list responses.
+
+Encodes realistic cycles as /logs/list and /logs/fill would, in JSON and in the columnar layout,
+and gzips them at several levels. Run from the backend directory:
+
+    python -m benchmarks.compression --sizes 1000 100000 --levels 1 5 9
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import gzip
+import random
+
+from communication import responses
+from app.data_manipulation.log import WatchLogFrame
+from app.data_manipulation.interpolation import LinearInterpolation
+from app.encoding import encode_logs, log_list_response
+from . import results
+from .frames import make_table, headers, measure
+
+auth = responses.AuthResponse(user='benchmark', expiration_date=datetime(2030, 1, 1, tzinfo=timezone.utc))
+
+
+def bodies(table: list[tuple]) -> dict[str, bytes]:
+    frame = WatchLogFrame.from_table(headers, table)
+    listed = frame.flag_outliers().get_log_with_dif()
+    filled = frame.fill(LinearInterpolation).get_log_with_dif()
+    return {
+        f'{kind}_{encoding}': log_list_response(auth, encode_logs(f, binary=encoding == 'columnar')).body
+        for kind, f in (('list', listed), ('fill', filled))
+        for encoding in ('json', 'columnar')
+    }
+
+
+def run(sizes: list[int], pattern: str, levels: list[int], repeat: int, seed: int) -> dict[str, dict[str, float]]:
+    out = {}
+    for size in sorted(sizes):
+        for name, body in bodies(make_table(size, pattern, random.Random(seed))).items():
+            for level in [0] + levels:
+                key = f'{name}[{size},gzip{level}]'
+                if level == 0:
+                    compressed, seconds = body, 0.0
+                else:
+                    compressed = gzip.compress(body, level)
+                    seconds = measure(lambda: gzip.compress(body, level), repeat, 5)
+                out[key] = {
+                    'bytes': len(compressed),
+                    'ratio': round(len(body) / len(compressed), 2),
+                    'ms': round(seconds * 1000, 3),
+                    'mb_per_s': round(len(body) / seconds / 2**20, 1) if seconds else None
+                }
+                print(f'{key:40s} {len(compressed):12d} B {out[key]["ratio"]:7.2f}x {out[key]["ms"]:10.3f} ms')
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Size and time of compressed log list responses.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000, 100_000],
+                        help='Numbers of logs in the encoded cycles.')
+    parser.add_argument('--pattern', default='random', help='Gap pattern between logs: regular, random, bursty.')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 3, 5, 6, 9], help='gzip levels to compare.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the best one counts.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data.')
+    parser.add_argument('--output', type=Path, help='File to save the results to.')
+    args = parser.parse_args()
+
+    out = run(args.sizes, args.pattern, args.levels, args.repeat, args.seed)
+    if args.output:
+        results.save(args.output, {k: v for k, v in vars(args).items() if k != 'output'}, out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Microbenchmarks of the data_manipulation hot paths.
+
+Times frame construction, differences, fills, stats, the interpolation classes and log encoding for cycles
+from 10 to 1M logs and several gap patterns. Run from the backend directory:
+
+    python -m benchmarks.frames --sizes 10 1000 100000 --record
+    python -m benchmarks.frames --compare
+
+`--record` appends the run to benchmarks/history/frames.jsonl, `--compare` checks the run
+against the last recorded one and exits with an error on a regression.
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
+import argparse
+import random
+import sys
+import time
+
+from app.data_manipulation.log import WatchLogFrame
+from app.data_manipulation.interpolation import LinearInterpolation, QubicSplineInterpolation
+from app.encoding import encode_logs
+from . import results
+
+history_file = Path(__file__).parent / 'history' / 'frames.jsonl'
+
+headers = ('log_id', 'datetime', 'measure')
+
+
+def make_table(size: int, pattern: str, rng: random.Random) -> list[tuple[int, datetime, float]]:
+    # a watch drifting by a few seconds a day, read with some noise
+    rate = rng.uniform(-8, 8) / (24 * 60 * 60)
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    offset = 0.0
+    table = []
+    for i in range(size):
+        if pattern == 'regular':
+            offset += 3600
+        elif pattern == 'random':
+            offset += max(60.0, rng.expovariate(1 / 3600))
+        elif pattern == 'bursty':
+            # readings a minute apart, then a pause of half a day
+            offset += 60 if i % 10 else 12 * 3600
+        else:
+            raise ValueError(f'Unknown gap pattern {pattern}.')
+        timedate = start + timedelta(seconds=int(offset))
+        table.append((i + 1, timedate, round(offset * rate + rng.gauss(0, 0.3), 2)))
+    return table
+
+
+def cases(table: list[tuple[int, datetime, float]]) -> dict[str, Callable[[], object]]:
+    frame = WatchLogFrame.from_table(headers, table)
+    points = [(record.time_as_float, record.measure) for record in frame.data]
+    linear = LinearInterpolation.calculate(points)
+    spline = QubicSplineInterpolation.calculate(points)
+    # evaluation is timed at the interior points, spaced like a daily fill would be
+    queries = [points[0][0] + (points[-1][0] - points[0][0]) * i / 1000 for i in range(1, 1000)]
+
+    listed = frame.flag_outliers().get_log_with_dif()
+
+    def stats(f: WatchLogFrame):
+        return f.average, f.standard_deviation, f.delta
+
+    out = {
+        'from_table': lambda: WatchLogFrame.from_table(headers, table),
+        'get_log_with_dif': frame.get_log_with_dif,
+        'fill_linear': lambda: frame.fill(LinearInterpolation),
+        'fill_spline': lambda: frame.fill(QubicSplineInterpolation),
+        'linear_calculate': lambda: LinearInterpolation.calculate(points),
+        'linear_evaluate_1000': lambda: linear.evaluate(queries),
+        'spline_calculate': lambda: QubicSplineInterpolation.calculate(points),
+        'spline_evaluate_1000': lambda: spline.evaluate(queries),
+        'encode_logs': lambda: encode_logs(listed),
+        'encode_logs_columnar': lambda: encode_logs(listed, binary=True),
+    }
+    if len(table) > 1:
+        out['stats'] = lambda: stats(frame)
+    return out
+
+
+def measure(function: Callable[[], object], repeat: int, budget: float) -> float:
+    # best of `repeat` runs, stops repeating once `budget` seconds were spent
+    best = float('inf')
+    spent = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent > budget:
+            break
+    return best
+
+
+def run(sizes: list[int], patterns: list[str], repeat: int, budget: float, seed: int) -> dict[str, dict[str, float]]:
+    out = {}
+    too_slow: set[tuple[str, str]] = set()
+    for size in sorted(sizes):
+        for pattern in patterns:
+            table = make_table(size, pattern, random.Random(seed))
+            for name, function in cases(table).items():
+                key = f'{name}[{pattern},{size}]'
+                if (name, pattern) in too_slow:
+                    print(f'{key:45s} skipped')
+                    continue
+                seconds = measure(function, repeat, budget)
+                out[key] = {'seconds': seconds, 'us_per_log': round(seconds / size * 1e6, 3)}
+                print(f'{key:45s} {seconds * 1000:12.3f} ms {out[key]["us_per_log"]:10.3f} us/log')
+                if seconds > budget:
+                    too_slow.add((name, pattern))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of frames, interpolation and stats.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1_000, 10_000, 100_000, 1_000_000],
+                        help='Numbers of logs in the benchmarked cycles.')
+    parser.add_argument('--patterns', nargs='+', default=['regular', 'random', 'bursty'],
+                        help='Gap patterns between logs: regular, random, bursty.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the best one counts.')
+    parser.add_argument('--budget', type=float, default=5,
+                        help='Seconds per case, slower cases are not run for larger sizes.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data.')
+    parser.add_argument('--record', action='store_true', help=f'Append the results to {history_file.name}.')
+    parser.add_argument('--compare', action='store_true', help='Compare with the last recorded results.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative slowdown reported as a regression.')
+    args = parser.parse_args()
+
+    baseline = results.last_history(history_file) if args.compare else None
+    if args.compare and baseline is None and not args.record:
+        sys.exit(f'No recorded results in {history_file} to compare with, record a run with --record first.')
+
+    out = run(args.sizes, args.patterns, args.repeat, args.budget, args.seed)
+
+    regressions = []
+    if baseline is not None:
+        regressions = results.compare(baseline, out, 'seconds', args.tolerance)
+    if args.record:
+        parameters = {k: v for k, v in vars(args).items() if k not in ('record', 'compare')}
+        results.append_history(history_file, parameters, out)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Load test of the backend with a realistic mix of requests.
+
+Seeds synthetic users, watches and long cycles straight into the database from `.env`, then
+drives the API at a fixed concurrency and reports throughput and latency percentiles per
+endpoint. Run from the backend directory, against a running server:
+
+    python -m benchmarks.load seed --users 20 --watches 3 --cycles 2 --days 730
+    python -m benchmarks.load run --url http://127.0.0.1:27712 --output load.json
+
+or in-process (the app is started in the benchmark's own event loop):
+
+    python -m benchmarks.load run --in-process --compare load.json
+
+All simulated users log in from one address, run the server with LOGIN_ATTEMPTS_PER_MINUTE and
+LOGIN_CLIENT_ATTEMPTS_PER_MINUTE raised well above the login rate of the run or logins get 429.
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import httpx
+
+from . import results
+
+password = 'bench_password'
+
+# endpoint -> relative frequency in the request mix
+default_mix = {
+    '/login': 1,
+    '/watch/list': 10,
+    '/logs/list': 20,
+    '/logs/fill': 10,
+    '/logs/stats': 10,
+    '/logs/add': 5,
+}
+
+
+def user_name(index: int) -> str:
+    return f'bench_user_{index}'
+
+
+def watch_name(index: int) -> str:
+    return f'bench_watch_{index}'
+
+
+async def seed(users: int, watches: int, cycles: int, days: int, logs_per_day: float, seed_value: int):
+    from app import db, security, settings
+
+    rng = random.Random(seed_value)
+    db_access = db.DBAccess(settings.DATABASE_CONFIG)
+    await db.db_migrate(db_access, *db.schema_files)
+    password_hash = security.hash_password(password)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    interval = timedelta(days=1 / logs_per_day)
+
+    async with db_access.access() as wp:
+        for u in range(users):
+            await wp.cursor.execute(
+                "INSERT INTO users (user_name, password_hash, date_of_creation) VALUES (%s, %s, %s)",
+                (user_name(u), password_hash, now)
+            )
+            user_id = wp.cursor.lastrowid
+            for w in range(watches):
+                await wp.cursor.execute(
+                    "INSERT INTO watch (user_id, name, date_of_creation) VALUES (%s, %s, %s)",
+                    (user_id, watch_name(w), now)
+                )
+                watch_id = wp.cursor.lastrowid
+                for cycle in range(1, cycles + 1):
+                    # a watch gaining or losing a few seconds a day, with reading noise and missed days
+                    rate = rng.uniform(-8, 8) / (24 * 60 * 60)
+                    start = now - timedelta(days=days * (cycles - cycle + 1))
+                    rows = []
+                    timedate = start
+                    while timedate < start + timedelta(days=days):
+                        if rng.random() > 0.1:
+                            measure = round((timedate - start).total_seconds() * rate + rng.gauss(0, 0.3), 2)
+                            rows.append((watch_id, cycle, timedate, measure))
+                        timedate += interval
+                    await wp.cursor.executemany(
+                        "INSERT INTO log (watch_id, cycle, timedate, measure) VALUES (%s, %s, %s, %s)",
+                        rows
+                    )
+            await wp.commit()
+    print(f'Seeded {users} users with {watches} watches of {cycles} cycles over {days} days each.')
+
+
+class VirtualUser:
+
+    def __init__(self, client: httpx.AsyncClient, index: int, watches: int, cycles: int, rng: random.Random):
+        self.client = client
+        self.name = user_name(index)
+        self.watches = watches
+        self.cycles = cycles
+        self.rng = rng
+        self.token: str | None = None
+
+    async def login(self) -> httpx.Response:
+        resp = await self.client.post('/login', json={
+            'user_name': self.name, 'password': password, 'expiration_minutes': 60
+        })
+        resp.raise_for_status()
+        self.token = resp.json()['token']
+        return resp
+
+    def _auth(self) -> dict:
+        return {'auth': {'token': self.token, 'expiration_minutes': 60}}
+
+    def _watch_data(self) -> dict:
+        return {
+            **self._auth(),
+            'watch_name': watch_name(self.rng.randrange(self.watches)),
+            'cycle': self.rng.randint(1, self.cycles)
+        }
+
+    async def request(self, endpoint: str) -> httpx.Response:
+        if endpoint == '/login':
+            return await self.login()
+        if endpoint == '/watch/list':
+            body = self._auth()
+        elif endpoint == '/logs/add':
+            body = {
+                **self._watch_data(),
+                'cycle': self.cycles,
+                'datetime': datetime.now(timezone.utc).isoformat(),
+                'measure': round(self.rng.uniform(-30, 30), 2)
+            }
+        else:
+            body = self._watch_data()
+        resp = await self.client.post(endpoint, json=body)
+        resp.raise_for_status()
+        return resp
+
+
+async def drive(client: httpx.AsyncClient,
+                users: int,
+                watches: int,
+                cycles: int,
+                concurrency: int,
+                duration: float,
+                mix: dict[str, int],
+                seed_value: int) -> dict[str, dict[str, float]]:
+    rng = random.Random(seed_value)
+    virtual_users = [VirtualUser(client, i % users, watches, cycles, random.Random(rng.random()))
+                     for i in range(concurrency)]
+    await asyncio.gather(*(user.login() for user in virtual_users))
+
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    latencies: dict[str, list[float]] = {e: [] for e in endpoints}
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def run_user(user: VirtualUser):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            endpoint = user.rng.choices(endpoints, weights)[0]
+            start = time.perf_counter()
+            try:
+                await user.request(endpoint)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies[endpoint].append(time.perf_counter() - start)
+
+    start = time.monotonic()
+    await asyncio.gather(*(run_user(user) for user in virtual_users))
+    elapsed = time.monotonic() - start
+
+    out = {endpoint: results.summarize(values, elapsed) for endpoint, values in latencies.items()}
+    out['total'] = results.summarize([v for values in latencies.values() for v in values], elapsed)
+    out['total']['errors'] = errors
+    return out
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    mix = dict(default_mix)
+    for item in args.mix or []:
+        endpoint, weight = item.split('=')
+        mix[endpoint] = int(weight)
+    mix = {e: w for e, w in mix.items() if w > 0}
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.in_process:
+        from app.main import app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=60) as client:
+                return await drive(client, args.users, args.watches, args.cycles, args.concurrency,
+                                   args.duration, mix, args.seed)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        return await drive(client, args.users, args.watches, args.cycles, args.concurrency,
+                           args.duration, mix, args.seed)
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--users', type=int, default=20, help='Number of synthetic users.')
+    common.add_argument('--watches', type=int, default=3, help='Watches per user.')
+    common.add_argument('--cycles', type=int, default=2, help='Cycles per watch.')
+    common.add_argument('--seed', type=int, default=0, help='Seed of the random generators.')
+
+    parser = argparse.ArgumentParser(description='Seed the database and load test the backend.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', parents=[common], help='Insert synthetic data into an empty database.')
+    seed_parser.add_argument('--days', type=int, default=730, help='Length of every cycle in days.')
+    seed_parser.add_argument('--logs_per_day', type=float, default=1, help='Average measurements per day.')
+
+    run_parser = commands.add_parser('run', parents=[common], help='Drive the request mix against the seeded data.')
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', type=str, help='URL of a running server.')
+    target.add_argument('--in-process', action='store_true', help='Run the app inside the benchmark.')
+    run_parser.add_argument('--concurrency', type=int, default=16, help='Concurrent virtual users.')
+    run_parser.add_argument('--duration', type=float, default=30, help='Seconds to run for.')
+    run_parser.add_argument('--mix', nargs='*', metavar='ENDPOINT=WEIGHT',
+                            help='Override the weight of endpoints in the mix, 0 removes one.')
+    run_parser.add_argument('--output', type=Path, default=None, help='Store the results in this JSON file.')
+    run_parser.add_argument('--compare', type=Path, default=None,
+                            help='Compare with the results stored in this JSON file.')
+    run_parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Relative p95 slowdown reported as a regression.')
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        asyncio.run(seed(args.users, args.watches, args.cycles, args.days, args.logs_per_day, args.seed))
+        return
+
+    out = asyncio.run(run(args))
+    for endpoint, summary in out.items():
+        print(f"{endpoint:15s} " + ' '.join(f'{k}={v}' for k, v in summary.items()))
+    if args.output is not None:
+        results.save(args.output, {k: v for k, v in vars(args).items() if not isinstance(v, Path)}, out)
+    if args.compare is not None and results.compare(results.load(args.compare), out, 'p95_ms', args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import platform
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    # None rather than NaN for no values, json.dumps would write NaN which is not JSON
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(latencies: list[float], elapsed: float | None = None) -> dict[str, float | None]:
+    out: dict[str, float | None] = {'count': len(latencies)}
+    for name, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+        value = percentile(latencies, fraction)
+        out[name] = None if value is None else round(value * 1000, 3)
+    if elapsed is not None:
+        out['throughput'] = round(len(latencies) / elapsed, 2)
+    return out
+
+
+def environment() -> dict[str, str]:
+    return {
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'node': platform.node(),
+    }
+
+
+def save(file: Path, parameters: dict, results: dict[str, dict[str, float]]):
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(json.dumps({
+        'environment': environment(),
+        'parameters': parameters,
+        'results': results
+    }, indent=4))
+
+
+def load(file: Path) -> dict[str, dict[str, float]]:
+    return json.loads(file.read_text())['results']
+
+
+def compare(baseline: dict[str, dict[str, float]],
+            current: dict[str, dict[str, float]],
+            metric: str,
+            tolerance: float) -> list[str]:
+    # prints the relative change of `metric` (positive is worse) and returns the names of the
+    # results that got worse by more than `tolerance`, 0.1 being 10%
+    higher_is_better = metric == 'throughput'
+    regressions = []
+    for name, values in current.items():
+        if name not in baseline or metric not in baseline[name] or metric not in values:
+            continue
+        old, new = baseline[name][metric], values[metric]
+        # an endpoint without requests in either run has nothing to compare
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if higher_is_better:
+            change = -change
+        marker = ' REGRESSION' if change > tolerance else ''
+        print(f'{name:40s} {metric} {old:12.3f} -> {new:12.3f} {change:+8.1%}{marker}')
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def append_history(file: Path, parameters: dict, results: dict[str, dict[str, float]]):
+    # one JSON document per line, the newest at the end
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with open(file, 'a') as f:
+        f.write(json.dumps({
+            'environment': environment(),
+            'parameters': parameters,
+            'results': results
+        }) + '\n')
+
+
+def last_history(file: Path) -> dict[str, dict[str, float]] | None:
+    if not file.exists():
+        return None
+    lines = [line for line in file.read_text().splitlines() if line.strip()]
+    return json.loads(lines[-1])['results'] if lines else None
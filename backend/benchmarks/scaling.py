@@ -0,0 +1,102 @@
+"""Throughput of the CPU bound /login endpoint for an increasing number of worker processes.
+
+Needs the database from `.env` to be reachable. Run from the backend directory:
+
+    python -m benchmarks.scaling --workers 1 2 4 8
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+backend_root = Path(__file__).parents[1].resolve()
+
+user = {'user_name': 'bench_scaling', 'password': 'bench_password'}
+
+
+async def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get('/ready')).status_code == 200:
+                    await client.post('/register', json=user)
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f'Server at {url} did not start.')
+
+
+async def measure(url: str, concurrency: int, duration: float) -> float:
+    done = 0
+    deadline = time.monotonic() + duration
+    body = {**user, 'expiration_minutes': 10}
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal done
+        while time.monotonic() < deadline:
+            resp = await client.post('/login', json=body)
+            resp.raise_for_status()
+            done += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.monotonic()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.monotonic() - start
+    return done / elapsed
+
+
+def run_server(workers: int, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, 'scripts/serve.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)],
+        cwd=backend_root,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+async def run(worker_counts: list[int], port: int, concurrency_per_worker: int, duration: float) -> list[dict]:
+    url = f'http://127.0.0.1:{port}'
+    results = []
+    for workers in worker_counts:
+        server = run_server(workers, port)
+        try:
+            await wait_until_up(url)
+            throughput = await measure(url, workers * concurrency_per_worker, duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        base = results[0]['throughput'] / results[0]['workers'] if results else throughput / workers
+        results.append({
+            'workers': workers,
+            'throughput': round(throughput, 2),
+            'efficiency': round(throughput / (base * workers), 3)
+        })
+        print(f"workers={workers:3d} logins/s={throughput:9.2f} efficiency={results[-1]['efficiency']:.3f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how /login throughput scales with worker processes.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to measure.')
+    parser.add_argument('--port', type=int, default=27799, help='Port for the server under test.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients per worker.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to measure each worker count.')
+    parser.add_argument('--output', type=Path, default=None, help='Write the results to this JSON file.')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.workers, args.port, args.concurrency, args.duration))
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
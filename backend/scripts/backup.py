@@ -1,12 +1,16 @@
 import argparse
+from datetime import datetime, timezone
 from enum import Enum
 from pathlib import Path
 import sqlite3
+import struct
 
 from mysql.connector import connect
 
 schema_root = (Path(__file__).parents[1] / 'app' / 'db' / 'schema').resolve()
-schema_files = schema_root / 'user.sql', schema_root / 'watch.sql'
+schema_files = (schema_root / 'user.sql', schema_root / 'watch.sql', schema_root / 'idempotency.sql',
+                schema_root / 'revocation.sql', schema_root / 'session_token_expiration.sql',
+                schema_root / 'log_revision.sql')
 
 sqlite_schemas = '''
 CREATE TABLE IF NOT EXISTS users
@@ -65,6 +69,17 @@ def make_backup(db_credentials: dict[str, str], sqlite_output: Path):
         sqlite_ctx.execute('INSERT INTO log (log_id, watch_id, cycle, timedate, measure) '
                            'VALUES (?, ?, ?, ?, ?)', (log_id, watch_id, cycle, timedate, measure))
 
+    # archived cycles are stored packed, see LogRecordManager in app/db/watches.py
+    mysql_cursor.execute('SELECT watch_id, cycle, log_count, log_ids, timedates, measures FROM log_archive')
+    archives = mysql_cursor.fetchall()
+    for watch_id, cycle, log_count, log_ids, timedates, measures in archives:
+        for log_id, timestamp, measure in zip(struct.unpack(f'<{log_count}q', log_ids),
+                                              struct.unpack(f'<{log_count}q', timedates),
+                                              struct.unpack(f'<{log_count}f', measures)):
+            timedate = datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+            sqlite_ctx.execute('INSERT INTO log (log_id, watch_id, cycle, timedate, measure) '
+                               'VALUES (?, ?, ?, ?, ?)', (log_id, watch_id, cycle, timedate, round(measure, 2)))
+
     mysql_cursor.close()
     mysql_ctx.close()
 
@@ -73,10 +88,15 @@ def make_backup(db_credentials: dict[str, str], sqlite_output: Path):
 
 
 mysql_delete_tables = '''
+DROP TABLE IF EXISTS token_revocation;
+DROP TABLE IF EXISTS idempotency_key;
+DROP TABLE IF EXISTS log_revision;
+DROP TABLE IF EXISTS log_archive;
 DROP TABLE IF EXISTS log;
 DROP TABLE IF EXISTS watch;
 DROP TABLE IF EXISTS session_token;
 DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS schema_version;
 '''
 
 
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+from collections import OrderedDict
+
+# Local stand-in for a shared cache server (memcached, Redis) used by app.cache.RemoteCacheBackend.
+# Requests are one line, SET is followed by the value; every reply is a size line and the data:
+#   GET <key>                  -> <size>\n<value>, or -1\n for a miss
+#   SET <key> <size>\n<value>  -> 0\n
+#   DEL <prefix>               -> <size>\n<number of deleted keys>
+
+
+class Store:
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, key: str) -> bytes | None:
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes):
+        self.delete(key)
+        if len(value) > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def delete(self, key: str):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = [key for key in self.entries if key.startswith(prefix)]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+
+def reply(writer: asyncio.StreamWriter, data: bytes | None):
+    if data is None:
+        writer.write(b'-1\n')
+    else:
+        writer.write(f'{len(data)}\n'.encode() + data)
+
+
+async def handle(store: Store, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while line := await reader.readline():
+            command, *args = line.decode().split()
+            if command == 'GET':
+                reply(writer, store.get(args[0]))
+            elif command == 'SET':
+                store.set(args[0], await reader.readexactly(int(args[1])))
+                reply(writer, b'')
+            elif command == 'DEL':
+                reply(writer, str(store.delete_prefix(args[0])).encode())
+            else:
+                break
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, max_bytes: int):
+    store = Store(max_bytes)
+    server = await asyncio.start_server(lambda r, w: handle(store, r, w), host, port)
+    print(f'Cache server on {host}:{port} with {max_bytes // 2**20} MiB')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame cache shared by the backend workers.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to listen on, keep it private.')
+    parser.add_argument('--port', type=int, default=27713, help='Port to listen on.')
+    parser.add_argument('--max_mb', type=int, default=256, help='Memory for cached values in MiB.')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.max_mb * 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,19 @@ import argparse
 from passlib.context import CryptContext
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def hash_password(password: str, rounds: int | None = None) -> str:
+    # the backend rehashes passwords made with other rounds than it is set to at the next login
+    options = {} if rounds is None else {'bcrypt__rounds': rounds}
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", **options).hash(password)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('password', type=str)
+    parser.add_argument('--rounds', type=int, help='bcrypt rounds, the same as BCRYPT_ROUNDS of the backend.')
     args = parser.parse_args()
 
-    print(hash_password(args.password))
+    print(hash_password(args.password, args.rounds))
 
 
 if __name__ == '__main__':
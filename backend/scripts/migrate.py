@@ -1,48 +1,117 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator
 import argparse
 from pathlib import Path
 import sqlite3
 
 from mysql.connector import connect
 
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _to_db_datetime(value: str) -> datetime:
+    # MySQL DATETIME keeps whole seconds and no zone, normalize the same way so that
+    # rows written by an interrupted run can be recognized with --resume.
+    date = datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None)
+    if date.microsecond >= 500_000:
+        date += timedelta(seconds=1)
+    return date.replace(microsecond=0)
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate(sqlite_db: Path,
+            db_config: dict[str, str],
+            user_name: str,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            dry_run: bool = False,
+            resume: bool = False):
+    if not sqlite_db.exists():
+        raise FileNotFoundError(f'Sqlite file {sqlite_db} not found.')
 
-def migrate(sqlite_db: Path, db_config: dict[str, str], user_name: str):
     lite = sqlite3.connect(sqlite_db)
-    sqlite_cursor = lite.execute('SELECT * FROM info')
-    watches = sqlite_cursor.fetchall()
-    sqlite_cursor.close()
+    watches = lite.execute('SELECT watch_id, name, date FROM info').fetchall()
 
     conn = connect(**db_config)
     mysql_cursor = conn.cursor()
 
     mysql_cursor.execute('SELECT user_id FROM users WHERE user_name = %s', (user_name,))
-    user_id = mysql_cursor.fetchone()[0]
+    row = mysql_cursor.fetchone()
+    if row is None:
+        raise ValueError(f"No user with name '{user_name}'.")
+    user_id = row[0]
     assert isinstance(user_id, int)
 
-    for watch_id, name, date in watches:
-        date = datetime.fromisoformat(date).astimezone(timezone.utc)
+    mysql_cursor.execute('SELECT name, watch_id FROM watch WHERE user_id = %s', (user_id,))
+    existing_watches = dict(mysql_cursor.fetchall())
+
+    # legacy watch_id -> MySQL watch_id, None for watches that a dry run would create
+    watch_map: dict[int, int | None] = {}
+    reused: list[int] = []
+    for legacy_id, name, date in watches:
+        if name in existing_watches:
+            if not resume:
+                raise ValueError(f"Watch '{name}' already exists for user '{user_name}', use --resume to continue.")
+            watch_map[legacy_id] = existing_watches[name]
+            reused.append(existing_watches[name])
+        elif dry_run:
+            watch_map[legacy_id] = None
+        else:
+            mysql_cursor.execute(
+                'INSERT INTO watch (user_id, name, date_of_creation) VALUES (%s, %s, %s)',
+                (user_id, name, _to_db_datetime(date))
+            )
+            watch_map[legacy_id] = mysql_cursor.lastrowid
+    if not dry_run:
+        conn.commit()
+
+    migrated = set()
+    if reused:
+        placeholders = ', '.join(['%s'] * len(reused))
         mysql_cursor.execute(
-            'INSERT INTO watch (user_id, name, date_of_creation) VALUES (%s, %s, %s)',
-            (user_id, name, date)
+            f'SELECT watch_id, cycle, timedate FROM log WHERE watch_id IN ({placeholders})',
+            tuple(reused)
         )
-        mysql_cursor.execute('SELECT watch_id FROM watch WHERE name = %s', (name,))
-        mysql_watch_id = mysql_cursor.fetchone()[0]
-
-        sqlite_cursor = lite.execute('SELECT * FROM logs WHERE watch_id = ?', (watch_id,))
-        logs = sqlite_cursor.fetchall()
-        sqlite_cursor.close()
-        for _, _, cycle, timedate, measure in logs:
-            timedate = datetime.fromisoformat(timedate).astimezone(timezone.utc)
-            assert isinstance(timedate, datetime)
-            mysql_cursor.execute(
+        migrated = set(mysql_cursor.fetchall())
+
+    def pending_logs() -> Iterator[tuple[int | None, int, datetime, float]]:
+        for _, legacy_watch_id, cycle, timedate, measure in lite.execute('SELECT * FROM logs'):
+            if legacy_watch_id not in watch_map:
+                raise ValueError(f'Log references unknown watch_id {legacy_watch_id}.')
+            watch_id = watch_map[legacy_watch_id]
+            timedate = _to_db_datetime(timedate)
+            if (watch_id, cycle, timedate) in migrated:
+                continue
+            yield watch_id, cycle, timedate, measure
+
+    inserted = 0
+    for batch in _batched(pending_logs(), batch_size):
+        if not dry_run:
+            # executemany on a plain INSERT is sent as a single multi-row statement
+            mysql_cursor.executemany(
                 'INSERT INTO log (watch_id, cycle, timedate, measure) VALUES (%s, %s, %s, %s)',
-                (mysql_watch_id, cycle, timedate, measure)
+                batch
             )
+            conn.commit()
+        inserted += len(batch)
 
-    conn.commit()
+    lite.close()
     mysql_cursor.close()
     conn.close()
 
+    prefix = '[dry run] ' if dry_run else ''
+    print(f'{prefix}watches: {len(watches) - len(reused)} new, {len(reused)} reused')
+    print(f'{prefix}logs: {inserted} inserted, {len(migrated)} already present')
+
 
 def main():
     parser = argparse.ArgumentParser(description='Migrate data from SQLite to MySQL.')
@@ -52,6 +121,11 @@ def main():
     parser.add_argument('--mysql_password', type=str, required=True, help='MySQL password.')
     parser.add_argument('--mysql_host', type=str, required=True, help='MySQL host.')
     parser.add_argument('--mysql_database', type=str, required=True, help='MySQL database name.')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Number of logs inserted and committed at once.')
+    parser.add_argument('--dry-run', action='store_true', help='Read and validate everything without writing.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse already migrated watches and skip logs that are already present.')
 
     args = parser.parse_args()
 
@@ -62,7 +136,7 @@ def main():
         'database': args.mysql_database,
     }
 
-    migrate(args.sqlite_db, db_config, args.watch_user)
+    migrate(args.sqlite_db, db_config, args.watch_user, args.batch_size, args.dry_run, args.resume)
 
 
 if __name__ == '__main__':
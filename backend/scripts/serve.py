@@ -0,0 +1,46 @@
+import argparse
+import os
+from pathlib import Path
+
+import uvicorn
+
+backend_root = Path(__file__).parents[1].resolve()
+
+
+def usable_cpus() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the backend with several worker processes. '
+                    'Send SIGHUP to restart the workers gracefully, SIGTERM to stop.'
+    )
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Interface to bind to.')
+    parser.add_argument('--port', type=int, default=27712, help='Port to bind to.')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', '0')),
+                        help='Number of worker processes, defaults to the number of usable CPUs.')
+    parser.add_argument('--db_connections', type=int, default=int(os.getenv('DB_MAX_CONNECTIONS', '100')),
+                        help='Database connections shared out between all workers.')
+    parser.add_argument('--graceful_timeout', type=int, default=30,
+                        help='Seconds a worker gets to finish its requests on shutdown or restart.')
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else usable_cpus()
+    # the workers are spawned after this and inherit the environment
+    os.environ['DB_POOL_SIZE'] = str(max(1, args.db_connections // workers))
+
+    uvicorn.run(
+        'app.main:app',
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        app_dir=str(backend_root)
+    )
+
+
+if __name__ == '__main__':
+    main()
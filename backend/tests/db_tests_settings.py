@@ -8,8 +8,13 @@ from dotenv import load_dotenv
 load_dotenv(Path(__file__).parents[2] / '.env.tests')
 
 sql_delete_all = """
+DROP TABLE IF EXISTS token_revocation;
+DROP TABLE IF EXISTS idempotency_key;
+DROP TABLE IF EXISTS log_revision;
+DROP TABLE IF EXISTS log_archive;
 DROP TABLE IF EXISTS log;
 DROP TABLE IF EXISTS watch;
 DROP TABLE IF EXISTS session_token;
 DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS schema_version;
 """
@@ -0,0 +1,46 @@
+import unittest
+
+from app.cache import WeightedLRU, create_frame_cache
+
+
+class TestWeightedLRU(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = WeightedLRU(10)
+        lru.set('a', 1, 4)
+        lru.set('b', 2, 4)
+        lru.get('a')
+        lru.set('c', 3, 4)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(lru.weight, 8)
+
+    def test_too_heavy_is_not_stored(self):
+        lru = WeightedLRU(10)
+        lru.set('a', 1, 11)
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.weight, 0)
+
+    def test_pop_prefix(self):
+        lru = WeightedLRU(10)
+        lru.set('1:1:a', 1, 1)
+        lru.set('1:1:b', 2, 1)
+        lru.set('1:10:a', 3, 1)
+        self.assertEqual(lru.pop_prefix('1:1:'), 2)
+        self.assertEqual(len(lru), 1)
+
+
+class TestFrameCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_version_and_invalidation(self):
+        cache = create_frame_cache('', 100)
+        await cache.set(1, 2, (5, 10), 'list', 'frame', 5)
+        self.assertEqual(await cache.get(1, 2, (5, 10), 'list'), 'frame')
+        self.assertIsNone(await cache.get(1, 2, (6, 11), 'list'))
+        await cache.invalidate(1, 2)
+        self.assertIsNone(await cache.get(1, 2, (5, 10), 'list'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
+import asyncio
 import unittest
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 from db_tests_settings import sql_delete_all
 
@@ -7,6 +8,26 @@ from app.settings import DATABASE_CONFIG
 from app.db import users, access, exceptions, watches, schema_files
 
 
+class TestMigrate(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.db = access.DBAccess(DATABASE_CONFIG)
+        await self.db.run_sql(sql_delete_all)
+
+    async def test_concurrent(self):
+        # both read version 0 before either holds the lock, the second must not migrate again
+        other = access.DBAccess(DATABASE_CONFIG)
+        versions = await asyncio.gather(access.db_migrate(self.db, *schema_files),
+                                        access.db_migrate(other, *schema_files))
+        await other.close()
+        self.assertEqual(versions, [len(schema_files)] * 2)
+        async with self.db.access() as wp:
+            await wp.cursor.execute("SELECT COUNT(*) FROM schema_version")
+            (count,) = await wp.cursor.fetchone()
+        self.assertEqual(count, len(schema_files))
+        self.assertEqual(await access.db_migrate(self.db, *schema_files), len(schema_files))
+
+
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     async def asyncSetUp(self):
@@ -322,5 +343,104 @@ class TestLogs(unittest.IsolatedAsyncioTestCase):
                 await watches.LogRecord.get_log_by_id(wp.cursor, 999)
 
 
+class TestArchive(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.db = access.DBAccess(DATABASE_CONFIG)
+        await self.db.run_sql(sql_delete_all)
+        for schema in schema_files:
+            await self.db.run_sql_file(schema)
+
+        start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=200)
+        async with self.db.access() as wp:
+            self.user = await users.UserRecord.new_user(wp.cursor, users.NewUser(
+                user_name='test_user', password_hash='password_hash', date_of_creation=start
+            ))
+            self.watch = await watches.WatchRecordManager(self.user).new_watch(wp.cursor, watches.NewWatch(
+                user_id=self.user.data.user_id, name='test_watch', date_of_creation=start
+            ))
+            self.manager = watches.LogRecordManager(self.watch)
+            for day, measure in enumerate([0.5, 2.25, 4.0]):
+                await self.manager.new_log(wp.cursor, 1, watches.NewLog(
+                    watch_id=self.watch.data.watch_id, cycle=1, timedate=start + timedelta(days=day), measure=measure
+                ))
+            await wp.commit()
+            self.logs = [log.data for log in await self.manager.get_logs(wp.cursor, 1)]
+
+    async def count(self, table: str) -> int:
+        async with self.db.access() as wp:
+            await wp.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            (count,) = await wp.cursor.fetchone()
+        return count
+
+    async def test_round_trip(self):
+        daemon = watches.ArchiveLogsDaemonCreator(self.db, 60, 90)
+        self.assertEqual(await daemon.archive_closed_cycles(), 1)
+        self.assertEqual((await self.count('log'), await self.count('log_archive')), (0, 1))
+
+        async with self.db.access() as wp:
+            self.assertEqual([log.data for log in await self.manager.get_logs(wp.cursor, 1)], self.logs)
+            self.assertEqual(await self.manager.get_cycles(wp.cursor), [1])
+            by_cycle = await watches.WatchRecordManager(self.user).get_logs_by_cycle(wp.cursor, [self.watch])
+        self.assertEqual(by_cycle, {
+            (self.watch.data.watch_id, 1): [(log.log_id, log.timedate, log.measure) for log in self.logs]
+        })
+
+        # a write restores the cycle into log with the same log ids
+        async with self.db.access() as wp:
+            await self.manager.new_log(wp.cursor, 1, watches.NewLog(
+                watch_id=self.watch.data.watch_id, cycle=1, timedate=datetime.now(timezone.utc), measure=5.0
+            ))
+            await wp.commit()
+        self.assertEqual((await self.count('log'), await self.count('log_archive')), (4, 0))
+        async with self.db.access() as wp:
+            restored = [log.data for log in await self.manager.get_logs(wp.cursor, 1)]
+        self.assertEqual(restored[:3], self.logs)
+
+    async def test_lock_held_elsewhere(self):
+        daemon = watches.ArchiveLogsDaemonCreator(self.db, 60, 90)
+        async with self.db.access() as wp:
+            await wp.cursor.execute("SELECT GET_LOCK(%s, 0)", (daemon.lock_name,))
+            await wp.cursor.fetchone()
+            self.assertIsNone(await daemon.archive_closed_cycles())
+            await wp.cursor.execute("SELECT RELEASE_LOCK(%s)", (daemon.lock_name,))
+            await wp.cursor.fetchone()
+        self.assertEqual(await self.count('log_archive'), 0)
+
+    async def test_version_changes_on_update(self):
+        async with self.db.access() as wp:
+            before = await self.manager.get_cycle_version(wp.cursor, 1)
+            log = await self.manager.get_log_by_id(wp.cursor, 1, self.logs[0].log_id)
+            log.data.measure = 1.5
+            self.assertEqual(await log.update(wp.cursor), 1)
+            first = await self.manager.get_cycle_version(wp.cursor, 1)
+            log.data.measure = 0.5
+            await log.update(wp.cursor)
+            second = await self.manager.get_cycle_version(wp.cursor, 1)
+            await wp.commit()
+        self.assertEqual(len({before, first, second}), 3)
+
+        # archiving keeps the revision, the restored cycle does not look like one before the updates
+        daemon = watches.ArchiveLogsDaemonCreator(self.db, 60, 90)
+        self.assertEqual(await daemon.archive_closed_cycles(), 1)
+        async with self.db.access() as wp:
+            await self.manager.restore_cycle(wp.cursor, 1)
+            self.assertEqual(await self.manager.get_cycle_version(wp.cursor, 1), second)
+
+    async def test_write_listeners(self):
+        written = []
+
+        async def listener(watch_id: int, cycle: int):
+            written.append((watch_id, cycle))
+
+        manager = watches.LogRecordManager(self.watch, [listener])
+        async with self.db.access() as wp:
+            log = await manager.get_log_by_id(wp.cursor, 1, self.logs[0].log_id)
+            await log.delete(wp.cursor)
+            await manager.delete_logs(wp.cursor, 1)
+            await wp.commit()
+        self.assertEqual(written, [(self.watch.data.watch_id, 1)] * 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Request
+
+from communication import responses, columnar
+from app import encoding
+from app.data_manipulation.interpolation import LinearInterpolation
+from app.data_manipulation.log import WatchLogFrame
+
+start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+auth = responses.AuthResponse(user='user', expiration_date=start)
+
+
+class TestEncodeLogs(unittest.TestCase):
+
+    def setUp(self):
+        table = [(i, start + timedelta(hours=7 * i), 1.5 * i) for i in range(10)]
+        self.frame = WatchLogFrame.from_table(('log_id', 'datetime', 'measure'), table)
+
+    def assertSameAsModels(self, frame: WatchLogFrame):
+        expected = responses.LogListResponse(auth=auth, logs=[
+            responses.LogResponse(
+                log_id=r.get('log_id'),
+                time=r.datetime,
+                measure=r.measure,
+                difference=r['difference'],
+                suspect=r.get('suspect', False)
+            ) for r in frame.data
+        ])
+        body = encoding.log_list_response(auth, encoding.encode_logs(frame)).body
+        self.assertEqual(body, expected.model_dump_json().encode())
+
+    def test_list(self):
+        self.assertSameAsModels(self.frame.flag_outliers().get_log_with_dif())
+
+    def test_fill(self):
+        self.assertSameAsModels(self.frame.fill(LinearInterpolation).get_log_with_dif())
+
+    def test_columnar(self):
+        filled = self.frame.fill(LinearInterpolation).get_log_with_dif()
+        for frame in (self.frame.flag_outliers().get_log_with_dif(), filled):
+            expected = responses.LogListResponse.model_validate_json(
+                encoding.log_list_response(auth, encoding.encode_logs(frame)).body
+            )
+            response = encoding.log_list_response(auth, encoding.encode_logs(frame, binary=True))
+            self.assertEqual(response.media_type, columnar.media_type)
+            self.assertEqual(columnar.decode_log_list(response.body), expected)
+
+    def test_columnar_precision(self):
+        times = [start + timedelta(microseconds=1), start + timedelta(days=20000)]
+        logs = columnar.encode_logs([None, 5], times, [1234.5, -0.3], [None, 0.1], [True, False])
+        decoded = columnar.decode_log_list(columnar.encode_log_list(auth, logs)).logs
+        self.assertEqual([log.time for log in decoded], times)
+        self.assertEqual([log.log_id for log in decoded], [None, 5])
+        self.assertEqual([log.measure for log in decoded], [1234.5, -0.3])
+        self.assertEqual([log.difference for log in decoded], [None, 0.1])
+        self.assertEqual([log.suspect for log in decoded], [True, False])
+        with self.assertRaises(ValueError):
+            columnar.decode_log_list(columnar.encode_log_list(auth, logs)[:-3])
+
+    def test_empty(self):
+        logs = encoding.encode_logs(WatchLogFrame([]))
+        self.assertEqual(logs.rows, 0)
+        self.assertEqual(responses.LogListResponse.model_validate_json(encoding.log_list_response(auth, logs).body).logs, [])
+
+
+class TestAccept(unittest.TestCase):
+
+    def accepts(self, accept: str | None) -> bool:
+        headers = [] if accept is None else [(b'accept', accept.encode())]
+        return encoding.accepts_columnar(Request({'type': 'http', 'headers': headers}))
+
+    def test_accepts_columnar(self):
+        self.assertTrue(self.accepts(columnar.media_type))
+        self.assertTrue(self.accepts(f'application/json;q=0.5, {columnar.media_type}'))
+        self.assertTrue(self.accepts(f'{columnar.media_type.upper()}; q=0.9, */*;q=0.1'))
+
+    def test_json(self):
+        for accept in (None, '', '*/*', 'application/*', 'application/json',
+                       f'{columnar.media_type};q=0', f'{columnar.media_type};q=0.0, application/json',
+                       f'{columnar.media_type};q=0.5, application/json', f'{columnar.media_type}+json',
+                       f'{columnar.media_type};q=x'):
+            self.assertFalse(self.accepts(accept), accept)
+
+    def test_media_ranges(self):
+        ranges = encoding.media_ranges('text/html, application/*;q=0.2;level=1, */*;q=0.1,')
+        self.assertEqual(ranges, {'text/html': 1.0, 'application/*': 0.2, '*/*': 0.1})
+        self.assertEqual(encoding.media_quality(ranges, 'application/json'), 0.2)
+        self.assertEqual(encoding.media_quality(ranges, 'image/png'), 0.1)
+        self.assertEqual(encoding.media_quality({'text/html': 1.0}, 'application/json'), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
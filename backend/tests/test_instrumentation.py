@@ -0,0 +1,72 @@
+import unittest
+
+from app.db import instrumentation
+
+
+class FakeCursor:
+
+    def __init__(self, rows: list[tuple]):
+        self.rows = rows
+        self.rowcount = -1
+        self.lastrowid = None
+
+    async def execute(self, operation, params=()):
+        self.rowcount = len(self.rows)
+
+    async def fetchall(self):
+        return self.rows
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_placeholders_and_literals(self):
+        self.assertEqual(
+            instrumentation.fingerprint("SELECT * FROM log WHERE watch_id = %s AND cycle = 3"),
+            "SELECT * FROM log WHERE watch_id = ? AND cycle = ?"
+        )
+        self.assertEqual(
+            instrumentation.fingerprint("SELECT *\n  FROM users WHERE user_name = 'test'"),
+            "SELECT * FROM users WHERE user_name = ?"
+        )
+
+    def test_in_lists_collapse(self):
+        self.assertEqual(
+            instrumentation.fingerprint("SELECT * FROM log WHERE watch_id IN (%s, %s, %s)"),
+            "SELECT * FROM log WHERE watch_id IN (?+)"
+        )
+
+
+class TestInstrumentedCursor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_round_trips_and_rows(self):
+        stats = instrumentation.QueryStats()
+        token = instrumentation._current_stats.set(stats)
+        try:
+            cursor = instrumentation.InstrumentedCursor(FakeCursor([(1,), (2,), (3,)]))
+            await cursor.execute("SELECT id FROM t WHERE a = %s", (1,))
+            await cursor.fetchall()
+            await cursor.execute("SELECT id FROM t WHERE a = %s", (2,))
+            await cursor.fetchone()
+        finally:
+            instrumentation._current_stats.reset(token)
+        self.assertEqual(stats.round_trips, 2)
+        self.assertEqual([query.rows for query in stats.queries], [3, 3])
+        self.assertEqual(stats.queries[0].fingerprint, "SELECT id FROM t WHERE a = ?")
+
+    async def test_slow_query_log(self):
+        cursor = instrumentation.InstrumentedCursor(FakeCursor([]), slow_query_seconds=0)
+        with self.assertLogs('app.db.slow', level='WARNING') as logs:
+            await cursor.execute("DELETE FROM t WHERE a = %s", (1,))
+        self.assertIn("DELETE FROM t WHERE a = ?", logs.output[0])
+
+    async def test_no_request_context(self):
+        cursor = instrumentation.InstrumentedCursor(FakeCursor([(1,)]))
+        await cursor.execute("SELECT 1")
+        self.assertEqual(await cursor.fetchone(), (1,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from app.data_manipulation.interpolation import LinearInterpolation, QubicSplineInterpolation
+
+
+class TestLinearInterpolation(unittest.TestCase):
+
+    def test_values(self):
+        f = LinearInterpolation.calculate([(0, 0), (10, 10), (20, 0)])
+        self.assertEqual(f(-5), 0)
+        self.assertEqual(f(5), 5)
+        self.assertEqual(f(10), 10)
+        self.assertEqual(f(15), 5)
+        self.assertEqual(f(25), 0)
+
+    def test_evaluate_matches_calls(self):
+        f = LinearInterpolation.calculate([(0, 1), (3, 4), (7, -2), (8, 0)])
+        xs = [-1, 0, 0.5, 3, 5, 7.5, 8, 9, 2, -3]
+        self.assertEqual(f.evaluate(xs), [f(x) for x in xs])
+
+
+class TestQubicSplineInterpolation(unittest.TestCase):
+
+    def test_passes_through_points(self):
+        data = [(0, 0.0), (1, 2.0), (3, 1.0), (4, 5.0), (7, 3.0)]
+        f = QubicSplineInterpolation.calculate(data)
+        for x, y in data:
+            self.assertAlmostEqual(f(x), y)
+
+    def test_natural_second_derivative(self):
+        f = QubicSplineInterpolation.calculate([(0, 0.0), (1, 2.0), (3, 1.0), (4, 5.0)])
+        self.assertEqual(f.z[0], 0)
+        self.assertEqual(f.z[-1], 0)
+
+    def test_reproduces_line(self):
+        f = QubicSplineInterpolation.calculate([(x, 2 * x + 1) for x in (0, 1, 4, 5, 9)])
+        for x in (0.5, 2, 4.5, 8):
+            self.assertAlmostEqual(f(x), 2 * x + 1)
+
+    def test_few_points(self):
+        self.assertEqual(QubicSplineInterpolation.calculate([(5, 3.0)]).evaluate([4, 5, 6]), [3.0, 3.0, 3.0])
+        f = QubicSplineInterpolation.calculate([(0, 0.0), (2, 4.0)])
+        self.assertAlmostEqual(f(1), 2)
+
+    def test_evaluate_matches_calls(self):
+        f = QubicSplineInterpolation.calculate([(0, 1.0), (3, 4.0), (7, -2.0), (8, 0.0), (12, 1.0)])
+        xs = [0, 0.5, 3, 5, 7.5, 8, 12, 2, 11]
+        for a, b in zip(f.evaluate(xs), [f(x) for x in xs]):
+            self.assertAlmostEqual(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import pickle
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from app.data_manipulation.interpolation import LinearInterpolation
+from app.data_manipulation.log import Record, WatchLogFrame, seconds_in_hour, seconds_in_day
+
+headers = ('log_id', 'datetime', 'measure')
+start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_frame(measures: list[float], spacing: timedelta = timedelta(hours=1)) -> WatchLogFrame:
+    return WatchLogFrame.from_table(headers, [(i, start + i * spacing, m) for i, m in enumerate(measures)])
+
+
+class TestRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.record = Record.from_row(headers, (7, start, 1.5))
+
+    def test_fields(self):
+        self.assertEqual(self.record['log_id'], 7)
+        self.assertEqual(self.record.other, {'log_id': 7})
+        self.assertEqual(Record(self.record.time_as_float, 1.5, log_id=7), self.record)
+        with self.assertRaises(AttributeError):
+            self.record.measure = 2
+
+    def test_with_other(self):
+        extended = self.record.with_other(difference=None, log_id=8)
+        self.assertEqual(extended.other, {'log_id': 8, 'difference': None})
+        self.assertEqual(extended.time_as_float, self.record.time_as_float)
+        self.assertEqual(pickle.loads(pickle.dumps(extended)), extended)
+
+
+class TestFill(unittest.TestCase):
+
+    def test_step(self):
+        frame = make_frame([0, 10], timedelta(days=2))
+        self.assertEqual(len(frame.fill(LinearInterpolation).data), 3)
+        hourly = frame.fill(LinearInterpolation, seconds_in_hour)
+        self.assertEqual(len(hourly.data), 49)
+        self.assertEqual(hourly.data[24].measure, 5)
+
+    def test_difference_per_day(self):
+        frame = make_frame([0, 8], timedelta(days=2))
+        daily = frame.fill(LinearInterpolation).get_log_with_dif(per_day=True)
+        self.assertEqual([r['difference'] for r in daily.data], [None, 4, 4])
+        hourly = frame.fill(LinearInterpolation, 6 * seconds_in_hour).get_log_with_dif(per_day=True)
+        self.assertEqual({r['difference'] for r in hourly.data[1:]}, {4})
+        self.assertEqual(frame.get_log_with_dif().data[1]['difference'], 8)
+
+    def test_difference_per_day_unrounded(self):
+        # 5 s/day is 0.208 s an hour, rounding the filled measures first gives 4.8 or 7.2 a day
+        frame = make_frame([0, 5, 10], timedelta(days=1))
+        for step in (seconds_in_hour, 7 * seconds_in_hour, 17 * seconds_in_hour):
+            filled = frame.fill(LinearInterpolation, step, digits=None).get_log_with_dif(per_day=True).rounded()
+            self.assertEqual({r['difference'] for r in filled.data[1:]}, {5}, step)
+            self.assertEqual(filled.data[1].measure, round(5 * step / seconds_in_day, 1))
+            self.assertEqual(filled.data[1], frame.fill(LinearInterpolation, step).data[1].with_other(difference=5))
+
+
+class TestStats(unittest.TestCase):
+
+    def test_matches_properties(self):
+        frame = make_frame([0, 1.5, 2, 4.5, 4, 7], timedelta(days=1))
+        self.assertEqual(frame.stats(), (frame.average, frame.standard_deviation, frame.delta))
+
+    def test_too_short(self):
+        self.assertEqual(make_frame([1]).stats(), (None, None, None))
+
+
+class TestRollingAndSegments(unittest.TestCase):
+
+    def setUp(self):
+        # differences 1, 2, 3, 4, 5, 6
+        self.frame = make_frame([0, 1, 3, 6, 10, 15, 21], timedelta(days=1))
+
+    def test_rolling(self):
+        rolling = self.frame.rolling(3)
+        self.assertEqual([r.measure for r in rolling.data], [2, 3, 4, 5])
+        self.assertEqual(rolling.data[0].datetime, self.frame.data[3].datetime)
+        self.assertEqual(rolling.data[0].other['deviation'], 0.82)
+
+    def test_segments(self):
+        day = timedelta(days=1)
+        stats = self.frame.segment_stats([
+            (start, start + 6 * day),
+            (start + 2 * day, start + 4 * day),
+            (start + day / 2, start + day),
+        ])
+        self.assertEqual(stats[0], (6, 3.5, 1.71, 5))
+        self.assertEqual(stats[1], (2, 3.5, 0.5, 1))
+        self.assertEqual(stats[2], (0, None, None, None))
+
+
+class TestOutliers(unittest.TestCase):
+
+    def setUp(self):
+        self.measures = [round(2.5 * i + (0.3 if i % 2 else -0.3), 1) for i in range(30)]
+
+    def test_wrong_sign(self):
+        self.measures[12] = -self.measures[12]
+        flags = [r['suspect'] for r in make_frame(self.measures, timedelta(days=1)).flag_outliers().data]
+        self.assertEqual([i for i, flag in enumerate(flags) if flag], [12])
+
+    def test_last_log(self):
+        self.measures[-1] += 60
+        frame = make_frame(self.measures, timedelta(days=1))
+        self.assertEqual([r['suspect'] for r in frame.flag_outliers().data][-3:], [False, False, True])
+        self.assertEqual(len(frame.exclude_outliers().data), 29)
+
+    def test_clean_data(self):
+        frame = make_frame(self.measures, timedelta(days=1))
+        self.assertFalse(any(r['suspect'] for r in frame.flag_outliers().data))
+
+
+class TestDownsampling(unittest.TestCase):
+
+    def setUp(self):
+        self.measures = [float(i % 7) for i in range(1000)]
+        self.measures[500] = 100
+        self.frame = make_frame(self.measures)
+
+    def test_lttb(self):
+        out = self.frame.downsample_lttb(50)
+        self.assertEqual(len(out.data), 50)
+        self.assertEqual(out.data[0], self.frame.data[0])
+        self.assertEqual(out.data[-1], self.frame.data[-1])
+        self.assertIn(100, [r.measure for r in out.data])
+
+    def test_minmax(self):
+        out = self.frame.downsample_minmax(50)
+        self.assertLessEqual(len(out.data), 50)
+        self.assertEqual(out.data[0], self.frame.data[0])
+        self.assertEqual(out.data[-1], self.frame.data[-1])
+        self.assertIn(100, [r.measure for r in out.data])
+        self.assertIn(0, [r.measure for r in out.data[1:-1]])
+
+    def test_small_frames_unchanged(self):
+        self.assertEqual(self.frame.downsample_lttb(1000).data, self.frame.data)
+        self.assertEqual(self.frame.downsample_minmax(2000).data, self.frame.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
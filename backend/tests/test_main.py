@@ -5,12 +5,23 @@ from fastapi.testclient import TestClient
 from db_tests_settings import sql_delete_all
 
 from app.main import app
-from app.db import DBAccess, schema_files
+from app import ratelimit
+from app.db import DBAccess, schema_files, capture_request_stats
 from app.settings import DATABASE_CONFIG
 from communication import messages
 
 client = TestClient(app)
 
+
+def setUpModule():
+    # runs the lifespan, which creates the per-process application state
+    client.__enter__()
+
+
+def tearDownModule():
+    client.__exit__(None, None, None)
+
+
 class TestUserCRUD(unittest.IsolatedAsyncioTestCase):
 
     async def asyncSetUp(self):
@@ -46,6 +57,20 @@ class TestUserCRUD(unittest.IsolatedAsyncioTestCase):
         self.assertIn("token", response.json())
         self.assertIn("expiration_date", response.json())
 
+    async def test_login_user_rate_limited(self):
+        await self.test_register_user()
+        login = app.state.sec_functions.login_user
+        limiter = login.limiter
+        login.limiter = ratelimit.LoginLimiter(1, 60, 1)
+        try:
+            request = {"user_name": "test_user", "password": "test_password", "expiration_minutes": 10}
+            self.assertEqual(client.post('/login', json=request).status_code, 200)
+            response = client.post('/login', json=request)
+        finally:
+            login.limiter = limiter
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '60')
+
     async def test_login_user_bad_request(self):
         response = client.post('/login', json={
             "user_name": "nonexistent_user",
@@ -155,17 +180,19 @@ class TestLogCRUD(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response.status_code, 200)
 
     async def test_add_log(self):
-        response = client.post('/logs/add', content=messages.CreateMeasurementMessage(
-            auth=messages.AuthMessage(
-                token=self.token,
-                expiration_minutes=10
-            ),
-            watch_name='test_watch',
-            cycle=1,
-            datetime=datetime.now(),
-            measure=10.0
-        ).json())
+        with capture_request_stats() as captured:
+            response = client.post('/logs/add', content=messages.CreateMeasurementMessage(
+                auth=messages.AuthMessage(
+                    token=self.token,
+                    expiration_minutes=10
+                ),
+                watch_name='test_watch',
+                cycle=1,
+                datetime=datetime.now(),
+                measure=10.0
+            ).json())
         self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(captured[-1][1].round_trips, 10)
         self.assertIn("log_id", response.json())
         self.assertIn("time", response.json())
         self.assertIn("measure", response.json())
@@ -183,6 +210,35 @@ class TestLogCRUD(unittest.IsolatedAsyncioTestCase):
         ).json())
         self.assertEqual(response.status_code, 400)
 
+    async def test_add_log_idempotent(self):
+        message = messages.CreateMeasurementMessage(
+            auth=messages.AuthMessage(
+                token=self.token,
+                expiration_minutes=10
+            ),
+            watch_name='test_watch',
+            cycle=1,
+            datetime=datetime.now(),
+            measure=10.0,
+            idempotency_key='retry_of_add_log_1'
+        )
+        first = client.post('/logs/add', content=message.json())
+        second = client.post('/logs/add', content=message.json())
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json()['log_id'], second.json()['log_id'])
+
+        response = client.post('/logs/list', content=messages.SpecifyWatchDataMessage(
+            auth=message.auth,
+            watch_name='test_watch',
+            cycle=1
+        ).json())
+        self.assertEqual(len(response.json()['logs']), 1)
+
+        message.measure = 11.0
+        response = client.post('/logs/add', content=message.json())
+        self.assertEqual(response.status_code, 422)
+
     async def test_delete_log(self):
         await self.test_add_log()
         response = client.post('/logs/delete', content=messages.SpecifyLogDataMessage(
@@ -210,16 +266,18 @@ class TestLogCRUD(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_log_list(self):
         await self.test_add_log()
-        response = client.post('/logs/list', content=messages.SpecifyWatchDataMessage(
-            auth=messages.AuthMessage(
-                token=self.token,
-                expiration_minutes=10
-            ),
-            watch_name='test_watch',
-            cycle=1
-        ).json())
+        with capture_request_stats() as captured:
+            response = client.post('/logs/list', content=messages.SpecifyWatchDataMessage(
+                auth=messages.AuthMessage(
+                    token=self.token,
+                    expiration_minutes=10
+                ),
+                watch_name='test_watch',
+                cycle=1
+            ).json())
         self.assertEqual(response.status_code, 200)
         self.assertIn("logs", response.json())
+        self.assertLessEqual(captured[-1][1].round_trips, 8)
 
     async def test_get_log_list_bad_request(self):
         response = client.post('/logs/list', content=messages.SpecifyWatchDataMessage(
@@ -232,6 +290,32 @@ class TestLogCRUD(unittest.IsolatedAsyncioTestCase):
         ).json())
         self.assertEqual(response.status_code, 400)
 
+    async def test_get_log_list_cached(self):
+        await self.test_add_log()
+        headers = {'Authorization': f'Bearer {self.token}'}
+        params = {'watch_name': 'test_watch', 'cycle': 1}
+        response = client.get('/logs/list', params=params, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['logs']), 1)
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Authorization', response.headers['Vary'])
+
+        etag = response.headers['ETag']
+        response = client.get('/logs/list', params=params, headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        await self.test_add_log()
+        response = client.get('/logs/list', params=params, headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['logs']), 2)
+
+    async def test_get_log_list_without_token(self):
+        response = client.get('/logs/list', params={'watch_name': 'test_watch', 'cycle': 1})
+        self.assertEqual(response.status_code, 422)
+        response = client.get('/logs/list', params={'watch_name': 'test_watch', 'cycle': 1},
+                              headers={'Authorization': 'Basic abc'})
+        self.assertEqual(response.status_code, 401)
+
     async def test_get_stats(self):
         await self.test_add_log()
         response = client.post('/logs/stats', content=messages.SpecifyWatchDataMessage(
@@ -0,0 +1,47 @@
+import unittest
+
+from app import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter_render(self):
+        counter = metrics.Counter('test_total', 'A test counter.', ('kind',))
+        counter.labels('a').inc()
+        counter.labels('a').inc(2)
+        counter.labels('b').inc()
+        lines = counter.render()
+        self.assertIn('# TYPE test_total counter', lines)
+        self.assertIn('test_total{kind="a"} 3.0', lines)
+        self.assertIn('test_total{kind="b"} 1.0', lines)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'A test histogram.', buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count 4', lines)
+
+    def test_gauge_function(self):
+        gauge = metrics.Gauge('test_gauge', 'A test gauge.')
+        gauge.set(1)
+        gauge.set_function(lambda: 42)
+        self.assertIn('test_gauge 42', gauge.render())
+
+    def test_wrong_label_count(self):
+        counter = metrics.Counter('test_total', 'A test counter.', ('kind',))
+        with self.assertRaises(ValueError):
+            counter.labels('a', 'b')
+
+    def test_registry_duplicate(self):
+        registry = metrics.Registry()
+        registry.register(metrics.Counter('test_total', 'A test counter.'))
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter('test_total', 'A test counter.'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from app import security
+
+
+class TestPasswordRounds(unittest.TestCase):
+
+    def tearDown(self):
+        security.pwd_context = security.password_context()
+
+    def test_calibrate(self):
+        self.assertEqual(security.calibrate_rounds(1e-9, 4, 31, probe_rounds=4), 4)
+        self.assertEqual(security.calibrate_rounds(1e9, 4, 6, probe_rounds=4), 6)
+
+    def test_rehash(self):
+        old_hash = security.password_context(4).hash('test_password')
+        security.set_password_rounds(5)
+        verified, new_hash = security.verify_and_update_password('test_password', old_hash)
+        self.assertTrue(verified)
+        self.assertTrue(new_hash.startswith('$2b$05$'))
+        self.assertEqual(security.verify_and_update_password('wrong_password', old_hash), (False, None))
+        # rounds above the configured ones are lowered too, unless within the spread
+        self.assertIsNotNone(security.verify_and_update_password('test_password',
+                                                                 security.password_context(6).hash('test_password'))[1])
+        security.set_password_rounds(5, spread=1)
+        self.assertIsNone(security.verify_and_update_password('test_password',
+                                                              security.password_context(6).hash('test_password'))[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
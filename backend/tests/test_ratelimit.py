@@ -0,0 +1,69 @@
+import unittest
+
+from fastapi import HTTPException
+
+from app.metrics import login_rejected, password_hashes_in_progress
+from app.ratelimit import TokenBucketLimiter, HashAdmission, LoginLimiter
+from app.security import LoginUserCreator
+from communication.messages import UserLoginMessage
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+
+    def test_burst_and_refill(self):
+        limiter = TokenBucketLimiter(6, burst=3)
+        self.assertEqual([limiter.acquire('a', 0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire('a', 0), 10)
+        self.assertEqual(limiter.acquire('b', 0), 0)
+        self.assertAlmostEqual(limiter.acquire('a', 5), 5)
+        self.assertEqual(limiter.acquire('a', 10), 0)
+        self.assertGreater([limiter.acquire('a', 100) for _ in range(4)][-1], 0)
+
+    def test_max_keys(self):
+        limiter = TokenBucketLimiter(60, burst=1, max_keys=2)
+        for key in 'abc':
+            limiter.acquire(key, 0)
+        self.assertEqual(len(limiter), 2)
+        # 'a' was dropped and starts full again
+        self.assertEqual(limiter.acquire('a', 0), 0)
+        self.assertGreater(limiter.acquire('c', 0), 0)
+
+
+class TestHashAdmission(unittest.TestCase):
+
+    def test_limit(self):
+        admission = HashAdmission(1)
+        rejected = login_rejected.labels('hashing').value
+        with admission.admit():
+            self.assertEqual(password_hashes_in_progress.value, 1)
+            with self.assertRaises(HTTPException) as context:
+                with admission.admit():
+                    pass
+            self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(admission.in_progress, 0)
+        self.assertEqual(login_rejected.labels('hashing').value, rejected + 1)
+
+
+class TestLoginLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rejected_before_lookup(self):
+        # no database: a rejected attempt must not get as far as looking the user up
+        creator = LoginUserCreator(None, limiter=LoginLimiter(1, 60, 1))
+        request = UserLoginMessage(user_name='test_user', password='test_password', expiration_minutes=10)
+        with self.assertRaises(AttributeError):
+            await creator.login_user(request, '10.0.0.1')
+        with self.assertRaises(HTTPException) as context:
+            await creator.login_user(request, '10.0.0.2')
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(context.exception.headers['Retry-After'], '60')
+
+    def test_client_checked_first(self):
+        limiter = LoginLimiter(60, 1, 1)
+        limiter.check('first_user', '10.0.0.1')
+        with self.assertRaises(HTTPException):
+            limiter.check('second_user', '10.0.0.1')
+        self.assertEqual(len(limiter.users), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
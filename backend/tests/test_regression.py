@@ -0,0 +1,59 @@
+import random
+import unittest
+
+from app.data_manipulation import regression
+
+day = 24 * 60 * 60
+# seconds since year 1, like Record.time_as_float
+start = 63_840_000_000.0
+
+
+def drifting(rate: float, days: int, noise: float = 0.0, seed: int = 0) -> list[tuple[float, float]]:
+    rng = random.Random(seed)
+    return [(start + i * day, rate * i + rng.gauss(0, noise)) for i in range(days)]
+
+
+class TestLeastSquares(unittest.TestCase):
+
+    def test_exact_line(self):
+        fit = regression.least_squares(drifting(3.5, 30))
+        self.assertAlmostEqual(fit.rate, 3.5)
+        self.assertAlmostEqual(fit.residual_max, 0)
+        self.assertAlmostEqual(fit.r_squared, 1)
+
+    def test_interval_contains_rate(self):
+        fit = regression.least_squares(drifting(-2.0, 200, noise=0.5))
+        low, high = fit.rate_interval
+        self.assertLess(low, -2.0)
+        self.assertGreater(high, -2.0)
+        self.assertLess(high - low, 0.1)
+
+    def test_degenerate(self):
+        self.assertIsNone(regression.least_squares([(start, 1.0)]))
+        self.assertIsNone(regression.least_squares([(start, 1.0), (start, 2.0)]))
+        self.assertIsNone(regression.least_squares(drifting(1, 2)).rate_interval)
+
+
+class TestTheilSen(unittest.TestCase):
+
+    def test_ignores_outlier(self):
+        points = drifting(5.0, 50)
+        points[-1] = (points[-1][0], -300.0)
+        self.assertAlmostEqual(regression.theil_sen(points).rate, 5.0)
+        self.assertNotAlmostEqual(regression.least_squares(points).rate, 5.0, places=1)
+
+    def test_sampled_pairs(self):
+        fit = regression.theil_sen(drifting(1.5, 1000, noise=0.2), max_pairs=10_000)
+        self.assertAlmostEqual(fit.rate, 1.5, places=2)
+
+
+class TestTCritical(unittest.TestCase):
+
+    def test_values(self):
+        self.assertEqual(regression.t_critical_95(1), 12.706)
+        self.assertAlmostEqual(regression.t_critical_95(40), 2.021, places=3)
+        self.assertAlmostEqual(regression.t_critical_95(10_000), 1.960, places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
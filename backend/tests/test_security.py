@@ -5,6 +5,7 @@ from fastapi import HTTPException, status
 
 from db_tests_settings import sql_delete_all
 
+from app import security
 from app.settings import DATABASE_CONFIG
 from app.security import GetUserCreator, create_token, LoginUserCreator, CreateUserCreator
 from app.db import DBAccess, UserRecord, schema_files
@@ -86,6 +87,17 @@ class TestLoginUserCreator(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.status_code, status.HTTP_401_UNAUTHORIZED)
         self.assertEqual(context.exception.detail, "Wrong password for user test_user.")
 
+    async def test_login_user_rehash(self):
+        security.set_password_rounds(5)
+        try:
+            request = UserLoginMessage(user_name='test_user', password='test_password', expiration_minutes=10)
+            user, _ = await self.login_user_creator(request)
+        finally:
+            security.pwd_context = security.password_context()
+        async with self.db_access.access() as wp:
+            stored = await UserRecord.get_user_by_id(wp.cursor, user.data.user_id)
+        self.assertTrue(stored.data.password_hash.startswith('$2b$05$'))
+
     async def test_login_user_nonexistent_user(self):
         request = UserLoginMessage(user_name='nonexistent_user', password='test_password', expiration_minutes=10)
         with self.assertRaises(HTTPException) as context:
@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+from app.db import NewRevocation
+from app.security import SignedTokens, SignedTokenRecord
+from app.tokens import TokenSigner, RevocationList, SignedToken, is_signed
+
+key = 'k' * 32
+
+
+def make_token(expiration: timedelta = timedelta(minutes=10)) -> SignedToken:
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    return SignedToken(7, 'test_user', bytes(range(16)), now, now + expiration)
+
+
+class TestTokenSigner(unittest.TestCase):
+
+    def setUp(self):
+        self.signer = TokenSigner.from_setting(f'a:{key}', 60)
+
+    def test_round_trip(self):
+        token = make_token()
+        value = self.signer.sign(token)
+        self.assertTrue(is_signed(value))
+        self.assertEqual(self.signer.verify(value), token)
+
+    def test_tampered(self):
+        value = self.signer.sign(make_token())
+        version, key_id, payload, signature = value.split('.')
+        forged = self.signer.sign(make_token()._replace(user_id=8)).split('.')[2]
+        for wrong in (f'{version}.{key_id}.{forged}.{signature}', value[:-2], value + '.x', 'plain_token'):
+            with self.assertRaises(ValueError):
+                self.signer.verify(wrong)
+
+    def test_rotation(self):
+        value = self.signer.sign(make_token())
+        rotated = TokenSigner.from_setting(f'b:{"n" * 32}, a:{key}', 60)
+        self.assertEqual(rotated.verify(value), make_token())
+        self.assertEqual(rotated.sign(make_token()).split('.')[1], 'b')
+        with self.assertRaises(ValueError):
+            TokenSigner.from_setting(f'b:{"n" * 32}', 60).verify(value)
+
+    def test_settings(self):
+        self.assertIsNone(TokenSigner.from_setting('', 60))
+        with self.assertRaises(ValueError):
+            TokenSigner.from_setting('a:short', 60)
+        self.assertLessEqual(self.signer.expiration(1000), datetime.now(timezone.utc) + timedelta(minutes=60))
+
+
+class TestSignedTokens(unittest.TestCase):
+
+    def setUp(self):
+        self.revocations = RevocationList(None, 60, 10)
+        self.tokens = SignedTokens(TokenSigner.from_setting(f'a:{key}', 60), self.revocations)
+        self.value = self.tokens.signer.sign(make_token())
+
+    def test_check(self):
+        auth = self.tokens.check(self.value, None)
+        self.assertIsInstance(auth.token, SignedTokenRecord)
+        self.assertEqual(auth.token.data.token, self.value)
+        self.assertEqual((auth.user.data.user_id, auth.user.data.user_name), (7, 'test_user'))
+
+    def test_reissue(self):
+        auth = self.tokens.check(self.value, 30)
+        self.assertNotEqual(auth.token.data.token, self.value)
+        self.assertEqual(auth.token.token.session, make_token().session)
+        self.assertGreater(auth.token.data.expiration, make_token().expiration)
+
+    def test_expired(self):
+        value = self.tokens.signer.sign(make_token(-timedelta(minutes=1)))
+        with self.assertRaises(HTTPException) as context:
+            self.tokens.check(value, 10)
+        self.assertEqual(context.exception.detail, "Expired token.")
+
+    def test_revoked(self):
+        now = datetime.now(timezone.utc)
+        self.revocations.add(NewRevocation(user_id=7, session=make_token().session, revoked_at=now,
+                                           expiration=now + timedelta(hours=1)))
+        with self.assertRaises(HTTPException) as context:
+            self.tokens.check(self.value, None)
+        self.assertEqual(context.exception.status_code, 401)
+        self.revocations.prune(now + timedelta(hours=2))
+        self.tokens.check(self.value, None)
+
+    def test_revoked_user(self):
+        now = datetime.now(timezone.utc)
+        self.revocations.add(NewRevocation(user_id=7, session=None, revoked_at=now,
+                                           expiration=now + timedelta(hours=1)))
+        with self.assertRaises(HTTPException):
+            self.tokens.check(self.value, None)
+        # sessions started after the revocation are not affected
+        later = make_token()._replace(session=bytes(16), started=now + timedelta(seconds=2))
+        self.tokens.check(self.tokens.signer.sign(later), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -120,8 +120,9 @@ def get_app(manager: Manager, settings: config.ConfigContents, conf_file: Path)
         if not utils.check_watch_chosen(manager):
             return
         def print_logs(logs: responses.LogListResponse):
-            table = [[l.log_id, l.time.astimezone(), l.measure, l.difference] for l in logs.logs]
-            table = tabulate(table, headers=['Log ID', 'time', 'measure', 'difference'], tablefmt='grid')
+            table = [[l.log_id, l.time.astimezone(), l.measure, l.difference, 'suspect' if l.suspect else '']
+                     for l in logs.logs]
+            table = tabulate(table, headers=['Log ID', 'time', 'measure', 'difference', ''], tablefmt='grid')
             print(table)
         utils.run_with_handling(manager.get_log_list, on_success=print_logs)
 
@@ -145,6 +146,57 @@ def get_app(manager: Manager, settings: config.ConfigContents, conf_file: Path)
             print(table)
         utils.run_with_handling(manager.get_log_stats, on_success=print_stats)
 
+    @app.command('stats-clean', 'lsc', description='Get statistics without the logs flagged as suspect')
+    def log_stats_clean():
+        if not utils.check_watch_chosen(manager):
+            return
+        def print_stats(stats: responses.StatsResponse):
+            table = [['average', stats.average], ['Deviation', stats.deviation], ['Delta', stats.delta]]
+            table = tabulate(table, headers=['Statistic', 'Value'], tablefmt='grid')
+            print(table)
+        utils.run_with_handling(manager.get_log_stats, True, on_success=print_stats)
+
+    @app.command('rate', 'lr', description='Fit the rate of the current watch and cycle in seconds per day')
+    def log_rate():
+        if not utils.check_watch_chosen(manager):
+            return
+        def print_rate(rate: responses.RegressionResponse):
+            table = [
+                ['Logs', rate.count],
+                ['Rate', rate.rate],
+                ['95% interval', f'{rate.rate_low} - {rate.rate_high}'],
+                ['Robust rate', rate.robust_rate],
+                ['R squared', rate.r_squared],
+                ['Residual deviation', rate.residual_deviation],
+                ['Largest residual', rate.residual_max]
+            ]
+            table = tabulate(table, headers=['Statistic', 'Value'], tablefmt='grid')
+            print(table)
+        utils.run_with_handling(manager.get_log_regression, True, on_success=print_rate)
+
+    @app.command('rolling', 'lro', description='Rolling average and deviation of the daily rate over N days')
+    def log_rolling(window_days: int):
+        if not utils.check_watch_chosen(manager):
+            return
+        def print_rolling(resp: responses.RollingResponse):
+            table = [[r.time.astimezone().date(), r.average, r.deviation] for r in resp.stats]
+            table = tabulate(table, headers=['Day', 'Average', 'Deviation'], tablefmt='grid')
+            print(table)
+        utils.run_with_handling(manager.get_log_rolling, window_days, on_success=print_rolling)
+
+    @app.command('compare', 'cmp', description='Compare all cycles of the given watches, the current one by default')
+    def compare_cycles(watches: list[str]):
+        def print_cycles(resp: responses.CompareResponse):
+            table = [
+                [c.watch_name, c.cycle, c.count, c.start.astimezone().date(), c.end.astimezone().date(),
+                 c.rate, c.average, c.deviation, c.delta]
+                for c in resp.cycles
+            ]
+            table = tabulate(table, headers=['Watch', 'Cycle', 'Logs', 'Start', 'End', 'Rate', 'Average',
+                                             'Deviation', 'Delta'], tablefmt='grid')
+            print(table)
+        utils.run_with_handling(manager.compare_cycles, watches, on_success=print_cycles)
+
     @app.command('del-watch', 'dw', description='Delete a watch')
     def delete_watch(name: str):
         if utils.yn_prompt(f"Are you sure you want to delete watch '{name}'?"):
@@ -1,9 +1,11 @@
-from typing import Optional
+from typing import Any, Optional
 from datetime import datetime, timedelta, timezone
+from time import sleep
 from urllib import parse
+import uuid
 
 import requests
-from communication import messages, responses
+from communication import messages, responses, columnar
 
 
 class FacadeError(Exception):
@@ -24,9 +26,22 @@ class FacadeOperationalError(FacadeError):
 
 class WatchFacade:
 
-    def __init__(self, url: str, default_token_expiration_minutes: int | None = None):
+    def __init__(self,
+                 url: str,
+                 default_token_expiration_minutes: int | None = None,
+                 columnar_logs: bool = True,
+                 retries: int = 3,
+                 timeout: float | None = None):
         self.url = parse.urlparse(url)
         self.token_expiration_minutes = default_token_expiration_minutes
+        # writes carry an idempotency key, which makes sending them again after a failed attempt safe
+        self.retries = retries
+        self.timeout = timeout
+        # the last responses to GET reads with their ETags, most recently used last
+        self._etags: dict[tuple, tuple[str, Any]] = {}
+        self.etag_cache_size = 32
+        # log lists are asked for in the compact binary layout, a JSON reply is still understood
+        self.columnar_logs = columnar_logs
         if self.url.path != '':
             raise ValueError('Path in the URL has to be empty.')
 
@@ -43,6 +58,10 @@ class WatchFacade:
         self.log_list_path = '/logs/list'
         self.log_fill_path = '/logs/fill'
         self.log_stats_path = '/logs/stats'
+        self.log_regression_path = '/logs/regression'
+        self.log_compare_path = '/logs/compare'
+        self.log_rolling_path = '/logs/rolling'
+        self.log_segments_path = '/logs/segments'
         self.log_delete_path = '/logs/delete'
         self.log_delete_cycle_path = '/logs/del_cycle'
         self.log_add_path = '/logs/add'
@@ -55,20 +74,78 @@ class WatchFacade:
         else:
             raise ValueError('No default token_expiration_minutes configured.')
 
+    def _request(self, method: str, path: str, retry: bool, **kwargs) -> requests.Response:
+        # only requests that are safe to repeat are retried, the body is the same on every attempt
+        attempts = 1 + self.retries if retry else 1
+        for attempt in range(attempts):
+            if attempt:
+                sleep(0.25 * 2 ** attempt)
+            try:
+                resp = requests.request(method, self.url._replace(path=path).geturl(), timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if attempt == attempts - 1:
+                    raise FacadeRequestError("Error while communicating with the backend.") from e
+                continue
+            # 409: the first attempt is still being processed
+            if resp.status_code not in (409, 502, 503, 504):
+                break
+        return resp
+
+    def _accept(self, return_type: type) -> dict[str, str]:
+        if self.columnar_logs and return_type is responses.LogListResponse:
+            return {'Accept': f'{columnar.media_type}, application/json;q=0.5'}
+        return {}
+
+    @staticmethod
+    def _decode[T](resp: requests.Response, return_type: type[T]) -> T:
+        if resp.status_code != 200:
+            tmp = resp.content.decode('utf-8')
+            raise FacadeOperationalError(status_code=resp.status_code, message=tmp)
+        if resp.headers.get('content-type', '').startswith(columnar.media_type):
+            return columnar.decode_log_list(resp.content)
+        return return_type.model_validate_json(resp.content)
+
     def _send[T](
             self,
             path: str,
             message: messages.BaseMessage,
             return_type: type[T]
     ) -> T:
-        try:
-            resp = requests.post(self.url._replace(path=path).geturl(), data=message.model_dump_json())
-        except requests.exceptions.RequestException as e:
-            raise FacadeRequestError("Error while communicating with the backend.") from e
-        if resp.status_code != 200:
-            tmp = resp.content.decode('utf-8')
-            raise FacadeOperationalError(status_code=resp.status_code, message=tmp)
-        return return_type.model_validate_json(resp.content)
+        retry = getattr(message, 'idempotency_key', None) is not None
+        resp = self._request('POST', path, retry, data=message.model_dump_json(), headers=self._accept(return_type))
+        return self._decode(resp, return_type)
+
+    def _get[T](
+            self,
+            path: str,
+            token: str,
+            query: messages.BaseMessage,
+            return_type: type[T],
+            expiration_minutes: Optional[int] = None
+    ) -> T:
+        # reads extend the token like every other call; the ETag covers the expiration sent back, so a
+        # 304 only comes for a repeat within the same second
+        params = query.model_dump(mode='json', exclude_none=True)
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Token-Expiration-Minutes': str(self._resolve_token_expiration(expiration_minutes)),
+            **self._accept(return_type)
+        }
+        key = (path, token, tuple(sorted(params.items())), headers.get('Accept'))
+        cached = self._etags.pop(key, None)
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+
+        resp = self._request('GET', path, True, params=params, headers=headers)
+        if resp.status_code == 304 and cached is not None:
+            out = cached[1]
+        else:
+            out = self._decode(resp, return_type)
+        if 'ETag' in resp.headers:
+            self._etags[key] = (resp.headers['ETag'], out)
+            while len(self._etags) > self.etag_cache_size:
+                self._etags.pop(next(iter(self._etags)))
+        return out
 
     def register_user(self, user: str, password: str):
         message = messages.UserRegisterMessage(
@@ -135,7 +212,8 @@ class WatchFacade:
                 token=token,
                 expiration_minutes=self._resolve_token_expiration(expiration_minutes)
             ),
-            name=watch_name
+            name=watch_name,
+            idempotency_key=uuid.uuid4().hex
         )
         return self._send(self.watch_add_path, message, responses.WatchEditResponse)
 
@@ -149,7 +227,8 @@ class WatchFacade:
                 token=token,
                 expiration_minutes=self._resolve_token_expiration(expiration_minutes)
             ),
-            name=watch_name
+            name=watch_name,
+            idempotency_key=uuid.uuid4().hex
         )
         return self._send(self.watch_delete_path, message, responses.WatchEditResponse)
 
@@ -159,31 +238,31 @@ class WatchFacade:
                      cycle: int,
                      expiration_minutes: Optional[int] = None
     ) -> responses.LogListResponse:
-        message = messages.SpecifyWatchDataMessage(
-            auth=messages.AuthMessage(
-                token=token,
-                expiration_minutes=self._resolve_token_expiration(expiration_minutes)
-            ),
+        query = messages.WatchDataQuery(
             watch_name=watch_name,
             cycle=cycle
         )
-        return self._send(self.log_list_path, message, responses.LogListResponse)
+        return self._get(self.log_list_path, token, query, responses.LogListResponse, expiration_minutes)
 
     def get_log_fill(self,
                      token: str,
                      watch_name: str,
                      cycle: int,
-                     expiration_minutes: Optional[int] = None
+                     expiration_minutes: Optional[int] = None,
+                     interpolation: messages.Interpolation = messages.Interpolation.linear,
+                     resolution: messages.Resolution = messages.Resolution.daily,
+                     max_points: Optional[int] = None,
+                     downsampling: messages.Downsampling = messages.Downsampling.lttb
     ) -> responses.LogListResponse:
-        message = messages.SpecifyWatchDataMessage(
-            auth=messages.AuthMessage(
-                token=token,
-                expiration_minutes=self._resolve_token_expiration(expiration_minutes)
-            ),
+        query = messages.FillQuery(
             watch_name=watch_name,
-            cycle=cycle
+            cycle=cycle,
+            interpolation=interpolation,
+            resolution=resolution,
+            max_points=max_points,
+            downsampling=downsampling
         )
-        return self._send(self.log_fill_path, message, responses.LogListResponse)
+        return self._get(self.log_fill_path, token, query, responses.LogListResponse, expiration_minutes)
 
     def delete_cycle(self,
                      token: str,
@@ -205,17 +284,89 @@ class WatchFacade:
                       token: str,
                       watch_name: str,
                       cycle: int,
-                      expiration_minutes: Optional[int] = None
+                      expiration_minutes: Optional[int] = None,
+                      interpolation: messages.Interpolation = messages.Interpolation.linear,
+                      exclude_outliers: bool = False
     ) -> responses.StatsResponse:
-        message = messages.SpecifyWatchDataMessage(
+        query = messages.StatsQuery(
+            watch_name=watch_name,
+            cycle=cycle,
+            interpolation=interpolation,
+            exclude_outliers=exclude_outliers
+        )
+        return self._get(self.log_stats_path, token, query, responses.StatsResponse, expiration_minutes)
+
+    def get_log_regression(self,
+                           token: str,
+                           watch_name: str,
+                           cycle: int,
+                           expiration_minutes: Optional[int] = None,
+                           robust: bool = False
+    ) -> responses.RegressionResponse:
+        message = messages.RegressionMessage(
             auth=messages.AuthMessage(
                 token=token,
                 expiration_minutes=self._resolve_token_expiration(expiration_minutes)
             ),
             watch_name=watch_name,
-            cycle=cycle
+            cycle=cycle,
+            robust=robust
+        )
+        return self._send(self.log_regression_path, message, responses.RegressionResponse)
+
+    def get_log_rolling(self,
+                        token: str,
+                        watch_name: str,
+                        cycle: int,
+                        window_days: int = 7,
+                        expiration_minutes: Optional[int] = None
+    ) -> responses.RollingResponse:
+        message = messages.RollingMessage(
+            auth=messages.AuthMessage(
+                token=token,
+                expiration_minutes=self._resolve_token_expiration(expiration_minutes)
+            ),
+            watch_name=watch_name,
+            cycle=cycle,
+            window_days=window_days
         )
-        return self._send(self.log_stats_path, message, responses.StatsResponse)
+        return self._send(self.log_rolling_path, message, responses.RollingResponse)
+
+    def get_segment_stats(self,
+                          token: str,
+                          watch_name: str,
+                          cycle: int,
+                          segments: list[tuple[str, datetime, datetime]],
+                          expiration_minutes: Optional[int] = None
+    ) -> responses.SegmentsResponse:
+        message = messages.SegmentsMessage(
+            auth=messages.AuthMessage(
+                token=token,
+                expiration_minutes=self._resolve_token_expiration(expiration_minutes)
+            ),
+            watch_name=watch_name,
+            cycle=cycle,
+            segments=[messages.SegmentMessage(name=name, start=start, end=end) for name, start, end in segments]
+        )
+        return self._send(self.log_segments_path, message, responses.SegmentsResponse)
+
+    def compare_cycles(self,
+                       token: str,
+                       watch_names: list[str],
+                       cycles: Optional[list[int]] = None,
+                       expiration_minutes: Optional[int] = None,
+                       interpolation: messages.Interpolation = messages.Interpolation.linear
+    ) -> responses.CompareResponse:
+        message = messages.CompareMessage(
+            auth=messages.AuthMessage(
+                token=token,
+                expiration_minutes=self._resolve_token_expiration(expiration_minutes)
+            ),
+            watch_names=watch_names,
+            cycles=cycles,
+            interpolation=interpolation
+        )
+        return self._send(self.log_compare_path, message, responses.CompareResponse)
 
     def delete_log(self,
                    token: str,
@@ -231,7 +382,8 @@ class WatchFacade:
             ),
             watch_name=watch_name,
             cycle=cycle,
-            log_id=log_id
+            log_id=log_id,
+            idempotency_key=uuid.uuid4().hex
         )
         return self._send(self.log_delete_path, message, responses.LoggedInResponse)
 
@@ -251,7 +403,8 @@ class WatchFacade:
             watch_name=watch_name,
             cycle=cycle,
             datetime=time.astimezone(timezone.utc),
-            measure=measure
+            measure=measure,
+            idempotency_key=uuid.uuid4().hex
         )
         return self._send(self.log_add_path, message, responses.LogAddedResponse)
 
@@ -310,6 +463,9 @@ class Manager:
     def _handle_logged_in_response(self, res: responses.LoggedInResponse):
         assert self.user == res.auth.user
         self.expiration = res.auth.expiration_date
+        # servers with signed tokens send a new one whenever it is extended
+        if res.auth.token is not None:
+            self.token = res.auth.token
 
     def add_user(self, name: str, password: str) -> responses.UserCreationResponse:
         return self.facade.register_user(name, password)
@@ -320,8 +476,7 @@ class Manager:
             self.token = ret.token
             self.expiration = ret.expiration_date
         else:
-            ret = self.facade.refresh_user(self.token)
-            self.expiration = ret.auth.expiration_date
+            self._handle_logged_in_response(self.facade.refresh_user(self.token))
 
     def logout(self):
         self._check_login()
@@ -413,10 +568,32 @@ class Manager:
         self._handle_logged_in_response(resp)
         return resp
 
-    def get_log_stats(self) -> responses.StatsResponse:
+    def get_log_stats(self, exclude_outliers: bool = False) -> responses.StatsResponse:
         self._resolve_watch()
         self._check_login()
-        resp = self.facade.get_log_stats(self.token, self.watch, self.cycle)
+        resp = self.facade.get_log_stats(self.token, self.watch, self.cycle, exclude_outliers=exclude_outliers)
+        self._handle_logged_in_response(resp)
+        return resp
+
+    def get_log_regression(self, robust: bool = False) -> responses.RegressionResponse:
+        self._resolve_watch()
+        self._check_login()
+        resp = self.facade.get_log_regression(self.token, self.watch, self.cycle, robust=robust)
+        self._handle_logged_in_response(resp)
+        return resp
+
+    def get_log_rolling(self, window_days: int) -> responses.RollingResponse:
+        self._resolve_watch()
+        self._check_login()
+        resp = self.facade.get_log_rolling(self.token, self.watch, self.cycle, window_days)
+        self._handle_logged_in_response(resp)
+        return resp
+
+    def compare_cycles(self, watch_names: list[str]) -> responses.CompareResponse:
+        if not watch_names:
+            watch_names = [self._resolve_watch()]
+        self._check_login()
+        resp = self.facade.compare_cycles(self.token, watch_names)
         self._handle_logged_in_response(resp)
         return resp
 
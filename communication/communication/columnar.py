@@ -0,0 +1,136 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+from math import isnan
+import struct
+import sys
+
+from .responses import AuthResponse, LogListResponse
+
+# Compact binary alternative to the JSON LogListResponse, chosen with the Accept header.
+# Little-endian, the auth part stays JSON and the logs are stored column by column:
+#   b'WLG1', uint32 length, AuthResponse JSON
+#   uint8 flags, uint32 rows, int64 first time in microseconds since the unix epoch
+#   time offsets from the first time: uint32 seconds, int64 microseconds with MICROSECONDS
+#   int32 log ids with LOG_IDS (-1 for a missing id), float32 measures,
+#   float32 differences (NaN for a missing one), suspect flags packed 8 per byte
+# Measures and differences lose precision past 7 significant digits.
+
+media_type = 'application/vnd.watch.logs'
+
+LOG_IDS = 1
+AWARE = 2
+MICROSECONDS = 4
+
+_magic = b'WLG1'
+_length = struct.Struct('<I')
+_header = struct.Struct('<BIq')
+_epoch = datetime(1970, 1, 1)
+_epoch_utc = _epoch.replace(tzinfo=timezone.utc)
+
+
+def _column(typecode: str, values) -> bytes:
+    out = array(typecode, values)
+    if sys.byteorder != 'little':
+        out.byteswap()
+    return out.tobytes()
+
+
+def _read_column(typecode: str, data: memoryview, offset: int, rows: int) -> tuple[array, int]:
+    out = array(typecode)
+    end = offset + rows * out.itemsize
+    out.frombytes(data[offset:end])
+    if len(out) != rows:
+        raise ValueError("Truncated columnar log list.")
+    if sys.byteorder != 'little':
+        out.byteswap()
+    return out, end
+
+
+def _pack_bits(flags: list[bool]) -> bytes:
+    out = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+# 7 significant digits give the shortest decimal that is read back as the same float32
+_short_format = '{:.7g}'.format
+
+
+def encode_logs(log_ids: list[int | None],
+                times: list[datetime],
+                measures: list[float],
+                differences: list[float | None],
+                suspects: list[bool]) -> bytes:
+    rows = len(times)
+    flags = LOG_IDS if any(log_id is not None for log_id in log_ids) else 0
+    aware = rows > 0 and times[0].tzinfo is not None
+    if aware:
+        flags |= AWARE
+    epoch = _epoch_utc if aware else _epoch
+    micros = [(time - epoch) // timedelta(microseconds=1) for time in times]
+    base = micros[0] if rows else 0
+    offsets = [m - base for m in micros]
+    if any(offset % 1_000_000 for offset in offsets) or (rows and offsets[-1] >= 2 ** 32 * 1_000_000):
+        flags |= MICROSECONDS
+        time_column = _column('q', offsets)
+    else:
+        time_column = _column('I', [offset // 1_000_000 for offset in offsets])
+
+    out = [_header.pack(flags, rows, base), time_column]
+    if flags & LOG_IDS:
+        out.append(_column('i', [-1 if log_id is None else log_id for log_id in log_ids]))
+    out.append(_column('f', measures))
+    out.append(_column('f', [float('nan') if d is None else d for d in differences]))
+    out.append(_pack_bits(suspects))
+    return b''.join(out)
+
+
+def encode_log_list(auth: AuthResponse, logs: bytes) -> bytes:
+    auth_json = auth.model_dump_json().encode()
+    return _magic + _length.pack(len(auth_json)) + auth_json + logs
+
+
+def decode_log_list(data: bytes) -> LogListResponse:
+    view = memoryview(data)
+    if view[:4] != _magic:
+        raise ValueError("Not a columnar log list.")
+    (length,) = _length.unpack_from(view, 4)
+    offset = 8 + length
+    auth = AuthResponse.model_validate_json(bytes(view[8:offset]))
+    flags, rows, base = _header.unpack_from(view, offset)
+    offset += _header.size
+
+    if flags & MICROSECONDS:
+        offsets, offset = _read_column('q', view, offset, rows)
+        step = timedelta(microseconds=1)
+    else:
+        offsets, offset = _read_column('I', view, offset, rows)
+        step = timedelta(seconds=1)
+    start = (_epoch_utc if flags & AWARE else _epoch) + timedelta(microseconds=base)
+    if flags & LOG_IDS:
+        log_ids, offset = _read_column('i', view, offset, rows)
+    else:
+        log_ids = [-1] * rows
+    measures, offset = _read_column('f', view, offset, rows)
+    differences, offset = _read_column('f', view, offset, rows)
+    bits = bytes(view[offset:offset + (rows + 7) // 8])
+    if len(bits) * 8 < rows:
+        raise ValueError("Truncated columnar log list.")
+
+    # column at a time, the rows are only put together for the validation
+    times = map(start.__add__, map(step.__mul__, offsets))
+    measures = map(float, map(_short_format, measures))
+    differences = [None if isnan(d) else float(_short_format(d)) for d in differences]
+    suspects = [bool(bits[i >> 3] >> (i & 7) & 1) for i in range(rows)]
+    logs = [
+        {
+            'log_id': None if log_id < 0 else log_id,
+            'time': time,
+            'measure': measure,
+            'difference': difference,
+            'suspect': suspect
+        } for log_id, time, measure, difference, suspect in zip(log_ids, times, measures, differences, suspects)
+    ]
+    return LogListResponse.model_validate({'auth': auth, 'logs': logs})
@@ -1,4 +1,6 @@
 from datetime import datetime
+from enum import Enum
+from typing import Annotated
 
 from pydantic import BaseModel, Field
 
@@ -7,6 +9,27 @@ class BaseMessage(BaseModel):
     pass
 
 
+# Optional on write requests, a request repeated with the same key gets the first response back
+# without being done again, so clients can retry them safely. The server keeps keys for a day by default.
+IdempotencyKey = Annotated[str | None, Field(pattern=r'^[A-Za-z0-9_-]{16,64}$')]
+
+
+class Interpolation(str, Enum):
+    linear = 'linear'
+    spline = 'spline'
+
+
+class Resolution(str, Enum):
+    hourly = 'hourly'
+    daily = 'daily'
+    weekly = 'weekly'
+
+
+class Downsampling(str, Enum):
+    lttb = 'lttb'
+    minmax = 'minmax'
+
+
 class AuthMessage(BaseMessage):
     token: str
     expiration_minutes: int = Field(..., gt=5)
@@ -27,17 +50,70 @@ class UserLoginMessage(UserRegisterMessage):
 
 class EditWatchMessage(LoggedInUserMessage):
     name: str = Field(..., pattern=r'^[a-zA-Z0-9_ -]{4,32}$')
+    idempotency_key: IdempotencyKey = None
 
 
-class SpecifyWatchDataMessage(LoggedInUserMessage):
+# Query parameters of the GET reads, which take the token in the Authorization header.
+# The POST messages of the same reads are these with the auth part added.
+
+class WatchDataQuery(BaseMessage):
     watch_name: str = Field(..., pattern=r'^[a-zA-Z0-9_ -]{4,32}$')
     cycle: int = Field(..., gt=-1)
+    interpolation: Interpolation = Interpolation.linear
+
+
+class FillQuery(WatchDataQuery):
+    resolution: Resolution = Resolution.daily
+    max_points: int | None = Field(None, gt=3)
+    downsampling: Downsampling = Downsampling.lttb
+
+
+class StatsQuery(WatchDataQuery):
+    exclude_outliers: bool = False
+
+
+class SpecifyWatchDataMessage(LoggedInUserMessage, WatchDataQuery):
+    pass
+
+
+class FillMessage(SpecifyWatchDataMessage, FillQuery):
+    pass
+
+
+class StatsMessage(SpecifyWatchDataMessage, StatsQuery):
+    pass
+
+
+class RegressionMessage(SpecifyWatchDataMessage):
+    robust: bool = False
+
+
+class CompareMessage(LoggedInUserMessage):
+    watch_names: list[str] = Field(..., min_length=1, max_length=32)
+    cycles: list[int] | None = Field(None, max_length=256)
+    interpolation: Interpolation = Interpolation.linear
+
+
+class RollingMessage(SpecifyWatchDataMessage):
+    window_days: int = Field(7, ge=2, le=366)
+
+
+class SegmentMessage(BaseMessage):
+    name: str = Field(..., max_length=64)
+    start: datetime
+    end: datetime
+
+
+class SegmentsMessage(SpecifyWatchDataMessage):
+    segments: list[SegmentMessage] = Field(..., min_length=1, max_length=256)
 
 
 class SpecifyLogDataMessage(SpecifyWatchDataMessage):
     log_id: int = Field(..., gt=-1)
+    idempotency_key: IdempotencyKey = None
 
 
 class CreateMeasurementMessage(SpecifyWatchDataMessage):
     datetime: datetime
     measure: float
+    idempotency_key: IdempotencyKey = None
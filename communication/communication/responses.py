@@ -10,6 +10,8 @@ class BaseResponse(BaseModel):
 class AuthResponse(BaseResponse):
     user: str
     expiration_date: datetime
+    # set when the server uses signed tokens, the token to use from now on
+    token: str | None = None
 
 
 class LoggedInResponse(BaseResponse):
@@ -50,7 +52,9 @@ class LogResponse(BaseResponse):
     log_id: int | None
     time: datetime
     measure: float
+    # from the previous log in log lists, per day in fills whatever their resolution
     difference: float | None
+    suspect: bool = False
 
 
 class LogListResponse(LoggedInResponse):
@@ -62,6 +66,59 @@ class StatsResponse(LoggedInResponse):
     deviation: float | None
     delta: float | None
 
+
+class RegressionResponse(LoggedInResponse):
+    count: int
+    rate: float | None
+    rate_low: float | None
+    rate_high: float | None
+    r_squared: float | None
+    residual_deviation: float | None
+    residual_max: float | None
+    robust_rate: float | None
+
+
+class CycleStatsResponse(BaseResponse):
+    watch_name: str
+    cycle: int
+    count: int
+    start: datetime
+    end: datetime
+    average: float | None
+    deviation: float | None
+    delta: float | None
+    rate: float | None
+
+
+class CompareResponse(LoggedInResponse):
+    cycles: list[CycleStatsResponse]
+
+
+class RollingStatsResponse(BaseResponse):
+    time: datetime
+    average: float
+    deviation: float
+
+
+class RollingResponse(LoggedInResponse):
+    window_days: int
+    stats: list[RollingStatsResponse]
+
+
+class SegmentStatsResponse(BaseResponse):
+    name: str
+    start: datetime
+    end: datetime
+    days: int
+    average: float | None
+    deviation: float | None
+    delta: float | None
+
+
+class SegmentsResponse(LoggedInResponse):
+    segments: list[SegmentStatsResponse]
+
+
 class LogAddedResponse(LoggedInResponse):
     log_id: int
     time: datetime